@@ -0,0 +1,81 @@
+"""
+This script compares the time and size of cloning a feedstock with each of
+the clone strategies used by the action. To use it run
+
+    python tests/run_clone_benchmark.py --repo conda-forge/conda-smithy-feedstock
+
+The script clones the default branch of the repo once per strategy per
+repetition and reports the wall-clock time and the size of the `.git`
+directory in the checkout. The first strategy, `full`, is the old behavior.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from webservices_dispatch_action.git_utils import CLONE_STRATEGIES, clone_feedstock
+
+
+def _dir_size(path):
+    tot = 0
+    for root, _, files in os.walk(path):
+        for fname in files:
+            fpath = os.path.join(root, fname)
+            if not os.path.islink(fpath):
+                tot += os.path.getsize(fpath)
+    return tot
+
+
+def _run_benchmark(repo, branch, strategies, num):
+    repo_url = f"https://github.com/{repo}.git"
+    results = {}
+    for strategy in strategies:
+        times = []
+        sizes = []
+        for _ in range(num):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                t0 = time.perf_counter()
+                git_repo = clone_feedstock(
+                    repo_url,
+                    os.path.join(tmpdir, "feedstock"),
+                    branch,
+                    strategy=strategy,
+                )
+                times.append(time.perf_counter() - t0)
+                sizes.append(_dir_size(git_repo.git_dir))
+        results[strategy] = (min(times), max(sizes))
+        print(
+            f"{strategy:>10s}: {min(times):8.2f} s, {max(sizes) / 1e6:10.2f} MB",
+            flush=True,
+        )
+
+    if "full" in results:
+        t_full, s_full = results["full"]
+        for strategy, (t, s) in results.items():
+            if strategy == "full":
+                continue
+            print(
+                f"{strategy:>10s} vs full: {t_full / t:6.2f}x faster, "
+                f"{s_full / max(s, 1):6.2f}x smaller",
+                flush=True,
+            )
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--repo",
+    default="conda-forge/cf-autotick-bot-test-package-feedstock",
+    help="the repo to clone",
+)
+parser.add_argument("--branch", default="main", help="the branch to clone")
+parser.add_argument(
+    "--strategy",
+    action="append",
+    choices=CLONE_STRATEGIES,
+    help="the strategies to benchmark (default is all of them)",
+)
+parser.add_argument("-n", type=int, default=3, help="the number of repetitions")
+args = parser.parse_args()
+
+_run_benchmark(args.repo, args.branch, args.strategy or CLONE_STRATEGIES, args.n)
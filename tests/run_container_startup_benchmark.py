@@ -0,0 +1,57 @@
+"""
+This script compares the time it takes to start the webservices image with
+
+ - activated: a login shell that runs `conda activate` (the old entrypoint)
+ - baked: the entrypoint, which sources the env saved when the image was built
+
+To use it, make sure the image is available locally, e.g.
+
+    docker build -t condaforge/webservices-dispatch-action:dev .
+
+and then run
+
+    python tests/run_container_startup_benchmark.py
+"""
+
+import argparse
+import subprocess
+import time
+
+
+def _best_start_time(args, num):
+    times = []
+    for _ in range(num):
+        t0 = time.perf_counter()
+        subprocess.run(["docker", "run", "--rm", *args], check=True)
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--image",
+    default="condaforge/webservices-dispatch-action:dev",
+    help="the image to start",
+)
+parser.add_argument("-n", type=int, default=5, help="the number of repetitions")
+args = parser.parse_args()
+
+results = {}
+results["activated"] = _best_start_time(
+    [
+        "--entrypoint",
+        "/bin/bash",
+        args.image,
+        "-lc",
+        "conda activate $CF_FEEDSTOCK_OPS_ENV && true",
+    ],
+    args.n,
+)
+results["baked"] = _best_start_time([args.image, "true"], args.n)
+
+for mode, dt in results.items():
+    print(
+        f"{mode:>10s}: best of {args.n} {dt:8.2f} s "
+        f"({results['activated'] / dt:0.2f}x vs activated)",
+        flush=True,
+    )
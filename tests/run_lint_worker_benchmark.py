@@ -0,0 +1,92 @@
+"""
+This script compares the time it takes to lint a feedstock with
+
+ - container: `lint_feedstock(..., use_container=True)` (the old path)
+ - cold: `lint_feedstock(..., use_container=False)` in a new interpreter
+ - warm: `lint_feedstock(..., use_container=False)` in a child forked from
+   a warm fork server w/ the linter stack already imported
+
+To use it, make sure the image is available locally for the container path,
+e.g.
+
+    docker build -t condaforge/webservices-dispatch-action:dev .
+
+and then run
+
+    python tests/run_lint_worker_benchmark.py \
+        --repo conda-forge/cf-autotick-bot-test-package-feedstock
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from conda_forge_feedstock_ops.lint import lint as lint_feedstock
+
+from webservices_dispatch_action.git_utils import clone_feedstock
+from webservices_dispatch_action.lint_worker import WarmWorkerPool
+
+
+def _time(func, num):
+    times = []
+    for _ in range(num):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def _cold(feedstock_dir):
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; "
+            "from conda_forge_feedstock_ops.lint import lint; "
+            "lint(sys.argv[1], use_container=False)",
+            feedstock_dir,
+        ],
+        check=True,
+        capture_output=True,
+    )
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--repo",
+    default="conda-forge/cf-autotick-bot-test-package-feedstock",
+    help="the feedstock repo to lint",
+)
+parser.add_argument("--branch", default="main", help="the branch to lint")
+parser.add_argument("-n", type=int, default=5, help="the number of repetitions")
+args = parser.parse_args()
+
+os.environ.setdefault(
+    "CF_FEEDSTOCK_OPS_CONTAINER_NAME", "condaforge/webservices-dispatch-action"
+)
+os.environ.setdefault("CF_FEEDSTOCK_OPS_CONTAINER_TAG", "dev")
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    feedstock_dir = os.path.join(tmpdir, "feedstock")
+    clone_feedstock(f"https://github.com/{args.repo}.git", feedstock_dir, args.branch)
+
+    results = {}
+    results["container"] = _time(
+        lambda: lint_feedstock(feedstock_dir, use_container=True), args.n
+    )
+    results["cold"] = _time(lambda: _cold(feedstock_dir), args.n)
+    with WarmWorkerPool() as pool:
+        pool.warm_up()
+        # the first lint waits for the fork server to finish its imports
+        pool.lint(feedstock_dir)
+        results["warm"] = _time(lambda: pool.lint(feedstock_dir), args.n)
+
+for mode, dt in results.items():
+    print(
+        f"{mode:>10s}: best of {args.n} {dt:8.2f} s "
+        f"({results['container'] / dt:0.2f}x vs container)",
+        flush=True,
+    )
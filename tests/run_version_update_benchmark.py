@@ -0,0 +1,100 @@
+"""
+This script compares the time it takes to update the version of a feedstock
+recipe with
+
+ - per-call: a new container for each step (the old flow)
+ - session: one container session w/ one `docker exec` per step
+ - single-job: one container session w/ the whole update as one `docker exec`
+
+To use it, make sure the image is available locally, e.g.
+
+    docker build -t condaforge/webservices-dispatch-action:dev .
+
+and then run
+
+    python tests/run_version_update_benchmark.py \
+        --repo conda-forge/cf-autotick-bot-test-package-feedstock --version 0.14
+
+The recipe changes are never committed or pushed.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from webservices_dispatch_action.docker_utils import ContainerSession
+from webservices_dispatch_action.git_utils import clone_feedstock
+from webservices_dispatch_action.version_updater import update_version_recipe
+
+MODES = ("per-call", "session", "single-job")
+
+
+def _run_once(mode, repo, version):
+    name = os.path.basename(repo).rsplit("-", 1)[0]
+    image = (
+        f"{os.environ['CF_FEEDSTOCK_OPS_CONTAINER_NAME']}:"
+        f"{os.environ['CF_FEEDSTOCK_OPS_CONTAINER_TAG']}"
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        git_repo = clone_feedstock(
+            f"https://github.com/{repo}.git",
+            os.path.join(tmpdir, "feedstock"),
+            "main",
+        )
+        with ContainerSession(image, tmpdir) as session:
+            t0 = time.perf_counter()
+            if mode == "per-call":
+                ret = update_version_recipe(
+                    git_repo.working_dir, name, input_version=version
+                )
+            elif mode == "session":
+                ret = update_version_recipe(
+                    git_repo.working_dir, name, input_version=version, session=session
+                )
+            else:
+                ret = session.run_op(
+                    "update_version",
+                    {
+                        "feedstock_dir": session.container_path(git_repo.working_dir),
+                        "name": name,
+                        "input_version": version,
+                    },
+                )
+            return time.perf_counter() - t0, tuple(ret)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--repo",
+    default="conda-forge/cf-autotick-bot-test-package-feedstock",
+    help="the feedstock repo to update",
+)
+parser.add_argument(
+    "--version",
+    default=None,
+    help="the version to update to (default is the latest version)",
+)
+parser.add_argument("-n", type=int, default=3, help="the number of repetitions")
+args = parser.parse_args()
+
+os.environ.setdefault(
+    "CF_FEEDSTOCK_OPS_CONTAINER_NAME", "condaforge/webservices-dispatch-action"
+)
+os.environ.setdefault("CF_FEEDSTOCK_OPS_CONTAINER_TAG", "dev")
+
+results = {}
+for mode in MODES:
+    times = []
+    for _ in range(args.n):
+        dt, ret = _run_once(mode, args.repo, args.version)
+        times.append(dt)
+        print(f"{mode:>10s}: {dt:8.2f} s -> {ret}", flush=True)
+    results[mode] = min(times)
+
+for mode in MODES:
+    print(
+        f"{mode:>10s}: best of {args.n} {results[mode]:8.2f} s "
+        f"({results['per-call'] / results[mode]:0.2f}x vs per-call)",
+        flush=True,
+    )
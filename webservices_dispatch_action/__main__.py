@@ -1,29 +1,65 @@
+import contextlib
+import importlib.metadata
 import json
 import logging
 import os
 import pprint
-import subprocess
 import sys
 import tempfile
 import textwrap
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 from conda_forge_feedstock_ops.lint import lint as lint_feedstock
-from git import Repo
 
 import webservices_dispatch_action
 from webservices_dispatch_action.api_sessions import (
     create_api_sessions,
     get_actor_token,
+    install_pooled_transport,
 )
+from webservices_dispatch_action.docker_utils import (
+    ContainerSession,
+    SubprocessSession,
+    get_local_image_digests,
+    get_local_image_size,
+    pull_image,
+    running_in_container,
+    should_use_container,
+)
+from webservices_dispatch_action.env_management import (
+    SECRETS_FILE_ENV_VAR,
+    make_process_undumpable,
+)
+from webservices_dispatch_action.git_utils import (
+    clone_feedstock,
+    copy_recipes_subset,
+    disable_sparse_checkout,
+    get_recipe_trees,
+    get_sparse_excluded_dirs,
+    is_sparse,
+)
+from webservices_dispatch_action.identity_map import RUN_IDENTITY_MAP
+from webservices_dispatch_action.lint_cache import get_lint_cache
+from webservices_dispatch_action.lint_worker import WarmWorkerPool, get_lint_jobs
 from webservices_dispatch_action.linter import (
+    LINT_INPUT_DIRS,
+    REUSABLE_LINT_STATUSES,
+    _is_lint_comment,
+    _is_mergeable,
     build_and_make_lint_comment,
+    get_lint_fingerprint,
+    get_previous_lint,
+    get_recipe_dirs_to_lint,
     make_lint_comment,
     set_pr_status,
 )
+from webservices_dispatch_action.pr_snapshot import fetch_pr_snapshot
 from webservices_dispatch_action.rerendering import (
     rerender,
 )
+from webservices_dispatch_action.stages import StageGraph
 from webservices_dispatch_action.utils import (
     comment_and_push_if_changed,
     flush_logger,
@@ -31,33 +67,272 @@ from webservices_dispatch_action.utils import (
     mark_pr_as_ready_for_review,
 )
 from webservices_dispatch_action.version_updater import update_pr_title, update_version
+from webservices_dispatch_action.write_buffer import GitHubWriteBuffer
 
 LOGGER = logging.getLogger(__name__)
 
+# the image used for the containerized operations and the tag suffix of the
+# variant for each dispatch action
+CONTAINER_IMAGE_NAME = "condaforge/webservices-dispatch-action"
+CONTAINER_IMAGE_VARIANTS = {
+    "lint": "-lint",
+    "rerender": "",
+    "version_update": "",
+}
+
+
+def _set_container_image(action):
+    """Select the image for a dispatch action.
+
+    The image name and tag are exported as `CF_FEEDSTOCK_OPS_CONTAINER_NAME`
+    and `CF_FEEDSTOCK_OPS_CONTAINER_TAG` since conda-forge-feedstock-ops
+    reads them to run its containers.
+    """
+    base_tag = "prod" if os.environ.get("GHA_REF", "") == "main" else "dev"
+    os.environ["CF_FEEDSTOCK_OPS_CONTAINER_NAME"] = CONTAINER_IMAGE_NAME
+    os.environ["CF_FEEDSTOCK_OPS_CONTAINER_TAG"] = base_tag + (
+        CONTAINER_IMAGE_VARIANTS.get(action, "")
+    )
+    LOGGER.info("using container image %s for %s", _get_container_image(), action)
+
+
+def _get_container_image():
+    return (
+        f"{os.environ['CF_FEEDSTOCK_OPS_CONTAINER_NAME']}:"
+        f"{os.environ['CF_FEEDSTOCK_OPS_CONTAINER_TAG']}"
+    )
+
+
+def _get_linter_version():
+    """Get a version string for the linter used in this run or None if it
+    cannot be determined."""
+    if should_use_container():
+        digests = get_local_image_digests(_get_container_image())
+        if not digests:
+            return None
+        return "image " + ",".join(sorted(digests))
+
+    try:
+        return "conda-smithy " + importlib.metadata.version("conda-smithy")
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def _get_reusable_lint(git_repo, comment):
+    """Get the lint fingerprint of a checkout and the status of the previous
+    lint if it had the same fingerprint."""
+    linter_version = _get_linter_version()
+    if linter_version is None:
+        return None, None
+
+    fingerprint = get_lint_fingerprint(git_repo, linter_version)
+    prev_fingerprint, prev_status = get_previous_lint(comment)
+    if prev_fingerprint == fingerprint and prev_status in REUSABLE_LINT_STATUSES:
+        LOGGER.info(
+            "the lint inputs did not change, reusing the previous lint (%s)",
+            prev_status,
+        )
+        return fingerprint, prev_status
+    return fingerprint, None
+
+
+def _make_container_session(workspace_dir):
+    if running_in_container():
+        # recipe code never runs in this process since it holds the tokens
+        return SubprocessSession(workspace_dir)
+    elif os.environ.get("CF_WEBSERVICES_CONTAINER_SESSION", "true") == "true":
+        return ContainerSession(_get_container_image(), workspace_dir)
+    else:
+        return contextlib.nullcontext()
+
+
+def _make_lint_worker():
+    # linting in warm workers is only safe inside of the container, where the
+    # tokens are never in the environment and this process is not dumpable
+    if (
+        not should_use_container()
+        and os.environ.get("CF_WEBSERVICES_LINT_WORKER", "true") == "true"
+    ):
+        return WarmWorkerPool(max_workers=get_lint_jobs())
+    else:
+        return contextlib.nullcontext()
+
 
 def _pull_docker_image():
+    if not should_use_container():
+        LOGGER.info("running in the container, skipping the docker image pull")
+        return
+
     try:
         print("::group::docker image pull", flush=True)
-        subprocess.run(
-            [
-                "docker",
-                "pull",
-                f"{os.environ['CF_FEEDSTOCK_OPS_CONTAINER_NAME']}:{os.environ['CF_FEEDSTOCK_OPS_CONTAINER_TAG']}",
-            ],
-        )
+        image = _get_container_image()
+        pull_image(image)
+        size = get_local_image_size(image)
+        if size is not None:
+            LOGGER.info("docker image %s size: %0.1f MB", image, size / 1e6)
         sys.stderr.flush()
         sys.stdout.flush()
     finally:
         print("::endgroup::", flush=True)
 
 
-def _do_rerender(git_repo, pr_branch, pr_owner, pr_repo, repo_name, pr):
+def _lint_dir(feedstock_dir, lint_worker=None):
+    if lint_worker is not None:
+        return lint_worker.lint(feedstock_dir)
+    if running_in_container():
+        # recipe code never runs in this process since it holds the tokens
+        with SubprocessSession(os.path.dirname(feedstock_dir)) as session:
+            ret = session.run_op(
+                "lint", {"feedstock_dir": session.container_path(feedstock_dir)}
+            )
+        return ret["lints"], ret["hints"]
+    return lint_feedstock(feedstock_dir, use_container=should_use_container())
+
+
+def _lint_recipes_in_parallel(git_repo, recipe_dirs, lint_worker=None):
+    """Lint each recipe in its own copy of the checkout w/ at most
+    `get_lint_jobs()` recipes at once, returning `{recipe_dir: (lints, hints)}`."""
+    if not recipe_dirs:
+        return {}
+
+    t0 = time.perf_counter()
+    num_jobs = min(get_lint_jobs(), len(recipe_dirs))
+    with tempfile.TemporaryDirectory() as tmpdir:
+
+        def _lint_one(i, recipe_dir):
+            subset_dir = copy_recipes_subset(
+                git_repo,
+                [recipe_dir],
+                os.path.join(tmpdir, str(i), os.path.basename(git_repo.working_dir)),
+            )
+            return _lint_dir(subset_dir, lint_worker=lint_worker)
+
+        with ThreadPoolExecutor(max_workers=num_jobs) as executor:
+            results = list(
+                executor.map(_lint_one, range(len(recipe_dirs)), recipe_dirs)
+            )
+
+    LOGGER.info(
+        "linted %d recipes w/ %d jobs in %0.2f seconds",
+        len(recipe_dirs),
+        num_jobs,
+        time.perf_counter() - t0,
+    )
+    return dict(zip(recipe_dirs, results))
+
+
+def _lint_recipes(git_repo, recipe_dirs, lint_worker=None):
+    """Lint only the given recipes of a staged-recipes checkout in parallel
+    w/ the results of unchanged recipes taken from the lint cache, if any."""
+    recipe_trees = get_recipe_trees(git_repo)
+    if not recipe_trees:
+        return _lint_dir(git_repo.working_dir, lint_worker=lint_worker)
+
+    LOGGER.info(
+        "linting %d of %d recipes changed in the PR: %s",
+        len(recipe_dirs),
+        len(recipe_trees),
+        recipe_dirs,
+    )
+    recipe_trees = {
+        recipe_dir: tree_oid
+        for recipe_dir, tree_oid in recipe_trees.items()
+        if recipe_dir in recipe_dirs
+    }
+
+    cache = get_lint_cache(_get_linter_version())
+    results = {}
+    to_lint = []
+    for recipe_dir, tree_oid in sorted(recipe_trees.items()):
+        cached = cache.get(recipe_dir, tree_oid) if cache is not None else None
+        if cached is None:
+            to_lint.append(recipe_dir)
+        else:
+            results[recipe_dir] = cached
+
+    for recipe_dir, (_lints, _hints) in _lint_recipes_in_parallel(
+        git_repo, to_lint, lint_worker=lint_worker
+    ).items():
+        results[recipe_dir] = (_lints, _hints)
+        if cache is not None:
+            cache.put(recipe_dir, recipe_trees[recipe_dir], _lints, _hints)
+
+    if cache is not None:
+        LOGGER.info(
+            "linted %d of %d recipes, the rest came from the lint cache",
+            len(to_lint),
+            len(recipe_trees),
+        )
+        cache.log_stats()
+
+    lints = {}
+    hints = {}
+    for recipe_dir in sorted(results):
+        lints.update(results[recipe_dir][0])
+        hints.update(results[recipe_dir][1])
+    return lints, hints
+
+
+def _lint_feedstock(git_repo, lint_worker=None, recipe_dirs=None):
+    if recipe_dirs is not None:
+        return _lint_recipes(git_repo, recipe_dirs, lint_worker=lint_worker)
+    return _lint_dir(git_repo.working_dir, lint_worker=lint_worker)
+
+
+def _try_lint_sparse(git_repo, lint_worker=None, recipe_dirs=None):
+    """Lint a checkout, returning `(results, error)`. If the checkout is
+    sparse, a failure is returned instead of raised since the linter may have
+    needed files outside of it."""
+    try:
+        return _lint_feedstock(
+            git_repo, lint_worker=lint_worker, recipe_dirs=recipe_dirs
+        ), None
+    except Exception as err:
+        if not is_sparse(git_repo):
+            raise
+        return None, err
+
+
+def _lint_full_if_sparse_failed(
+    git_repo, sparse_lint, lint_worker=None, recipe_dirs=None
+):
+    """Lint a full checkout if linting the sparse checkout failed.
+
+    This changes the checkout, so nothing else (e.g., `check_mergeable`) may
+    use the repo at the same time.
+    """
+    results, err = sparse_lint
+    if err is None:
+        return results
+
+    LOGGER.warning(
+        "linting the sparse checkout w/o %s failed w/ %s, retrying w/ a full "
+        "checkout",
+        get_sparse_excluded_dirs(git_repo),
+        repr(err),
+    )
+    disable_sparse_checkout(git_repo)
+    return _lint_feedstock(git_repo, lint_worker=lint_worker, recipe_dirs=recipe_dirs)
+
+
+def _do_rerender(
+    git_repo,
+    pr_branch,
+    pr_owner,
+    pr_repo,
+    repo_name,
+    pr,
+    container_session=None,
+    write_buffer=None,
+):
     # rerender
     _, _, can_change_workflows = get_actor_token()
     can_change_workflows = (
         can_change_workflows or os.environ["HAS_SSH_PRIVATE_KEY"] == "true"
     )
-    changed, rerender_error, info_message = rerender(git_repo, can_change_workflows)
+    changed, rerender_error, info_message = rerender(
+        git_repo, can_change_workflows, session=container_session
+    )
 
     # comment
     more_info_message = """\
@@ -94,6 +369,7 @@ GitHub accounts.
             "#rerendering-with-conda-smithy-locally"
         ),
         info_message=info_message,
+        write_buffer=write_buffer,
     )
 
     if rerender_error or push_error:
@@ -109,10 +385,18 @@ GitHub accounts.
 def main():
     logging.basicConfig(level=logging.INFO)
 
+    secrets_file = os.environ.pop(SECRETS_FILE_ENV_VAR, "")
+    if secrets_file:
+        webservices_dispatch_action.global_sensitive_env.load_secrets_file(secrets_file)
+    if running_in_container() and not make_process_undumpable():
+        LOGGER.warning("could not protect the tokens in memory from other processes")
+
     LOGGER.info("making API clients")
+    install_pooled_transport()
 
     with webservices_dispatch_action.sensitive_env():
-        _, gh = create_api_sessions(os.environ["INPUT_GITHUB_TOKEN"])
+        github_token = os.environ["INPUT_GITHUB_TOKEN"]
+        _, gh = create_api_sessions(github_token)
 
     with open(os.environ["GITHUB_EVENT_PATH"], "r") as fp:
         event_data = json.load(fp)
@@ -129,17 +413,27 @@ def main():
     print("::endgroup::", flush=True)
 
     if event_name in ["repository_dispatch"]:
+        _set_container_image(event_data["action"])
+
         if event_data["action"] == "rerender":
             pr_num = int(event_data["client_payload"]["pr"])
             repo_name = event_data["repository"]["full_name"]
 
-            gh_repo = gh.get_repo(repo_name)
-            pr = gh_repo.get_pull(pr_num)
+            gh_repo = RUN_IDENTITY_MAP.get_repo(gh, repo_name)
+            pr = RUN_IDENTITY_MAP.get_pull(
+                gh_repo,
+                pr_num,
+                fetch=lambda: fetch_pr_snapshot(gh_repo, pr_num, github_token),
+            )
 
             if pr.state == "closed":
                 raise ValueError("Closed PRs cannot be rerendered!")
 
-            with tempfile.TemporaryDirectory() as tmpdir:
+            # the comments and PR edits are sent together at the end
+            with (
+                tempfile.TemporaryDirectory() as tmpdir,
+                GitHubWriteBuffer(github_token) as write_buffer,
+            ):
                 # clone the head repo
                 pr_branch = pr.head.ref
                 pr_owner = pr.head.repo.owner.login
@@ -152,32 +446,63 @@ def main():
                     tmpdir,
                     pr_repo,
                 )
-                git_repo = Repo.clone_from(
-                    repo_url,
-                    feedstock_dir,
-                    branch=pr_branch,
+                graph = StageGraph()
+                graph.add(
+                    "clone",
+                    lambda: clone_feedstock(
+                        repo_url,
+                        feedstock_dir,
+                        pr_branch,
+                        reference_repo=repo_name,
+                        fork_repos=[f"{pr_owner}/{pr_repo}"],
+                    ),
                 )
+                graph.add("docker pull", _pull_docker_image)
+                try:
+                    git_repo = graph.run()["clone"]
+                except Exception:
+                    # make sure the clone is done before its directory is
+                    # cleaned up
+                    graph.wait_for()
+                    raise
 
                 # rerender
-                _pull_docker_image()
-                _do_rerender(git_repo, pr_branch, pr_owner, pr_repo, repo_name, pr)
+                _do_rerender(
+                    git_repo,
+                    pr_branch,
+                    pr_owner,
+                    pr_repo,
+                    repo_name,
+                    pr,
+                    write_buffer=write_buffer,
+                )
 
                 # if the pr was made by the bot, mark it as ready for review
                 if pr.title == "MNT: rerender" and pr.user.login == "conda-forge-admin":
-                    mark_pr_as_ready_for_review(pr)
+                    mark_pr_as_ready_for_review(pr, write_buffer=write_buffer)
 
         elif event_data["action"] == "version_update":
             pr_num = int(event_data["client_payload"]["pr"])
             repo_name = event_data["repository"]["full_name"]
             input_version = event_data["client_payload"].get("input_version", None)
 
-            gh_repo = gh.get_repo(repo_name)
-            pr = gh_repo.get_pull(pr_num)
+            gh_repo = RUN_IDENTITY_MAP.get_repo(gh, repo_name)
+            pr = RUN_IDENTITY_MAP.get_pull(
+                gh_repo,
+                pr_num,
+                fetch=lambda: fetch_pr_snapshot(gh_repo, pr_num, github_token),
+            )
 
             if pr.state == "closed":
                 raise ValueError("Closed PRs cannot have their version updated!")
 
-            with tempfile.TemporaryDirectory() as tmpdir:
+            # all of the container operations run in one container session
+            # and the comments and PR edits are sent together at the end
+            with (
+                tempfile.TemporaryDirectory() as tmpdir,
+                _make_container_session(tmpdir) as container_session,
+                GitHubWriteBuffer(github_token) as write_buffer,
+            ):
                 # clone the head repo
                 pr_branch = pr.head.ref
                 pr_owner = pr.head.repo.owner.login
@@ -190,11 +515,25 @@ def main():
                     tmpdir,
                     pr_repo,
                 )
-                git_repo = Repo.clone_from(
-                    repo_url,
-                    feedstock_dir,
-                    branch=pr_branch,
+                graph = StageGraph()
+                graph.add(
+                    "clone",
+                    lambda: clone_feedstock(
+                        repo_url,
+                        feedstock_dir,
+                        pr_branch,
+                        reference_repo=repo_name,
+                        fork_repos=[f"{pr_owner}/{pr_repo}"],
+                    ),
                 )
+                graph.add("docker pull", _pull_docker_image)
+                try:
+                    git_repo = graph.run()["clone"]
+                except Exception:
+                    # make sure the clone is done before its directory is
+                    # cleaned up
+                    graph.wait_for()
+                    raise
 
                 _, _, can_change_workflows = get_actor_token()
                 can_change_workflows = (
@@ -202,14 +541,16 @@ def main():
                 )
 
                 # update version
-                _pull_docker_image()
                 LOGGER.info(
                     "Running version update for %s with input_version %s",
                     repo_name,
                     input_version,
                 )
                 version_changed, version_error, found_version = update_version(
-                    git_repo, repo_name, input_version=input_version
+                    git_repo,
+                    repo_name,
+                    input_version=input_version,
+                    session=container_session,
                 )
 
                 version_push_error = comment_and_push_if_changed(
@@ -225,6 +566,7 @@ def main():
                     close_pr_if_no_changes_or_errors=True,
                     help_message="",
                     info_message="",
+                    write_buffer=write_buffer,
                 )
 
                 if version_error or version_push_error:
@@ -238,7 +580,16 @@ def main():
                     )
 
                 if version_changed:
-                    _do_rerender(git_repo, pr_branch, pr_owner, pr_repo, repo_name, pr)
+                    _do_rerender(
+                        git_repo,
+                        pr_branch,
+                        pr_owner,
+                        pr_repo,
+                        repo_name,
+                        pr,
+                        container_session=container_session,
+                        write_buffer=write_buffer,
+                    )
 
                     if found_version:
                         LOGGER.info(
@@ -247,22 +598,31 @@ def main():
                             pr_num,
                             found_version,
                         )
-                        update_pr_title(repo_name, pr_num, found_version)
+                        update_pr_title(
+                            repo_name, pr_num, found_version, write_buffer=write_buffer
+                        )
 
                     # these PRs always get marked as ready for review
-                    mark_pr_as_ready_for_review(pr)
+                    mark_pr_as_ready_for_review(pr, write_buffer=write_buffer)
 
         elif event_data["action"] == "lint":
             pr_num = int(event_data["client_payload"]["pr"])
             repo_name = event_data["repository"]["full_name"]
 
-            gh_repo = gh.get_repo(repo_name)
-            pr = gh_repo.get_pull(pr_num)
+            gh_repo = RUN_IDENTITY_MAP.get_repo(gh, repo_name)
+            pr = RUN_IDENTITY_MAP.get_pull(
+                gh_repo,
+                pr_num,
+                fetch=lambda: fetch_pr_snapshot(gh_repo, pr_num, github_token),
+            )
 
             if pr.state == "closed":
                 raise ValueError("Closed PRs are not linted!")
 
-            with tempfile.TemporaryDirectory() as tmpdir:
+            with (
+                tempfile.TemporaryDirectory() as tmpdir,
+                _make_lint_worker() as lint_worker,
+            ):
                 # clone the head repo
                 pr_branch = pr.head.ref
                 pr_owner = pr.head.repo.owner.login
@@ -275,18 +635,123 @@ def main():
                     tmpdir,
                     pr_repo,
                 )
-                git_repo = Repo.clone_from(
-                    repo_url,
-                    feedstock_dir,
-                    branch=pr_branch,
+                # on staged-recipes only the recipes changed in the PR are linted
+                recipe_dirs = (
+                    get_recipe_dirs_to_lint(pr)
+                    if gh_repo.name == "staged-recipes"
+                    else None
+                )
+
+                # the clone, image pull and pending status are independent
+                # and we check mergeability in the clone while the linter runs
+                graph = StageGraph()
+                graph.add(
+                    "clone",
+                    lambda: clone_feedstock(
+                        repo_url,
+                        feedstock_dir,
+                        pr_branch,
+                        reference_repo=repo_name,
+                        fork_repos=[f"{pr_owner}/{pr_repo}"],
+                        sparse_paths=LINT_INPUT_DIRS,
+                    ),
+                )
+                graph.add(
+                    "pending status",
+                    lambda: set_pr_status(
+                        pr.base.repo,
+                        pr.head.sha,
+                        "pending",
+                        target_url=None,
+                        snapshot=pr,
+                    ),
+                )
+                graph.add("docker pull", _pull_docker_image)
+                # find our previous comment while the linter runs so that
+                # posting the new one does not wait on a comment scan
+                graph.add(
+                    "lint comment",
+                    lambda: pr.find_comment(
+                        _is_lint_comment, status_context="conda-forge-linter"
+                    ),
+                )
+                graph.add(
+                    "lint worker",
+                    lambda: lint_worker.warm_up() if lint_worker is not None else None,
+                )
+                # the linter is skipped if the recipe and linter are the same
+                # as for the previous lint
+                graph.add(
+                    "fingerprint",
+                    lambda git_repo, comment, _: _get_reusable_lint(git_repo, comment),
+                    deps=["clone", "lint comment", "docker pull"],
+                )
+                graph.add(
+                    "sparse lint",
+                    lambda git_repo, _status, _pull, _worker, reusable: (
+                        _try_lint_sparse(
+                            git_repo,
+                            lint_worker=lint_worker,
+                            recipe_dirs=recipe_dirs,
+                        )
+                        if reusable[1] is None
+                        else (None, None)
+                    ),
+                    deps=[
+                        "clone",
+                        "pending status",
+                        "docker pull",
+                        "lint worker",
+                        "fingerprint",
+                    ],
+                )
+                graph.add(
+                    "mergeable",
+                    lambda git_repo: _is_mergeable(
+                        gh_repo, pr_num, snapshot=pr, git_repo=git_repo
+                    ),
+                    deps=["clone"],
+                )
+                # the full checkout needed if the sparse lint failed changes
+                # the repo, so it waits for the mergeable check that fetches
+                # into it
+                graph.add(
+                    "lint",
+                    lambda git_repo, sparse_lint, _mergeable: (
+                        _lint_full_if_sparse_failed(
+                            git_repo,
+                            sparse_lint,
+                            lint_worker=lint_worker,
+                            recipe_dirs=recipe_dirs,
+                        )
+                    ),
+                    deps=["clone", "sparse lint", "mergeable"],
                 )
 
                 # run the linter
                 try:
-                    set_pr_status(pr.base.repo, pr.head.sha, "pending", target_url=None)
-                    _pull_docker_image()
-                    lints, hints = lint_feedstock(feedstock_dir, use_container=True)
+                    results = graph.run()
+                    if results["lint"] is None and results["mergeable"] is None:
+                        # the previous lint cannot be reused w/o knowing if
+                        # the PR is mergeable
+                        results["lint"] = _lint_full_if_sparse_failed(
+                            results["clone"],
+                            _try_lint_sparse(
+                                results["clone"],
+                                lint_worker=lint_worker,
+                                recipe_dirs=recipe_dirs,
+                            ),
+                            lint_worker=lint_worker,
+                            recipe_dirs=recipe_dirs,
+                        )
                 except Exception as err:
+                    # make sure no stage still uses the clone or the lint
+                    # worker when they are cleaned up and that the pending
+                    # status cannot land after the final one
+                    graph.wait_for()
+                    if graph.failed_stage == "clone":
+                        raise
+
                     LOGGER.warning("LINTING ERROR: %s", repr(err))
                     LOGGER.warning(
                         "LINTING ERROR TRACEBACK: %s", traceback.format_exc()
@@ -304,15 +769,38 @@ to help figure out what's going on, install conda-smithy and run \
                         "\n\n<sub>This message was generated by "
                         f"GitHub actions workflow run [{run_link}]({run_link}).</sub>\n"
                     )
-                    msg = make_lint_comment(gh_repo, pr_num, _message)
+                    msg = make_lint_comment(gh_repo, pr_num, _message, snapshot=pr)
                     status = "bad"
                 else:
-                    msg, status = build_and_make_lint_comment(
-                        gh, gh_repo, pr_num, lints, hints
-                    )
+                    fingerprint, reused_status = results["fingerprint"]
+                    if reused_status is not None and results["mergeable"] is True:
+                        msg = results["lint comment"]
+                        status = reused_status
+                    else:
+                        # w/ a merge conflict the lints are not needed
+                        lints, hints = results["lint"] or ({}, {})
+                        msg, status = build_and_make_lint_comment(
+                            gh,
+                            gh_repo,
+                            pr_num,
+                            lints,
+                            hints,
+                            mergeable=results["mergeable"],
+                            snapshot=pr,
+                            fingerprint=fingerprint,
+                            has_recipes=(
+                                bool(get_recipe_trees(results["clone"]))
+                                if recipe_dirs is not None
+                                else None
+                            ),
+                        )
 
                 set_pr_status(
-                    pr.base.repo, pr.head.sha, status, target_url=msg.html_url
+                    pr.base.repo,
+                    pr.head.sha,
+                    status,
+                    target_url=msg.html_url,
+                    snapshot=pr,
                 )
                 print(f"Linter status: {status}")
                 print(f"Linter message:\n{msg.body}")
@@ -1,43 +1,486 @@
+import atexit
+import hashlib
+import logging
 import os
+import random
+import threading
 import time
+import urllib.parse
 
 import requests
+import requests.adapters
 import urllib3.util.retry
-from github import Github
+from github import Auth, Github
+from github.Requester import (
+    HTTPRequestsConnectionClass,
+    HTTPSRequestsConnectionClass,
+    Requester,
+)
 
-from . import sensitive_env
+from . import global_sensitive_env, sensitive_env
+from .http_cache import get_http_cache
+
+LOGGER = logging.getLogger(__name__)
+
+REST_URL = "https://api.github.com"
+GRAPHQL_URL = REST_URL + "/graphql"
+HTTP_POOL_SIZE = 10
+DEFAULT_HTTP_TIMEOUT = 30
+# start pacing requests when fewer than this many are left
+RATE_LIMIT_PACE_BELOW = 50
+# the longest pause between paced requests, so requests only stall for the
+# whole window once the limit is used up
+RATE_LIMIT_MAX_PACE_DELAY = 2
+RATE_LIMIT_MAX_WAIT = 900
+RATE_LIMIT_MAX_RETRIES = 5
+# GitHub asks to wait at least a minute after a secondary rate limit
+SECONDARY_RATE_LIMIT_BACKOFF = 60
+_HTTP_LOCK = threading.RLock()
+_HTTP_ADAPTER = None
+_HTTP_SESSION = None
+_GITHUB_CLIENTS: dict[str, Github] = {}
+
+# the validated token choice is cached by a hash of the tokens until shortly
+# before the token expires
+TOKEN_REFRESH_MARGIN = 60
+# how long to trust the fallback to the default token before checking the
+# rerendering token again
+FALLBACK_TOKEN_TTL = 300
+_ACTOR_TOKEN_CACHE: dict[str, tuple[bool, float]] = {}
+_ACTOR_TOKEN_CACHE_STATS = {"hits": 0, "misses": 0}
+
+
+def get_actor_token_cache_stats():
+    """Get the number of cache hits and misses for `get_actor_token`."""
+    return dict(_ACTOR_TOKEN_CACHE_STATS)
+
+
+def clear_actor_token_cache():
+    _ACTOR_TOKEN_CACHE.clear()
+    _ACTOR_TOKEN_CACHE_STATS.update({"hits": 0, "misses": 0})
+
+
+def _validate_rerendering_token():
+    """Returns (whether to use the rerendering token, expiration time)."""
+    # we use the token reset time as a proxy for when it expires
+    # by default the app tokens have 1 hour and that is the same as the token
+    # reset time.
+    # I could not figure out how to get the actual reset time.
+    now = time.time()
+    reset_time = now - 10  # default the token to "expired"
+    if (
+        "INPUT_RERENDERING_GITHUB_TOKEN" in os.environ
+        and len(os.environ["INPUT_RERENDERING_GITHUB_TOKEN"]) > 0
+    ):
+        try:
+            # make sure the token works
+            gh = Github(os.environ["INPUT_RERENDERING_GITHUB_TOKEN"])
+            reset_time = gh.rate_limiting_resettime
+        except Exception:
+            gh = None
+    else:
+        # nothing to validate so the choice never expires
+        return False, float("inf")
+
+    if gh is not None and reset_time > now:
+        return True, reset_time
+    else:
+        return False, now + FALLBACK_TOKEN_TTL
+
+
+# the bots that the tokens given to the action act as
+_TOKEN_IDENTITIES = {
+    "INPUT_GITHUB_TOKEN": "github-actions[bot]",
+    "INPUT_RERENDERING_GITHUB_TOKEN": "conda-forge-webservices[bot]",
+}
+
+
+def get_credential_identity(request):
+    """Get the bot behind the token of a request.
+
+    The tokens change every run but the bots they act as do not, so this is
+    what the HTTP cache is keyed on. Returns None for unknown tokens.
+    """
+    auth = request.headers.get("Authorization", "")
+    if not auth:
+        return "anonymous"
+
+    token = auth.split(" ", 1)[-1]
+    # read the hidden tokens directly to avoid touching os.environ from the
+    # threads sending requests
+    for name, identity in _TOKEN_IDENTITIES.items():
+        if token and global_sensitive_env.classified_info.get(name) == token:
+            return identity
+    return None
 
 
 def get_actor_token():
     with sensitive_env():
-        # we use the token reset time as a proxy for when it expires
-        # by default the app tokens have 1 hour and that is the same as the token
-        # reset time.
-        # I could not figure out how to get the actual reset time.
-        now = time.time()
-        reset_time = now - 10  # default the token to "expired"
-        if (
-            "INPUT_RERENDERING_GITHUB_TOKEN" in os.environ
-            and len(os.environ["INPUT_RERENDERING_GITHUB_TOKEN"]) > 0
-        ):
-            try:
-                # make sure the token works
-                gh = Github(os.environ["INPUT_RERENDERING_GITHUB_TOKEN"])
-                reset_time = gh.rate_limiting_resettime
-            except Exception:
-                gh = None
+        key = hashlib.sha256(
+            (
+                os.environ.get("INPUT_RERENDERING_GITHUB_TOKEN", "")
+                + ":"
+                + os.environ["INPUT_GITHUB_TOKEN"]
+            ).encode("utf-8")
+        ).hexdigest()
+
+        cached = _ACTOR_TOKEN_CACHE.get(key)
+        if cached is not None and cached[1] - TOKEN_REFRESH_MARGIN > time.time():
+            _ACTOR_TOKEN_CACHE_STATS["hits"] += 1
+            use_rerendering_token = cached[0]
         else:
-            gh = None
+            _ACTOR_TOKEN_CACHE_STATS["misses"] += 1
+            use_rerendering_token, expires = _validate_rerendering_token()
+            _ACTOR_TOKEN_CACHE[key] = (use_rerendering_token, expires)
+        LOGGER.debug("actor token cache stats: %s", _ACTOR_TOKEN_CACHE_STATS)
 
-        if gh is not None and reset_time > now:
+        if use_rerendering_token:
             return "x-access-token", os.environ["INPUT_RERENDERING_GITHUB_TOKEN"], True
         else:
             return "x-access-token", os.environ["INPUT_GITHUB_TOKEN"], False
 
 
+class RateLimitGovernor:
+    """Paces requests to stay inside GitHub's rate limits.
+
+    The governor reads `X-RateLimit-Remaining` and `X-RateLimit-Reset` from
+    every response. Once few requests are left before the reset, requests
+    are spread out over the rest of the window w/ short pauses and once none
+    are left, requests wait for the reset. Responses that hit a primary or
+    secondary rate limit (a `403` or `429`) are retried after the
+    `Retry-After` time, the reset time or a jittered exponential backoff.
+    The limits are tracked per token and rate limit resource (e.g., `core`
+    or `graphql`) since each resource has its own quota.
+
+    Parameters
+    ----------
+    pace_below : int, optional
+        Start pacing requests when fewer than this many remain.
+    max_pace_delay : float, optional
+        The longest pause in seconds between paced requests.
+    max_wait : float, optional
+        The longest single wait in seconds. A rate-limited response is
+        returned as is if waiting for it would take longer.
+    max_retries : int, optional
+        The maximum number of times a rate-limited request is retried.
+    """
+
+    def __init__(
+        self,
+        pace_below=RATE_LIMIT_PACE_BELOW,
+        max_pace_delay=RATE_LIMIT_MAX_PACE_DELAY,
+        max_wait=RATE_LIMIT_MAX_WAIT,
+        max_retries=RATE_LIMIT_MAX_RETRIES,
+    ):
+        self.pace_below = pace_below
+        self.max_pace_delay = max_pace_delay
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.throttled_time = 0.0
+        self.num_throttled = 0
+        self._limits = {}
+        self._blocked_until = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(request, resource=None):
+        if resource is None:
+            # guess the resource of a request that has not been sent yet
+            path = urllib.parse.urlsplit(request.url).path
+            if path.endswith("/graphql"):
+                resource = "graphql"
+            elif path.startswith("/search/code"):
+                resource = "code_search"
+            elif path.startswith("/search"):
+                resource = "search"
+            else:
+                resource = "core"
+        token = hashlib.sha256(
+            request.headers.get("Authorization", "").encode("utf-8")
+        ).hexdigest()
+        return token, resource
+
+    def _sleep(self, delay, reason):
+        LOGGER.warning(
+            "throttling GitHub requests for %0.1f seconds: %s", delay, reason
+        )
+        time.sleep(delay)
+        with self._lock:
+            self.throttled_time += delay
+            self.num_throttled += 1
+
+    def wait(self, request):
+        """Wait before sending a request if the rate limit requires it."""
+        key = self._key(request)
+        now = time.time()
+        with self._lock:
+            blocked_until = self._blocked_until.get(key, 0)
+            remaining, reset = self._limits.get(key, (None, None))
+
+        if blocked_until > now:
+            delay = blocked_until - now
+            reason = "rate limited"
+        elif remaining == 0 and reset > now:
+            delay = reset - now + 1
+            reason = "no requests left until the reset"
+        elif remaining is not None and remaining < self.pace_below and reset > now:
+            # spread the remaining requests over the rest of the window
+            delay = min((reset - now) / (remaining + 1), self.max_pace_delay)
+            reason = "%d requests left until the reset in %0.0f seconds" % (
+                remaining,
+                reset - now,
+            )
+        else:
+            return
+
+        if delay <= self.max_wait:
+            self._sleep(delay, reason)
+
+    def check(self, request, response, attempt):
+        """Record the rate limit from a response.
+
+        Returns the number of seconds to wait before retrying the request, or
+        None if the response should be returned.
+        """
+        headers = response.headers
+        key = self._key(request, headers.get("X-RateLimit-Resource"))
+        now = time.time()
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is not None and reset is not None:
+            with self._lock:
+                self._limits[key] = (int(remaining), float(reset))
+
+        if response.status_code not in (403, 429):
+            return None
+
+        if "Retry-After" in headers:
+            delay = float(headers["Retry-After"])
+        elif remaining == "0" and reset is not None:
+            delay = max(float(reset) - now, 0) + 1
+        elif response.status_code == 429 or "rate limit" in response.text.lower():
+            # secondary rate limits w/o a hint
+            delay = SECONDARY_RATE_LIMIT_BACKOFF * 2**attempt
+            delay *= random.uniform(0.5, 1.0)
+        else:
+            # some other permissions error
+            return None
+
+        if attempt >= self.max_retries or delay > self.max_wait:
+            LOGGER.error(
+                "giving up on rate-limited request %s %s after %d retries",
+                request.method,
+                request.url,
+                attempt,
+            )
+            return None
+
+        with self._lock:
+            self._blocked_until[key] = max(self._blocked_until.get(key, 0), now + delay)
+        return delay
+
+    def log_stats(self):
+        LOGGER.info(
+            "rate limits: throttled %d times for %0.1f seconds total",
+            self.num_throttled,
+            self.throttled_time,
+        )
+
+
+class _PooledHTTPAdapter(requests.adapters.HTTPAdapter):
+    """An `HTTPAdapter` that applies a default timeout to every request,
+    revalidates GET requests against an optional `HTTPCache` and paces
+    requests w/ an optional `RateLimitGovernor`."""
+
+    def __init__(self, *args, cache=None, governor=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+        self.governor = governor
+
+    def send(self, request, timeout=None, stream=False, **kwargs):
+        if timeout is None:
+            timeout = DEFAULT_HTTP_TIMEOUT
+
+        use_cache = self.cache is not None and not stream
+        entry = self.cache.prepare(request) if use_cache else None
+
+        attempt = 0
+        while True:
+            if self.governor is not None:
+                self.governor.wait(request)
+            resp = super().send(request, timeout=timeout, stream=stream, **kwargs)
+            if self.governor is None:
+                break
+            delay = self.governor.check(request, resp, attempt)
+            if delay is None:
+                break
+            resp.close()
+            attempt += 1
+
+        if use_cache:
+            resp = self.cache.handle(request, resp, entry)
+        return resp
+
+
+def _noop_auth(request):
+    # having Session.auth set disables falling back to the .netrc file
+    return request
+
+
+def _make_http_session():
+    sess = requests.Session()
+    sess.auth = _noop_auth
+    sess.mount("https://", get_http_adapter())
+    return sess
+
+
+def get_http_adapter():
+    """Get the process-wide `HTTPAdapter`.
+
+    The adapter holds the connection pools, so every session that mounts it
+    reuses the same keep-alive connections. All requests are paced by a
+    `RateLimitGovernor`. If `CF_WEBSERVICES_HTTP_CACHE_DIR`
+    is set, GET requests are revalidated against an on-disk `HTTPCache`.
+    """
+    global _HTTP_ADAPTER
+    with _HTTP_LOCK:
+        if _HTTP_ADAPTER is None:
+            cache = get_http_cache(identify=get_credential_identity)
+            governor = RateLimitGovernor()
+            _HTTP_ADAPTER = _PooledHTTPAdapter(
+                # rate limits are handled by the governor, so only retry
+                # connection errors and transient server errors here
+                max_retries=urllib3.util.retry.Retry(
+                    total=10,
+                    backoff_factor=0.1,
+                    status_forcelist=[500, 502, 503, 504],
+                ),
+                pool_connections=HTTP_POOL_SIZE,
+                pool_maxsize=HTTP_POOL_SIZE,
+                cache=cache,
+                governor=governor,
+            )
+            atexit.register(governor.log_stats)
+            if cache is not None:
+                atexit.register(cache.log_stats)
+        return _HTTP_ADAPTER
+
+
+def get_http_session():
+    """Get the process-wide `requests.Session` w/ no credentials attached."""
+    global _HTTP_SESSION
+    with _HTTP_LOCK:
+        if _HTTP_SESSION is None:
+            _HTTP_SESSION = _make_http_session()
+        return _HTTP_SESSION
+
+
+class PooledHTTPSConnectionClass(HTTPSRequestsConnectionClass):
+    """A PyGithub connection class that sends requests through the shared
+    session instead of a new `requests.Session` per connection."""
+
+    def __init__(
+        self,
+        host,
+        port=None,
+        strict=False,
+        timeout=None,
+        retry=None,
+        pool_size=None,
+        **kwargs,
+    ):
+        self.port = port if port else 443
+        self.host = host
+        self.protocol = "https"
+        self.timeout = timeout
+        self.verify = kwargs.get("verify", True)
+        self.session = get_http_session()
+
+    def close(self):
+        # the shared session outlives any one connection
+        pass
+
+
+def install_pooled_transport():
+    """Make every PyGithub client in this process use the shared session.
+
+    This swaps the connection classes of PyGithub globally, so it is only
+    called from the entry point of the action and never on import.
+    """
+    Requester.injectConnectionClasses(
+        HTTPRequestsConnectionClass, PooledHTTPSConnectionClass
+    )
+
+
+def get_github_client(github_token):
+    """Get a cached `Github` client for a token."""
+    key = hashlib.sha256(github_token.encode("utf-8")).hexdigest()
+    with _HTTP_LOCK:
+        if key not in _GITHUB_CLIENTS:
+            _GITHUB_CLIENTS[key] = Github(auth=Auth.Token(github_token))
+        return _GITHUB_CLIENTS[key]
+
+
+def graphql(query, github_token, variables=None):
+    """Run a GitHub GraphQL query or mutation.
+
+    Parameters
+    ----------
+    query : str
+        The GraphQL query.
+    github_token : str
+        The GitHub access token.
+    variables : dict, optional
+        The variables for the query.
+
+    Returns
+    -------
+    data : dict
+        The decoded JSON response, including any `errors`.
+    """
+    payload = {"query": query}
+    if variables is not None:
+        payload["variables"] = variables
+    resp = get_http_session().post(
+        GRAPHQL_URL,
+        json=payload,
+        headers={"Authorization": f"bearer {github_token}"},
+    )
+    return resp.json()
+
+
+def rest(method, path, github_token, json=None):
+    """Make a GitHub REST API request and return the decoded JSON response.
+
+    Parameters
+    ----------
+    method : str
+        The HTTP method.
+    path : str
+        The API path (e.g., "/repos/conda-forge/blah/issues/1/comments").
+    github_token : str
+        The GitHub access token.
+    json : dict, optional
+        The JSON body of the request.
+    """
+    resp = get_http_session().request(
+        method,
+        REST_URL + path,
+        json=json,
+        headers={
+            "Accept": "application/vnd.github+json",
+            "Authorization": f"token {github_token}",
+        },
+    )
+    resp.raise_for_status()
+    return resp.json() if resp.content else None
+
+
 def create_api_sessions(github_token):
     """Create API sessions for GitHub.
 
+    Both sessions send their requests over the process-wide connection pool.
+
     Parameters
     ----------
     github_token : str
@@ -54,7 +497,7 @@ def create_api_sessions(github_token):
     #  https://alexwlchan.net/2019/03/
     #    creating-a-github-action-to-auto-merge-pull-requests/
     # with lots of edits
-    sess = requests.Session()
+    sess = _make_http_session()
     sess.headers = {
         "Accept": "; ".join(
             [
@@ -77,8 +520,6 @@ def create_api_sessions(github_token):
     sess.hooks["response"].append(raise_for_status)
 
     # build a github object too
-    gh = Github(
-        github_token, retry=urllib3.util.retry.Retry(total=10, backoff_factor=0.1)
-    )
+    gh = get_github_client(github_token)
 
     return sess, gh
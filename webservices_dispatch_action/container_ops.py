@@ -0,0 +1,163 @@
+"""Operations run inside of the webservices container by `ContainerSession`.
+
+Usage: python -m webservices_dispatch_action.container_ops <op>
+
+The keyword arguments for the operation are read as JSON from stdin and the
+result is written as JSON to stdout as `{"data": ...}` or `{"error": ...}`.
+All logging goes to stderr.
+
+The ops only ever see the session's copy of the workspace w/o any `.git`
+directories (see `ContainerSession`).
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import traceback
+
+from conda_forge_feedstock_ops.lint import lint as lint_feedstock
+from conda_forge_feedstock_ops.rerender import rerender as cf_feedstock_ops_rerender
+from conda_forge_tick.feedstock_parser import load_feedstock
+from conda_forge_tick.lazy_json_backends import dumps, loads
+from conda_forge_tick.update_recipe.version import update_version_feedstock_dir
+from conda_forge_tick.update_upstream_versions import (
+    all_version_sources,
+    get_latest_version,
+)
+
+from .docker_utils import sync_tree
+from .version_updater import update_version_recipe
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _fix_permissions(path):
+    # the host copies our changes out of the session's copy of the workspace
+    # and replaces or removes our files on the next sync, so it needs to be able
+    # to read and write them. we cannot change the files synced in by the
+    # host, so errors are ignored.
+    subprocess.run(["chmod", "-R", "a+rwX", path], stderr=subprocess.DEVNULL)
+
+
+def _load_feedstock(*, name):
+    return load_feedstock(name, {}, use_container=False)
+
+
+def _get_latest_version(*, name, attrs):
+    return get_latest_version(
+        name,
+        attrs,
+        all_version_sources(),
+        use_container=False,
+    )
+
+
+def _update_version_feedstock_dir(*, feedstock_dir, version):
+    try:
+        updated, errors = update_version_feedstock_dir(
+            feedstock_dir,
+            version,
+            use_container=False,
+        )
+    finally:
+        _fix_permissions(feedstock_dir)
+    return {"updated": updated, "errors": errors}
+
+
+def _rerender(*, feedstock_dir, timeout=None):
+    # the session does not mount the git dir of the feedstock but conda-smithy
+    # uses git to find what changed, so we rerender a copy in a scratch repo
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            scratch_dir = os.path.join(tmpdir, os.path.basename(feedstock_dir))
+            shutil.copytree(feedstock_dir, scratch_dir, symlinks=True)
+            for cmd in [
+                ["git", "init", "--quiet"],
+                ["git", "add", "--all"],
+                [
+                    "git",
+                    "-c",
+                    "user.name=conda conda",
+                    "-c",
+                    "user.email=conda@conda.conda",
+                    "commit",
+                    "--quiet",
+                    "--allow-empty",
+                    "-m",
+                    "initial commit",
+                ],
+            ]:
+                subprocess.run(cmd, cwd=scratch_dir, check=True)
+
+            msg = cf_feedstock_ops_rerender(
+                scratch_dir,
+                timeout=timeout,
+                use_container=False,
+            )
+            sync_tree(scratch_dir, feedstock_dir, shared=True)
+        return msg
+    finally:
+        _fix_permissions(feedstock_dir)
+
+
+def _lint(*, feedstock_dir):
+    lints, hints = lint_feedstock(feedstock_dir, use_container=False)
+    return {"lints": lints, "hints": hints}
+
+
+def _update_version(*, feedstock_dir, name, input_version=None):
+    try:
+        return update_version_recipe(
+            feedstock_dir,
+            name,
+            input_version=input_version,
+            use_container=False,
+        )
+    finally:
+        _fix_permissions(feedstock_dir)
+
+
+OPS = {
+    "load_feedstock": _load_feedstock,
+    "get_latest_version": _get_latest_version,
+    "update_version_feedstock_dir": _update_version_feedstock_dir,
+    "rerender": _rerender,
+    "update_version": _update_version,
+    "lint": _lint,
+}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    op = sys.argv[1]
+    kwargs = sys.stdin.read()
+
+    if op not in OPS:
+        print(dumps({"error": "unknown op %s" % op, "unknown_op": True}), flush=True)
+        return
+
+    # the ops and their subprocesses may print to stdout, so we send fd 1 to
+    # stderr while they run and only write the result to stdout
+    real_stdout = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        data = OPS[op](**loads(kwargs or "{}"))
+    except Exception as e:
+        LOGGER.exception("container op %s failed!", op)
+        ret = {"error": repr(e), "traceback": traceback.format_exc()}
+    else:
+        ret = {"data": data}
+    finally:
+        sys.stdout.flush()
+        os.dup2(real_stdout, 1)
+        os.close(real_stdout)
+
+    print(dumps(ret), flush=True)
+
+
+if __name__ == "__main__":
+    main()
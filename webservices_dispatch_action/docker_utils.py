@@ -0,0 +1,571 @@
+import filecmp
+import json
+import logging
+import os
+import shutil
+import signal
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import global_sensitive_env
+
+LOGGER = logging.getLogger(__name__)
+
+
+def running_in_container():
+    """Whether we are running inside of the webservices image, in which case the
+    feedstock operations run in subprocesses w/o the tokens instead of in nested
+    containers."""
+    return (
+        os.environ.get("CF_WEBSERVICES_IN_CONTAINER", "false") == "true"
+        or os.environ.get("CF_FEEDSTOCK_OPS_IN_CONTAINER", "false") == "true"
+    )
+
+
+def should_use_container():
+    return not running_in_container()
+
+
+def get_pull_cache_dir():
+    return os.environ.get(
+        "CF_WEBSERVICES_DOCKER_PULL_CACHE_DIR",
+        os.path.join(
+            os.path.expanduser("~"), ".cache", "webservices-dispatch-action", "pulls"
+        ),
+    )
+
+
+def get_pull_ttl():
+    """Get the time in seconds for which a successful pull is trusted w/o checking
+    the registry (`CF_WEBSERVICES_DOCKER_PULL_TTL`, default of 0 means always
+    check)."""
+    return float(os.environ.get("CF_WEBSERVICES_DOCKER_PULL_TTL", "0"))
+
+
+def _stamp_path(image):
+    return os.path.join(
+        get_pull_cache_dir(), image.replace("/", "__").replace(":", "--") + ".json"
+    )
+
+
+def _read_stamp(image):
+    try:
+        with open(_stamp_path(image)) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_stamp(image, digest):
+    pth = _stamp_path(image)
+    os.makedirs(os.path.dirname(pth), exist_ok=True)
+    with open(pth, "w") as fp:
+        json.dump({"time": time.time(), "digest": digest}, fp)
+
+
+def get_local_image_digests(image):
+    """Get the registry digests of a local image, if any."""
+    out = subprocess.run(
+        ["docker", "image", "inspect", "--format", "{{json .RepoDigests}}", image],
+        capture_output=True,
+        text=True,
+    )
+    if out.returncode != 0:
+        return set()
+
+    try:
+        repo_digests = json.loads(out.stdout.strip()) or []
+    except ValueError:
+        return set()
+    return {rd.split("@", 1)[1] for rd in repo_digests if "@" in rd}
+
+
+def get_local_image_size(image):
+    """Get the size in bytes of a local image, if it exists."""
+    out = subprocess.run(
+        ["docker", "image", "inspect", "--format", "{{.Size}}", image],
+        capture_output=True,
+        text=True,
+    )
+    if out.returncode != 0:
+        return None
+
+    try:
+        return int(out.stdout.strip())
+    except ValueError:
+        return None
+
+
+def get_remote_image_digest(image):
+    """Get the digest of an image's manifest in the registry, if it can be found."""
+    out = subprocess.run(
+        [
+            "docker",
+            "buildx",
+            "imagetools",
+            "inspect",
+            "--format",
+            "{{json .Manifest}}",
+            image,
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if out.returncode != 0:
+        LOGGER.info("could not get the registry digest for %s: %s", image, out.stderr)
+        return None
+
+    try:
+        return json.loads(out.stdout)["digest"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def pull_image(image):
+    """Pull a docker image unless the local copy is already up to date.
+
+    The pull is skipped if the last successful pull was less than
+    `get_pull_ttl()` seconds ago or if the local image has the same digest as
+    the image in the registry.
+
+    Returns
+    -------
+    pulled : bool
+        Whether `docker pull` was run.
+    """
+    t0 = time.perf_counter()
+
+    ttl = get_pull_ttl()
+    stamp = _read_stamp(image)
+    if ttl > 0 and stamp is not None and time.time() - stamp["time"] < ttl:
+        LOGGER.info(
+            "skipped docker pull of %s since the last pull was less than %s "
+            "seconds ago (took %0.2f seconds)",
+            image,
+            ttl,
+            time.perf_counter() - t0,
+        )
+        return False
+
+    local_digests = get_local_image_digests(image)
+    remote_digest = get_remote_image_digest(image) if local_digests else None
+    if remote_digest is not None and remote_digest in local_digests:
+        _write_stamp(image, remote_digest)
+        LOGGER.info(
+            "skipped docker pull of %s since the local image is up to date "
+            "w/ digest %s (took %0.2f seconds)",
+            image,
+            remote_digest,
+            time.perf_counter() - t0,
+        )
+        return False
+
+    ret = subprocess.run(["docker", "pull", image])
+    if ret.returncode != 0:
+        raise RuntimeError(
+            "docker pull of %s failed w/ return code %s!" % (image, ret.returncode)
+        )
+
+    local_digests = get_local_image_digests(image)
+    _write_stamp(image, sorted(local_digests)[0] if local_digests else None)
+    LOGGER.info(
+        "pulled docker image %s in %0.2f seconds", image, time.perf_counter() - t0
+    )
+    return True
+
+
+def _is_dot_git(name):
+    return name.lower() == ".git"
+
+
+def _remove(pth):
+    if os.path.isdir(pth) and not os.path.islink(pth):
+        shutil.rmtree(pth)
+    elif os.path.lexists(pth):
+        os.unlink(pth)
+
+
+def _ensure_mode(pth, mode, make_dir=False):
+    # only change the mode if needed since a container user may own the path
+    if make_dir and not os.path.exists(pth):
+        os.mkdir(pth)
+    if stat.S_IMODE(os.lstat(pth).st_mode) != mode:
+        os.chmod(pth, mode)
+
+
+def sync_tree(src, dst, shared=False):
+    """Make `dst` a copy of `src` w/o any `.git` entries.
+
+    Symlinks are copied as links and are never followed on either side, so
+    nothing is written outside of `dst`. Files in `dst` that are not in `src`
+    are removed, except for `.git` entries, which are left alone. Files w/ the
+    same contents and mode are not copied again. Other file types (e.g.,
+    fifos) are skipped.
+
+    Parameters
+    ----------
+    src : str
+        The directory to copy.
+    dst : str
+        The directory to update.
+    shared : bool, optional
+        If True, everything in `dst` is made writable by all users (e.g., for
+        a container user), otherwise files are made `0o644` or `0o755`.
+    """
+    if os.path.islink(dst) or (os.path.lexists(dst) and not os.path.isdir(dst)):
+        _remove(dst)
+    _ensure_mode(dst, 0o777 if shared else 0o755, make_dir=True)
+
+    names = set()
+    with os.scandir(src) as it:
+        entries = [entry for entry in it if not _is_dot_git(entry.name)]
+    for entry in entries:
+        dst_pth = os.path.join(dst, entry.name)
+        if entry.is_symlink():
+            target = os.readlink(entry.path)
+            if not (os.path.islink(dst_pth) and os.readlink(dst_pth) == target):
+                _remove(dst_pth)
+                os.symlink(target, dst_pth)
+        elif entry.is_dir(follow_symlinks=False):
+            sync_tree(entry.path, dst_pth, shared=shared)
+        elif entry.is_file(follow_symlinks=False):
+            executable = entry.stat(follow_symlinks=False).st_mode & stat.S_IXUSR
+            if shared:
+                mode = 0o777 if executable else 0o666
+            else:
+                mode = 0o755 if executable else 0o644
+            if not (
+                os.path.isfile(dst_pth)
+                and not os.path.islink(dst_pth)
+                and stat.S_IMODE(os.lstat(dst_pth).st_mode) == mode
+                and filecmp.cmp(entry.path, dst_pth, shallow=False)
+            ):
+                _remove(dst_pth)
+                shutil.copyfile(entry.path, dst_pth, follow_symlinks=False)
+                os.chmod(dst_pth, mode)
+        else:
+            continue
+        names.add(entry.name)
+
+    for name in os.listdir(dst):
+        if name not in names and not _is_dot_git(name):
+            _remove(os.path.join(dst, name))
+
+
+def remove_unsafe_links(root):
+    """Remove symlinks under `root` that resolve outside of it or into a
+    `.git` directory, returning their paths."""
+    root = os.path.realpath(root)
+    removed = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not _is_dot_git(d)]
+        for name in dirnames + filenames:
+            pth = os.path.join(dirpath, name)
+            if not os.path.islink(pth):
+                continue
+            rel_target = os.path.relpath(os.path.realpath(pth), root)
+            if rel_target.startswith(os.pardir) or any(
+                _is_dot_git(part) for part in rel_target.split(os.sep)
+            ):
+                os.unlink(pth)
+                removed.append(pth)
+    return removed
+
+
+class ContainerSessionError(RuntimeError):
+    pass
+
+
+class UnknownContainerOpError(ContainerSessionError):
+    """The image of the session does not have the operation (e.g., it is
+    older than the code on the host)."""
+
+
+class OpSession:
+    """Runs the operations from `webservices_dispatch_action.container_ops`
+    for one dispatch away from this process.
+
+    The operations run untrusted recipe code, so they never see the git
+    directories of the workspace. They run on a copy of `workspace_dir` w/o
+    any `.git` entries at `mount_point`. The copy is refreshed from the
+    workspace before each operation and its changes are copied back after it.
+    Symlinks that would point out of the workspace or into a `.git` directory
+    are not kept.
+
+    Subclasses implement `start`, `exec` and `stop`.
+    """
+
+    # the command that runs python for an operation
+    python = ["python"]
+
+    def __init__(self, workspace_dir, mount_point):
+        self.workspace_dir = os.path.abspath(workspace_dir)
+        self.mount_point = mount_point
+        self.staging_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def container_path(self, host_path):
+        """Map a path in the workspace on the host to its path for the ops."""
+        rel_path = os.path.relpath(os.path.abspath(host_path), self.workspace_dir)
+        if rel_path.startswith(os.pardir):
+            raise ValueError(
+                "Path %s is not in the workspace %s!" % (host_path, self.workspace_dir)
+            )
+        return os.path.normpath(os.path.join(self.mount_point, rel_path))
+
+    def start(self):
+        raise NotImplementedError()
+
+    def exec(self, args, input=None):
+        raise NotImplementedError()
+
+    def stop(self):
+        self._remove_staging_dir()
+
+    def _remove_staging_dir(self):
+        if self.staging_dir is not None:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            self.staging_dir = None
+
+    def _sync(self, src, dst, shared):
+        sync_tree(src, dst, shared=shared)
+
+    def sync_to_container(self):
+        """Copy the workspace w/o `.git` entries for the ops."""
+        self.start()
+        self._sync(self.workspace_dir, self.staging_dir, shared=True)
+
+    def sync_from_container(self):
+        """Copy the changes made by the ops back to the workspace."""
+        self._sync(self.staging_dir, self.workspace_dir, shared=False)
+        for pth in remove_unsafe_links(self.workspace_dir):
+            LOGGER.warning("removed unsafe symlink %s made by a container op", pth)
+
+    def _describe(self):
+        return "the session"
+
+    def run_op(self, op, kwargs, json_dumps=json.dumps, json_loads=json.loads):
+        """Run an operation from `webservices_dispatch_action.container_ops`.
+
+        Paths in `kwargs` must already be container paths (see `container_path`).
+        """
+        t0 = time.perf_counter()
+        self.sync_to_container()
+        try:
+            out = self.exec(
+                self.python + ["-m", "webservices_dispatch_action.container_ops", op],
+                input=json_dumps(kwargs),
+            )
+        finally:
+            self.sync_from_container()
+        LOGGER.info("container op %s took %0.2f seconds", op, time.perf_counter() - t0)
+        if out.stderr:
+            LOGGER.info("container op %s stderr:\n%s", op, out.stderr)
+
+        try:
+            ret = json_loads(out.stdout)
+        except ValueError:
+            raise ContainerSessionError(
+                "Container op %s failed w/ return code %s and output %r!"
+                % (op, out.returncode, out.stdout)
+            )
+
+        # older images fail w/ a KeyError for ops they do not have
+        if ret.get("unknown_op") or ret.get("error") == repr(KeyError(op)):
+            raise UnknownContainerOpError(
+                "Container op %s is not in %s!" % (op, self._describe())
+            )
+        if "error" in ret:
+            raise ContainerSessionError(
+                "Container op %s failed: %s\n%s"
+                % (op, ret["error"], ret.get("traceback", ""))
+            )
+        return ret["data"]
+
+
+class ContainerSession(OpSession):
+    """A long-lived container that runs many operations for one dispatch.
+
+    The container is started on first use and is removed when the session is
+    closed. Operations are run with `docker exec` so that each one only pays
+    for process startup and not for a full container start. The copy of the
+    workspace (see `OpSession`) is mounted read-write at `mount_point` and
+    the container is paused while it is synced.
+
+    Parameters
+    ----------
+    image : str
+        The image to run, e.g. `condaforge/webservices-dispatch-action:prod`.
+    workspace_dir : str
+        The host directory to copy into the container.
+    mount_point : str, optional
+        Where to mount the copy of `workspace_dir` in the container.
+    tmpfs_size_mb : int, optional
+        The size of the tmpfs mounted at `/tmp` in the container.
+    """
+
+    entrypoint = "/opt/docker/bin/entrypoint"
+
+    def __init__(
+        self,
+        image,
+        workspace_dir,
+        mount_point="/cf_feedstock_ops_dir",
+        tmpfs_size_mb=6000,
+    ):
+        super().__init__(workspace_dir, mount_point)
+        self.image = image
+        self.tmpfs_size_mb = tmpfs_size_mb
+        self.container_id = None
+
+    def start(self):
+        if self.container_id is not None:
+            return
+
+        t0 = time.perf_counter()
+        self.staging_dir = tempfile.mkdtemp(prefix="cf-webservices-session-")
+        out = subprocess.run(
+            [
+                "docker",
+                "run",
+                "--detach",
+                "--rm",
+                "-e",
+                "CF_FEEDSTOCK_OPS_IN_CONTAINER=true",
+                "--security-opt=no-new-privileges",
+                "--read-only",
+                "--cap-drop=all",
+                "--mount",
+                f"type=tmpfs,destination=/tmp,tmpfs-mode=1777,"
+                f"tmpfs-size={self.tmpfs_size_mb}m",
+                "--mount",
+                f"type=bind,source={self.staging_dir},destination={self.mount_point}",
+                self.image,
+                "sleep",
+                "infinity",
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if out.returncode != 0:
+            self._remove_staging_dir()
+            raise ContainerSessionError(
+                "Could not start container from %s: %s" % (self.image, out.stderr)
+            )
+        self.container_id = out.stdout.strip()
+        LOGGER.info(
+            "started container session %s from %s in %0.2f seconds",
+            self.container_id[:12],
+            self.image,
+            time.perf_counter() - t0,
+        )
+
+    def stop(self):
+        if self.container_id is not None:
+            subprocess.run(
+                ["docker", "rm", "--force", self.container_id],
+                capture_output=True,
+            )
+            LOGGER.info("stopped container session %s", self.container_id[:12])
+            self.container_id = None
+        super().stop()
+
+    def _sync(self, src, dst, shared):
+        # nothing in the container can change the copy while it is synced
+        subprocess.run(
+            ["docker", "pause", self.container_id], check=True, capture_output=True
+        )
+        try:
+            super()._sync(src, dst, shared)
+        finally:
+            subprocess.run(
+                ["docker", "unpause", self.container_id],
+                check=True,
+                capture_output=True,
+            )
+
+    def _describe(self):
+        return "the image %s" % self.image
+
+    def exec(self, args, input=None):
+        """Run a command in the container, returning the completed process."""
+        self.start()
+        return subprocess.run(
+            [
+                "docker",
+                "exec",
+                "--interactive",
+                "--workdir",
+                self.mount_point,
+                self.container_id,
+                self.entrypoint,
+                *args,
+            ],
+            input=input,
+            capture_output=True,
+            text=True,
+        )
+
+
+class SubprocessSession(OpSession):
+    """Runs the operations for one dispatch in subprocesses when we are
+    already inside of the webservices image.
+
+    This process holds the tokens, so recipe code never runs in it. Each
+    operation runs in a fresh interpreter in its own process group w/o the
+    tokens or access to the ssh agent in its environment, and any processes
+    it leaves behind are killed before its changes are copied back.
+
+    Parameters
+    ----------
+    workspace_dir : str
+        The directory to copy for the operations.
+    """
+
+    python = [sys.executable]
+
+    def __init__(self, workspace_dir):
+        staging_dir = tempfile.mkdtemp(prefix="cf-webservices-session-")
+        super().__init__(workspace_dir, staging_dir)
+        self.staging_dir = staging_dir
+
+    def _describe(self):
+        return "this version of the code"
+
+    def start(self):
+        if self.staging_dir is None:
+            raise ContainerSessionError("The session was already stopped!")
+
+    def exec(self, args, input=None):
+        """Run a command on the copy of the workspace, returning the completed
+        process."""
+        self.start()
+        env = global_sensitive_env.scrubbed_env()
+        env["CF_FEEDSTOCK_OPS_IN_CONTAINER"] = "true"
+        proc = subprocess.Popen(
+            args,
+            cwd=self.staging_dir,
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            start_new_session=True,
+        )
+        try:
+            stdout, stderr = proc.communicate(input=input)
+        finally:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            proc.wait()
+        return subprocess.CompletedProcess(args, proc.returncode, stdout, stderr)
@@ -1,6 +1,15 @@
+import ctypes
 import os
+import threading
 from contextlib import contextmanager
 
+# a file of `NAME=value` lines w/ the sensitive env vars, used instead of the
+# environment when running in the container (see `run_in_container`)
+SECRETS_FILE_ENV_VAR = "CF_WEBSERVICES_SECRETS_FILE"
+# env vars that give access to the ssh agent
+SSH_AGENT_KEYS = ["SSH_AUTH_SOCK", "SSH_AGENT_PID"]
+_PR_SET_DUMPABLE = 4
+
 
 class SensitiveEnv:
     SENSITIVE_KEYS = [
@@ -14,6 +23,7 @@ class SensitiveEnv:
 
     def __init__(self):
         self.classified_info = {}
+        self._lock = threading.RLock()
 
     def hide_env_vars(self):
         """Remove sensitive env vars"""
@@ -30,13 +40,56 @@ class SensitiveEnv:
             **{k: v for k, v in self.classified_info.items() if v is not None}
         )
 
+    def load_secrets_file(self, path):
+        """Load sensitive env vars from a file of `NAME=value` lines and
+        remove the file, so that the values are never in the environment of
+        any process."""
+        with open(path) as fp:
+            for line in fp:
+                k, sep, v = line.rstrip("\n").partition("=")
+                if sep and k in self.SENSITIVE_KEYS and v:
+                    self.classified_info[k] = v
+        os.remove(path)
+
+    def scrubbed_env(self):
+        """Get a copy of the environment w/o sensitive values or access to the
+        ssh agent for running untrusted code, even while the sensitive env vars
+        are revealed in another thread."""
+        excluded = set(self.SENSITIVE_KEYS + SSH_AGENT_KEYS + [SECRETS_FILE_ENV_VAR])
+        return {k: v for k, v in os.environ.items() if k not in excluded}
+
     @contextmanager
     def sensitive_env(self):
         """Add sensitive keys to environ if needed, when ctx is finished
         remove keys and update the sensitive env in case any were updated
         inside the ctx"""
-        self.reveal_env_vars()
-        try:
-            yield os.environ
-        finally:
-            self.hide_env_vars()
+        with self._lock:
+            self.reveal_env_vars()
+            try:
+                yield os.environ
+            finally:
+                self.hide_env_vars()
+
+    @contextmanager
+    def untrusted_env(self):
+        """Remove the sensitive env vars and access to the ssh agent from
+        environ while starting long-lived processes that inherit it, even if
+        they are revealed in this thread or would be in another thread."""
+        keys = self.SENSITIVE_KEYS + SSH_AGENT_KEYS + [SECRETS_FILE_ENV_VAR]
+        with self._lock:
+            saved = {k: os.environ.pop(k) for k in keys if k in os.environ}
+            try:
+                yield os.environ
+            finally:
+                os.environ.update(saved)
+
+
+def make_process_undumpable():
+    """Keep other processes of the same user (e.g., recipe code run by the
+    feedstock operations) from reading the memory or environment of this
+    process through `/proc` or ptrace. Returns whether it worked."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.prctl(_PR_SET_DUMPABLE, 0, 0, 0, 0) == 0
+    except (OSError, AttributeError):
+        return False
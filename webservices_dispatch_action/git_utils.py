@@ -0,0 +1,600 @@
+import fcntl
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from git import GitCommandError, Repo
+
+LOGGER = logging.getLogger(__name__)
+
+# the clone strategies for the feedstock checkout
+#  - full: full history and every blob
+#  - blobless: partial clone of only the PR branch w/o tags, blobs are
+#    fetched on demand
+#  - shallow: blobless plus a depth-limited history that is deepened on demand
+CLONE_STRATEGIES = ("full", "blobless", "shallow")
+DEFAULT_CLONE_STRATEGY = "shallow"
+DEFAULT_CLONE_DEPTH = 1
+MAX_DEEPEN_ATTEMPTS = 5
+# the first deepening of both sides when looking for a merge base
+MERGE_BASE_DEEPEN = 16
+DEFAULT_MIRROR_CACHE_MAX_SIZE_MB = 10240
+
+
+def get_clone_strategy():
+    strategy = os.environ.get(
+        "CF_WEBSERVICES_CLONE_STRATEGY", DEFAULT_CLONE_STRATEGY
+    ).lower()
+    if strategy not in CLONE_STRATEGIES:
+        raise ValueError(
+            "Clone strategy %s is not one of %s!" % (strategy, CLONE_STRATEGIES)
+        )
+    return strategy
+
+
+def get_clone_depth():
+    return int(os.environ.get("CF_WEBSERVICES_CLONE_DEPTH", DEFAULT_CLONE_DEPTH))
+
+
+def get_clone_options(strategy, depth=None):
+    """Get the `git clone` options for a clone strategy as GitPython kwargs."""
+    if strategy not in CLONE_STRATEGIES:
+        raise ValueError(
+            "Clone strategy %s is not one of %s!" % (strategy, CLONE_STRATEGIES)
+        )
+
+    if strategy == "full":
+        return {}
+
+    opts = {"filter": "blob:none", "single_branch": True, "no_tags": True}
+    if strategy == "shallow":
+        opts["depth"] = depth or get_clone_depth()
+    return opts
+
+
+def clone_feedstock(
+    repo_url,
+    feedstock_dir,
+    branch,
+    strategy=None,
+    depth=None,
+    reference_repo=None,
+    fork_repos=None,
+    sparse_paths=None,
+):
+    """Clone a branch of a feedstock.
+
+    If the mirror cache is enabled (see `get_mirror_cache`), `reference_repo`
+    and the branches of `fork_repos` are fetched into its mirror in the cache,
+    which is used as a reference for the clone so that only new objects are
+    downloaded.
+
+    Parameters
+    ----------
+    repo_url : str
+        The URL of the repo to clone.
+    feedstock_dir : str
+        The path to clone into.
+    branch : str
+        The branch to check out.
+    strategy : str, optional
+        One of `CLONE_STRATEGIES`. The default is read from the
+        `CF_WEBSERVICES_CLONE_STRATEGY` environment variable, falling back
+        to `DEFAULT_CLONE_STRATEGY`.
+    depth : int, optional
+        The history depth for the `shallow` strategy. The default is read from
+        the `CF_WEBSERVICES_CLONE_DEPTH` environment variable.
+    reference_repo : str, optional
+        The repo like `conda-forge/blah-feedstock` to use from the mirror cache.
+    fork_repos : list of str, optional
+        Forks of `reference_repo` like `regro/blah-feedstock` whose branches
+        are fetched into its mirror.
+    sparse_paths : list of str, optional
+        If given, only these directories (plus the files at the top of the
+        repo) are checked out with a cone-mode sparse checkout.
+
+    Returns
+    -------
+    git_repo : git.Repo
+        The cloned repo.
+    """
+    strategy = strategy or get_clone_strategy()
+    opts = get_clone_options(strategy, depth=depth)
+
+    cache = get_mirror_cache()
+    references = []
+    if cache is not None and reference_repo is not None:
+        try:
+            references = cache.get_references(reference_repo, forks=fork_repos)
+        except Exception:
+            LOGGER.exception("mirror cache failed, cloning w/o it!")
+            references = []
+
+    multi_options = []
+    if references:
+        # the objects are local so we do not need the partial clone or
+        # the depth limit
+        opts = {"single_branch": True, "no_tags": True}
+        multi_options = [f"--reference={ref}" for ref in references]
+
+    if sparse_paths:
+        opts["sparse"] = True
+
+    LOGGER.info(
+        "cloning %s@%s w/ strategy %s (options: %s, references: %s)",
+        repo_url,
+        branch,
+        strategy,
+        opts,
+        references,
+    )
+    git_repo = Repo.clone_from(
+        repo_url,
+        feedstock_dir,
+        branch=branch,
+        multi_options=multi_options or None,
+        **opts,
+    )
+
+    if sparse_paths:
+        LOGGER.info("sparse checkout of %s", sparse_paths)
+        subprocess.run(
+            ["git", "sparse-checkout", "set", "--cone", *sparse_paths],
+            cwd=git_repo.working_dir,
+            check=True,
+        )
+
+    return git_repo
+
+
+def is_sparse(git_repo):
+    out = subprocess.run(
+        ["git", "config", "--bool", "core.sparseCheckout"],
+        cwd=git_repo.working_dir,
+        capture_output=True,
+        text=True,
+    )
+    return out.stdout.strip() == "true"
+
+
+def disable_sparse_checkout(git_repo):
+    """Check out the full working tree of a sparse checkout."""
+    LOGGER.info("disabling sparse checkout")
+    subprocess.run(
+        ["git", "sparse-checkout", "disable"],
+        cwd=git_repo.working_dir,
+        check=True,
+    )
+
+
+def get_sparse_excluded_dirs(git_repo):
+    """Get the top-level directories of HEAD that a cone-mode sparse checkout
+    does not check out."""
+    if not is_sparse(git_repo):
+        return []
+    out = subprocess.run(
+        ["git", "sparse-checkout", "list"],
+        cwd=git_repo.working_dir,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    sparse_dirs = set(p.split("/")[0] for p in out.stdout.splitlines())
+    return sorted(
+        tree.name
+        for tree in git_repo.head.commit.tree.trees
+        if tree.name not in sparse_dirs
+    )
+
+
+def is_shallow(git_repo):
+    return os.path.exists(os.path.join(git_repo.git_dir, "shallow"))
+
+
+def _has_commit(git_repo, rev):
+    return (
+        subprocess.run(
+            ["git", "rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}"],
+            cwd=git_repo.working_dir,
+            capture_output=True,
+        ).returncode
+        == 0
+    )
+
+
+def ensure_history(git_repo, rev):
+    """Make sure the commit `rev` (e.g., `HEAD~1`) is present in a clone,
+    deepening a shallow clone as needed.
+
+    Returns True if the commit is available.
+    """
+    if _has_commit(git_repo, rev):
+        return True
+
+    if not is_shallow(git_repo):
+        return False
+
+    deepen = max(get_clone_depth(), 1)
+    for _ in range(MAX_DEEPEN_ATTEMPTS):
+        LOGGER.info("deepening clone by %d commits to find %s", deepen, rev)
+        subprocess.run(
+            ["git", "fetch", "--quiet", f"--deepen={deepen}", "origin"],
+            cwd=git_repo.working_dir,
+            check=True,
+        )
+        if _has_commit(git_repo, rev):
+            return True
+        if not is_shallow(git_repo):
+            return False
+        deepen *= 2
+
+    LOGGER.info("unshallowing clone to find %s", rev)
+    subprocess.run(
+        ["git", "fetch", "--quiet", "--unshallow", "origin"],
+        cwd=git_repo.working_dir,
+        check=True,
+    )
+    return _has_commit(git_repo, rev)
+
+
+def _has_merge_base(git_repo, rev1, rev2):
+    return (
+        subprocess.run(
+            ["git", "merge-base", rev1, rev2],
+            cwd=git_repo.working_dir,
+            capture_output=True,
+        ).returncode
+        == 0
+    )
+
+
+def check_mergeable(git_repo, base_url, base_ref, rev="HEAD"):
+    """Check locally if `rev` merges w/o conflicts into a base branch.
+
+    The base branch is fetched w/o blobs from a `base` remote into
+    `refs/remotes/base/<base_ref>`.
+    Both histories are deepened until they share a merge base and the merge
+    is then computed w/ `git merge-tree --write-tree` (git>=2.38), which
+    never touches the working tree or the index.
+
+    Parameters
+    ----------
+    git_repo : git.Repo
+        The clone of the PR head.
+    base_url : str
+        The URL of the base repo.
+    base_ref : str
+        The base branch.
+    rev : str, optional
+        The revision to merge.
+
+    Returns
+    -------
+    mergeable : bool or None
+        False if there are conflicts and None if it could not be decided.
+    """
+    cwd = git_repo.working_dir
+    base_rev = f"refs/remotes/base/{base_ref}"
+    fetch_base = [
+        "git",
+        "fetch",
+        "--quiet",
+        "--no-tags",
+        "--filter=blob:none",
+        "base",
+        f"+refs/heads/{base_ref}:{base_rev}",
+    ]
+
+    try:
+        t0 = time.perf_counter()
+        if "base" in [remote.name for remote in git_repo.remotes]:
+            git_repo.remotes.base.set_url(base_url)
+        else:
+            git_repo.create_remote("base", base_url)
+        subprocess.run(
+            fetch_base + [f"--depth={max(get_clone_depth(), 1)}"], cwd=cwd, check=True
+        )
+
+        deepen = MERGE_BASE_DEEPEN
+        for _ in range(MAX_DEEPEN_ATTEMPTS):
+            if _has_merge_base(git_repo, rev, base_rev) or not is_shallow(git_repo):
+                break
+            LOGGER.info("deepening clone by %d commits to find the merge base", deepen)
+            for cmd in [["git", "fetch", "--quiet", "origin"], fetch_base]:
+                subprocess.run(cmd + [f"--deepen={deepen}"], cwd=cwd, check=True)
+            deepen *= 2
+        else:
+            if is_shallow(git_repo):
+                LOGGER.info("unshallowing clone to find the merge base")
+                for cmd in [["git", "fetch", "--quiet", "origin"], fetch_base]:
+                    subprocess.run(cmd + ["--unshallow"], cwd=cwd, check=True)
+    except (subprocess.CalledProcessError, GitCommandError) as e:
+        LOGGER.warning("could not fetch the base branch: %r", e)
+        return None
+
+    ret = subprocess.run(
+        ["git", "merge-tree", "--write-tree", "--name-only", rev, base_rev],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    LOGGER.info(
+        "checked merge of %s into %s locally in %0.2f seconds (exit code %d)",
+        rev,
+        base_ref,
+        time.perf_counter() - t0,
+        ret.returncode,
+    )
+    if ret.returncode == 0:
+        return True
+    elif ret.returncode == 1:
+        # the first line is the tree, followed by the conflicted files
+        conflicts = ret.stdout.split("\n\n", 1)[0].splitlines()[1:]
+        LOGGER.info("merge conflicts in: %s", conflicts)
+        return False
+    else:
+        LOGGER.warning("could not check the merge locally: %s", ret.stderr.strip())
+        return None
+
+
+def get_recipe_trees(git_repo, recipes_path="recipes"):
+    """Get the git tree hashes of the recipe directories of a checkout (e.g.,
+    `{"recipes/foo": "<oid>"}`) from the trees under `recipes_path`."""
+    try:
+        tree = git_repo.head.commit.tree[recipes_path]
+    except KeyError:
+        return {}
+    return {f"{recipes_path}/{subtree.name}": subtree.hexsha for subtree in tree.trees}
+
+
+def copy_recipes_subset(git_repo, recipe_dirs, dest):
+    """Copy the top-level files of a checkout and only the given recipe
+    directories to `dest`, so that linting `dest` lints only those recipes."""
+    src = git_repo.working_dir
+    os.makedirs(dest, exist_ok=True)
+    with os.scandir(src) as it:
+        for entry in it:
+            if entry.is_file(follow_symlinks=False):
+                shutil.copy2(entry.path, dest)
+    for recipe_dir in recipe_dirs:
+        shutil.copytree(
+            os.path.join(src, recipe_dir),
+            os.path.join(dest, recipe_dir),
+            symlinks=True,
+        )
+    return dest
+
+
+def get_mirror_cache():
+    """Get the mirror cache if `CF_WEBSERVICES_MIRROR_CACHE_DIR` is set.
+
+    The size cap in MB is read from `CF_WEBSERVICES_MIRROR_CACHE_MAX_SIZE_MB`.
+    """
+    root = os.environ.get("CF_WEBSERVICES_MIRROR_CACHE_DIR", "")
+    if not root:
+        return None
+
+    max_size_mb = int(
+        os.environ.get(
+            "CF_WEBSERVICES_MIRROR_CACHE_MAX_SIZE_MB",
+            DEFAULT_MIRROR_CACHE_MAX_SIZE_MB,
+        )
+    )
+    return MirrorCache(root, max_size=max_size_mb * 1024 * 1024)
+
+
+def _set_mirror_refspecs(path):
+    # fetch only branches and tags from upstream so that pruning does not
+    # remove the fork refs (or fetch every `refs/pull/*`)
+    subprocess.run(
+        ["git", "config", "--unset-all", "remote.origin.fetch"],
+        cwd=path,
+        check=False,
+    )
+    for refspec in ["+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"]:
+        subprocess.run(
+            ["git", "config", "--add", "remote.origin.fetch", refspec],
+            cwd=path,
+            check=True,
+        )
+
+
+def _dir_size(path):
+    tot = 0
+    for root, _, files in os.walk(path):
+        for fname in files:
+            fpath = os.path.join(root, fname)
+            if not os.path.islink(fpath):
+                tot += os.path.getsize(fpath)
+    return tot
+
+
+class MirrorCache:
+    """An on-disk cache of bare mirrors of GitHub repos.
+
+    Mirrors are keyed by `owner/repo` and used as `--reference` repos (i.e.,
+    git alternates) for clones. The branches of forks are fetched into the
+    mirror of their upstream repo under `refs/forks/<owner>/<repo>/`, so
+    only the objects a fork adds to its upstream are downloaded and stored.
+    Several processes can share a cache:
+
+    - fetches into a mirror are serialized by an exclusive lock on
+      `<mirror>.fetch.lock`
+    - a process that uses a mirror as a reference holds a shared lock on
+      `<mirror>.lock` until `release` is called or the process exits
+    - eviction only removes mirrors whose `<mirror>.lock` it can take
+      exclusively, so mirrors in use by clones are never removed
+
+    Eviction is least-recently-used based on the mtime of `<mirror>.used`
+    and runs after each update until the cache is under `max_size` bytes.
+    """
+
+    def __init__(self, root, max_size, url_template="https://github.com/{repo}.git"):
+        self.root = root
+        self.max_size = max_size
+        self.url_template = url_template
+        self._held_locks = {}
+        os.makedirs(os.path.join(self.root, "mirrors"), exist_ok=True)
+
+    def _mirror_path(self, repo):
+        owner, name = repo.split("/")
+        return os.path.join(self.root, "mirrors", f"{owner}__{name}.git")
+
+    @staticmethod
+    def _lock(path, mode):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, mode)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    @staticmethod
+    def _unlock(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    def update(self, repo, forks=None):
+        """Create or incrementally fetch the mirror of `repo` and fetch the
+        branches of its `forks` into it.
+
+        Returns the path to the mirror.
+        """
+        url = self.url_template.format(repo=repo)
+        pth = self._mirror_path(repo)
+        fd = self._lock(pth + ".fetch.lock", fcntl.LOCK_EX)
+        try:
+            t0 = time.perf_counter()
+            if os.path.exists(pth):
+                _set_mirror_refspecs(pth)
+                subprocess.run(
+                    ["git", "fetch", "--quiet", "--prune", "origin"],
+                    cwd=pth,
+                    check=True,
+                )
+            else:
+                # clone to a temporary path so a failed clone never shows up
+                # as a mirror
+                tmp_pth = tempfile.mkdtemp(
+                    dir=os.path.dirname(pth), prefix=".tmp-mirror-"
+                )
+                try:
+                    subprocess.run(
+                        ["git", "clone", "--quiet", "--mirror", url, tmp_pth],
+                        check=True,
+                    )
+                    # never gc the mirror since clones using it as a reference
+                    # may need objects that are unreachable in the mirror
+                    subprocess.run(
+                        ["git", "config", "gc.auto", "0"],
+                        cwd=tmp_pth,
+                        check=True,
+                    )
+                    _set_mirror_refspecs(tmp_pth)
+                    os.rename(tmp_pth, pth)
+                finally:
+                    shutil.rmtree(tmp_pth, ignore_errors=True)
+
+            for fork in dict.fromkeys(forks or []):
+                if fork.lower() == repo.lower():
+                    continue
+                subprocess.run(
+                    [
+                        "git",
+                        "fetch",
+                        "--quiet",
+                        "--prune",
+                        self.url_template.format(repo=fork),
+                        f"+refs/heads/*:refs/forks/{fork}/heads/*",
+                    ],
+                    cwd=pth,
+                    check=True,
+                )
+            LOGGER.info(
+                "updated mirror of %s w/ forks %s in %0.2f seconds",
+                repo,
+                forks or [],
+                time.perf_counter() - t0,
+            )
+        finally:
+            self._unlock(fd)
+
+        with open(pth + ".used", "w"):
+            pass
+        os.utime(pth + ".used")
+        return pth
+
+    def acquire(self, repo):
+        """Mark the mirror of `repo` as in use by this process."""
+        if repo not in self._held_locks:
+            self._held_locks[repo] = self._lock(
+                self._mirror_path(repo) + ".lock", fcntl.LOCK_SH
+            )
+
+    def release(self, repo=None):
+        """Release the mirror of `repo` (or all mirrors) for eviction."""
+        repos = [repo] if repo is not None else list(self._held_locks)
+        for _repo in repos:
+            fd = self._held_locks.pop(_repo, None)
+            if fd is not None:
+                self._unlock(fd)
+
+    def get_references(self, repo, forks=None):
+        """Update and acquire the mirror for `repo` and its `forks`, returning
+        the paths of the mirrors to use as references."""
+        self.acquire(repo)
+        paths = [self.update(repo, forks=forks)]
+        self.evict()
+        return paths
+
+    def evict(self):
+        """Remove least-recently-used mirrors until the cache is under its
+        size cap, skipping mirrors that are in use."""
+        fd = self._lock(os.path.join(self.root, ".evict.lock"), fcntl.LOCK_EX)
+        try:
+            mirrors = []
+            tot = 0
+            mirror_dir = os.path.join(self.root, "mirrors")
+            for fname in os.listdir(mirror_dir):
+                if not fname.endswith(".git"):
+                    continue
+                pth = os.path.join(mirror_dir, fname)
+                size = _dir_size(pth)
+                try:
+                    last_used = os.path.getmtime(pth + ".used")
+                except FileNotFoundError:
+                    last_used = 0
+                mirrors.append((last_used, size, pth))
+                tot += size
+
+            for _, size, pth in sorted(mirrors):
+                if tot <= self.max_size:
+                    break
+                try:
+                    use_fd = self._lock(pth + ".lock", fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                try:
+                    fetch_fd = self._lock(
+                        pth + ".fetch.lock", fcntl.LOCK_EX | fcntl.LOCK_NB
+                    )
+                except BlockingIOError:
+                    self._unlock(use_fd)
+                    continue
+                try:
+                    LOGGER.info("evicting mirror %s (%d bytes)", pth, size)
+                    shutil.rmtree(pth)
+                    tot -= size
+                    try:
+                        os.remove(pth + ".used")
+                    except FileNotFoundError:
+                        pass
+                finally:
+                    self._unlock(fetch_fd)
+                    self._unlock(use_fd)
+        finally:
+            self._unlock(fd)
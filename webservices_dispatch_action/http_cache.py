@@ -0,0 +1,229 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_HTTP_CACHE_MAX_SIZE_MB = 256
+
+# headers that are refreshed from a 304 response
+_REFRESHED_HEADERS = ("date", "x-ratelimit-")
+
+
+def get_http_cache(identify=None):
+    """Get the HTTP cache if `CF_WEBSERVICES_HTTP_CACHE_DIR` is set.
+
+    The size cap in MB is read from `CF_WEBSERVICES_HTTP_CACHE_MAX_SIZE_MB`.
+    See `HTTPCache` for `identify`.
+    """
+    root = os.environ.get("CF_WEBSERVICES_HTTP_CACHE_DIR", "")
+    if not root:
+        return None
+
+    max_size_mb = int(
+        os.environ.get(
+            "CF_WEBSERVICES_HTTP_CACHE_MAX_SIZE_MB",
+            DEFAULT_HTTP_CACHE_MAX_SIZE_MB,
+        )
+    )
+    return HTTPCache(root, max_size=max_size_mb * 1024 * 1024, identify=identify)
+
+
+class HTTPCache:
+    """An on-disk cache of GET responses revalidated w/ conditional requests.
+
+    Responses w/ an `ETag` or `Last-Modified` header are stored under a key
+    made from the URL and the identity behind the credentials of the request.
+    Tokens are short-lived, so keying on the identity (e.g., the bot a token
+    acts as) rather than the token itself lets later runs reuse responses.
+    Later requests for the same key send `If-None-Match`/`If-Modified-Since`
+    and a `304` from the server is turned back into the stored `200`. Cached
+    responses are never returned w/o the server confirming them for the
+    current token. GitHub does not count `304`s against the primary rate
+    limit.
+
+    Entries are evicted least-recently-used first once the cache is over its
+    size cap. Writes are atomic so the cache can be shared between processes.
+
+    Parameters
+    ----------
+    root : str
+        The directory of the cache.
+    max_size : int
+        The size cap of the cache in bytes.
+    identify : callable, optional
+        Called w/ a request to get a stable name for the identity behind its
+        credentials. If not given or if it returns None, the raw
+        `Authorization` header is used, so responses are never shared
+        between tokens.
+    """
+
+    def __init__(self, root, max_size, identify=None):
+        self.root = root
+        self.max_size = max_size
+        self.identify = identify
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _identity(self, request):
+        identity = self.identify(request) if self.identify is not None else None
+        if identity is None:
+            return "authorization:" + request.headers.get("Authorization", "")
+        return "identity:" + identity
+
+    def _path(self, request):
+        key = "\n".join(
+            [
+                request.url,
+                request.headers.get("Accept", ""),
+                self._identity(request),
+            ]
+        )
+        return os.path.join(
+            self.root, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json"
+        )
+
+    def _load(self, request):
+        pth = self._path(request)
+        try:
+            with open(pth) as fp:
+                entry = json.load(fp)
+        except (FileNotFoundError, ValueError):
+            return None
+        if entry["url"] != request.url:
+            return None
+        return entry
+
+    def prepare(self, request):
+        """Add validators for a cached response to a request.
+
+        Returns the cache entry, if any.
+        """
+        if request.method != "GET":
+            return None
+
+        entry = self._load(request)
+        if entry is not None:
+            headers = CaseInsensitiveDict(entry["headers"])
+            if "etag" in headers:
+                request.headers["If-None-Match"] = headers["etag"]
+            if "last-modified" in headers:
+                request.headers["If-Modified-Since"] = headers["last-modified"]
+        return entry
+
+    def handle(self, request, response, entry):
+        """Store a fresh response or turn a `304` into the cached response."""
+        if request.method != "GET":
+            return response
+
+        if response.status_code == 304 and entry is not None:
+            with self._lock:
+                self.stats["hits"] += 1
+            try:
+                os.utime(self._path(request))
+            except FileNotFoundError:
+                pass
+            return self._build_response(request, response, entry)
+
+        with self._lock:
+            self.stats["misses"] += 1
+        if response.status_code == 200 and (
+            "etag" in response.headers or "last-modified" in response.headers
+        ):
+            self._store(request, response)
+        return response
+
+    def _build_response(self, request, not_modified, entry):
+        headers = CaseInsensitiveDict(entry["headers"])
+        for k, v in not_modified.headers.items():
+            if k.lower().startswith(_REFRESHED_HEADERS):
+                headers[k] = v
+
+        resp = Response()
+        resp.status_code = entry["status"]
+        resp.reason = "OK"
+        resp.headers = headers
+        resp._content = base64.b64decode(entry["body"])
+        resp.encoding = get_encoding_from_headers(headers)
+        resp.url = request.url
+        resp.request = request
+        resp.connection = not_modified.connection
+        resp.elapsed = not_modified.elapsed
+        resp.from_cache = True
+        not_modified.close()
+        return resp
+
+    def _store(self, request, response):
+        data = json.dumps(
+            {
+                "url": request.url,
+                "status": response.status_code,
+                "headers": dict(response.headers),
+                "body": base64.b64encode(response.content).decode("ascii"),
+            }
+        )
+        pth = self._path(request)
+        fd, tmp_pth = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w") as fp:
+            fp.write(data)
+        os.replace(tmp_pth, pth)
+
+        with self._lock:
+            self.stats["stores"] += 1
+            self._size += len(data)
+            evict = self._size > self.max_size
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Remove least-recently-used entries until the cache is under its
+        size cap."""
+        with self._lock:
+            entries = self._entries()
+            tot = sum(size for _, size, _ in entries)
+            for _, size, pth in sorted(entries):
+                if tot <= self.max_size:
+                    break
+                try:
+                    os.remove(pth)
+                except FileNotFoundError:
+                    pass
+                tot -= size
+                self.stats["evictions"] += 1
+            self._size = tot
+
+    def log_stats(self):
+        num = self.stats["hits"] + self.stats["misses"]
+        LOGGER.info(
+            "http cache: %d/%d GETs revalidated w/ 304 (%0.1f%% hit ratio), "
+            "%d stored, %d evicted, %0.1f MB on disk",
+            self.stats["hits"],
+            num,
+            100 * self.stats["hits"] / num if num else 0.0,
+            self.stats["stores"],
+            self.stats["evictions"],
+            self._size / 1e6,
+        )
@@ -0,0 +1,70 @@
+import atexit
+import logging
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+
+class IdentityMap:
+    """A run-scoped map of GitHub objects so each one is fetched once.
+
+    Repos are keyed by their full name, PRs by (repo, number) and commits by
+    (repo, sha). Every lookup returns the same object for the same key.
+    Objects updated in place by our own writes (e.g., `pr.edit`) stay valid,
+    while callers that change an object some other way must `invalidate` it.
+    All reads in a run go through one token, so objects are shared between
+    clients.
+    """
+
+    def __init__(self):
+        self.saved_calls = 0
+        self._objs = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key, fetch):
+        with self._lock:
+            if key in self._objs:
+                self.saved_calls += 1
+                return self._objs[key]
+        obj = fetch()
+        with self._lock:
+            return self._objs.setdefault(key, obj)
+
+    def get_repo(self, gh, repo_name):
+        return self._get(("repo", repo_name.lower()), lambda: gh.get_repo(repo_name))
+
+    def get_pull(self, repo, number, fetch=None):
+        """Get a PR, fetching it w/ `fetch()` (default `repo.get_pull`) if
+        it is not in the map."""
+        return self._get(
+            ("pull", repo.full_name.lower(), int(number)),
+            fetch if fetch is not None else lambda: repo.get_pull(int(number)),
+        )
+
+    def get_commit(self, repo, sha):
+        return self._get(
+            ("commit", repo.full_name.lower(), sha), lambda: repo.get_commit(sha)
+        )
+
+    def invalidate(self, kind, *key):
+        """Drop an object (e.g., `invalidate("pull", "o/r", 5)`) so that the
+        next lookup fetches it again."""
+        key = tuple(k.lower() if isinstance(k, str) else k for k in key)
+        with self._lock:
+            self._objs.pop((kind, *key), None)
+
+    def clear(self):
+        with self._lock:
+            self._objs.clear()
+            self.saved_calls = 0
+
+    def log_stats(self):
+        LOGGER.info(
+            "identity map: saved %d API calls w/ %d objects",
+            self.saved_calls,
+            len(self._objs),
+        )
+
+
+RUN_IDENTITY_MAP = IdentityMap()
+atexit.register(RUN_IDENTITY_MAP.log_stats)
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+# some lints depend on the state of conda-forge (e.g., whether a feedstock
+# already exists), so results expire after a while
+DEFAULT_LINT_CACHE_MAX_AGE_HOURS = 24
+
+
+def get_lint_max_age():
+    """Get the maximum age in seconds of reused lint results.
+
+    The age in hours is read from `CF_WEBSERVICES_LINT_CACHE_MAX_AGE_HOURS`.
+    """
+    max_age_hours = float(
+        os.environ.get(
+            "CF_WEBSERVICES_LINT_CACHE_MAX_AGE_HOURS",
+            DEFAULT_LINT_CACHE_MAX_AGE_HOURS,
+        )
+    )
+    return max_age_hours * 3600
+
+
+def get_lint_cache(linter_version):
+    """Get the lint cache if `CF_WEBSERVICES_LINT_CACHE_DIR` is set and the
+    linter version is known.
+
+    Entries expire after `get_lint_max_age()` seconds.
+    """
+    root = os.environ.get("CF_WEBSERVICES_LINT_CACHE_DIR", "")
+    if not root or linter_version is None:
+        return None
+
+    return LintCache(root, linter_version, max_age=get_lint_max_age())
+
+
+class LintCache:
+    """An on-disk cache of the lints and hints of single recipes.
+
+    Entries are keyed by the linter version, the path of the recipe directory
+    and its git tree hash, so a recipe is only linted again if its contents
+    or the linter change. Entries older than `max_age` are ignored and
+    removed. Writes are atomic so the cache can be shared between processes.
+
+    Parameters
+    ----------
+    root : str
+        The directory of the cache.
+    linter_version : str
+        The version of the linter that made the results.
+    max_age : float
+        The maximum age of entries in seconds.
+    """
+
+    def __init__(self, root, linter_version, max_age):
+        self.root = root
+        self.linter_version = linter_version
+        self.max_age = max_age
+        self.stats = {"hits": 0, "misses": 0}
+        os.makedirs(self.root, exist_ok=True)
+        self.prune()
+
+    def _path(self, recipe_dir, tree_oid):
+        key = "\n".join([self.linter_version, recipe_dir, tree_oid])
+        return os.path.join(
+            self.root, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json"
+        )
+
+    def get(self, recipe_dir, tree_oid):
+        """Get the `(lints, hints)` of a recipe or None if not cached."""
+        pth = self._path(recipe_dir, tree_oid)
+        try:
+            if time.time() - os.path.getmtime(pth) > self.max_age:
+                raise FileNotFoundError(pth)
+            with open(pth) as fp:
+                entry = json.load(fp)
+        except (FileNotFoundError, ValueError):
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["hits"] += 1
+        LOGGER.info("lint cache hit for %s (%s)", recipe_dir, tree_oid)
+        return entry["lints"], entry["hints"]
+
+    def put(self, recipe_dir, tree_oid, lints, hints):
+        """Store the `(lints, hints)` of a recipe."""
+        fd, tmp_pth = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w") as fp:
+            json.dump({"lints": lints, "hints": hints}, fp)
+        os.replace(tmp_pth, self._path(recipe_dir, tree_oid))
+
+    def prune(self):
+        """Remove expired entries."""
+        now = time.time()
+        with os.scandir(self.root) as it:
+            for entry in it:
+                try:
+                    if now - entry.stat().st_mtime > self.max_age:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def log_stats(self):
+        LOGGER.info(
+            "lint cache: %d hits, %d misses",
+            self.stats["hits"],
+            self.stats["misses"],
+        )
@@ -0,0 +1,108 @@
+import logging
+import multiprocessing
+import multiprocessing.forkserver
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from . import global_sensitive_env
+
+LOGGER = logging.getLogger(__name__)
+
+# the modules that make linting slow to start
+LINT_PRELOAD_MODULES = [
+    "conda_forge_feedstock_ops.lint",
+    "conda_smithy.lint_recipe",
+    "conda_build.metadata",
+    "jinja2",
+    "ruamel.yaml",
+    "yaml",
+]
+
+
+def get_lint_jobs():
+    """Get the maximum number of recipes linted at once from
+    `CF_WEBSERVICES_LINT_JOBS` (default: the number of CPUs)."""
+    return max(int(os.environ.get("CF_WEBSERVICES_LINT_JOBS", os.cpu_count() or 1)), 1)
+
+
+def _lint_in_child(feedstock_dir):
+    from conda_forge_feedstock_ops.lint import lint as lint_feedstock
+
+    return lint_feedstock(feedstock_dir, use_container=False)
+
+
+class WarmWorkerPool:
+    """A pool of isolated workers forked from a warm fork server.
+
+    The fork server is a fresh interpreter that imports `preload_modules` once.
+    Each task then runs in a new child forked from it, so tasks are isolated
+    from each other and from this process w/o paying for interpreter startup
+    and imports. The fork server is started w/ an environment w/o the tokens
+    held by `SensitiveEnv` or the ssh agent, which its children inherit. The
+    children run as the same user though, so this process must not have the
+    tokens in its initial environment and must not be dumpable (see
+    `SensitiveEnv.load_secrets_file` and `make_process_undumpable`).
+
+    Parameters
+    ----------
+    preload_modules : list of str, optional
+        The modules to import in the fork server. Modules that fail to import
+        are skipped.
+    max_workers : int, optional
+        The maximum number of tasks to run at once.
+    """
+
+    def __init__(self, preload_modules=None, max_workers=1):
+        self._ctx = multiprocessing.get_context("forkserver")
+        self._ctx.set_forkserver_preload(
+            LINT_PRELOAD_MODULES if preload_modules is None else preload_modules
+        )
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=self._ctx,
+            max_tasks_per_child=1,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def warm_up(self):
+        """Start the fork server now so that it imports the preloaded modules
+        in the background before the first task."""
+        t0 = time.perf_counter()
+        self._ensure_fork_server()
+        LOGGER.info(
+            "started the fork server in %0.2f seconds", time.perf_counter() - t0
+        )
+
+    def _ensure_fork_server(self):
+        # the fork server copies environ when started, so it must never be
+        # started by the executor w/ the tokens revealed
+        with global_sensitive_env.untrusted_env():
+            multiprocessing.forkserver.ensure_running()
+
+    def submit(self, fn, *args, **kwargs):
+        self._ensure_fork_server()
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def run(self, fn, *args, **kwargs):
+        return self.submit(fn, *args, **kwargs).result()
+
+    def lint(self, feedstock_dir):
+        """Lint a feedstock in a fresh child, returning `(lints, hints)`."""
+        t0 = time.perf_counter()
+        try:
+            return self.run(_lint_in_child, feedstock_dir)
+        finally:
+            LOGGER.info(
+                "linted %s in a warm worker in %0.2f seconds",
+                feedstock_dir,
+                time.perf_counter() - t0,
+            )
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
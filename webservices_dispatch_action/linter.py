@@ -1,16 +1,129 @@
+import hashlib
+import json
+import logging
+import re
 import textwrap
 import time
 
+from .git_utils import check_mergeable
+from .identity_map import RUN_IDENTITY_MAP
+from .lint_cache import get_lint_max_age
+from .pr_snapshot import PRSnapshot
+
+LOGGER = logging.getLogger(__name__)
+
+# GitHub is polled for `mergeable` w/ a backoff up to this many times
+MERGEABLE_POLL_ATTEMPTS = 8
+MERGEABLE_POLL_MAX_DELAY = 16.0
+
+# the directories the linter reads besides the files at the top of the repo,
+# which are the only ones in the sparse checkout for linting
+LINT_INPUT_DIRS = ["recipe", "recipes", ".ci_support", ".github"]
+# the paths whose contents determine the lint results of a PR
+LINT_FINGERPRINT_PATHS = LINT_INPUT_DIRS + ["conda-forge.yml"]
+_LINT_MARKER_RE = re.compile(r"<!-- conda-forge-linter: (\{.*?\}) -->")
+# the lint results that can be reused for a new head w/ the same fingerprint
+REUSABLE_LINT_STATUSES = ("good", "mixed", "bad", "no recipes")
+# the example recipes of staged-recipes are never reported
+EXCLUDED_RECIPES = ["recipes/example/meta.yaml", "recipes/example-v1/recipe.yaml"]
+RECIPE_FILENAMES = ("meta.yaml", "recipe.yaml")
+# the default of `build_and_make_lint_comment` to check if the PR is mergeable
+_CHECK_MERGEABLE = object()
+
+
+def _is_mergeable(repo, pr_id, snapshot=None, git_repo=None):
+    """Check if a PR can be merged w/o conflicts.
+
+    GitHub's flag is used if the snapshot has it. Otherwise the merge is
+    checked locally in `git_repo`, if given, and GitHub is polled w/ a
+    bounded backoff only if that fails. None is returned if GitHub has not
+    decided by then.
+    """
+    if snapshot is not None:
+        if snapshot.state != "open":
+            return False
+        if snapshot.mergeable is not None:
+            return snapshot.mergeable
+
+        if git_repo is not None:
+            mergeable = check_mergeable(
+                git_repo,
+                "https://github.com/%s.git" % snapshot.repo_name,
+                snapshot.base.ref,
+            )
+            if mergeable is not None:
+                return mergeable
 
-def _is_mergeable(repo, pr_id):
-    mergeable = None
-    while mergeable is None:
-        time.sleep(1.0)
+    delay = 1.0
+    for _ in range(MERGEABLE_POLL_ATTEMPTS):
+        time.sleep(delay)
         pull_request = repo.get_pull(pr_id)
         if pull_request.state != "open":
             return False
-        mergeable = pull_request.mergeable
-    return mergeable
+        if pull_request.mergeable is not None:
+            return pull_request.mergeable
+        delay = min(delay * 2, MERGEABLE_POLL_MAX_DELAY)
+
+    LOGGER.warning(
+        "GitHub did not compute if %s#%s is mergeable",
+        repo.full_name,
+        pr_id,
+    )
+    return None
+
+
+def get_lint_fingerprint(git_repo, linter_version):
+    """Get a fingerprint of the lint inputs of a checkout from the git tree
+    hashes of `LINT_FINGERPRINT_PATHS` and the linter version."""
+    tree = git_repo.head.commit.tree
+    fingerprint = hashlib.sha256(linter_version.encode("utf-8"))
+    for path in LINT_FINGERPRINT_PATHS:
+        try:
+            oid = tree[path].hexsha
+        except KeyError:
+            oid = "-"
+        fingerprint.update(f"\n{path}:{oid}".encode("utf-8"))
+    return fingerprint.hexdigest()
+
+
+def get_previous_lint(comment, max_age=None):
+    """Get the `(fingerprint, status)` recorded in a lint comment, if any.
+
+    Results older than `max_age` seconds (by default `get_lint_max_age()`)
+    are ignored since some lints depend on the state of conda-forge.
+    """
+    if comment is None:
+        return None, None
+    match = _LINT_MARKER_RE.search(comment.body)
+    if match is None:
+        return None, None
+    try:
+        data = json.loads(match.group(1))
+    except ValueError:
+        return None, None
+
+    if max_age is None:
+        max_age = get_lint_max_age()
+    if time.time() - data.get("time", 0) > max_age:
+        return None, None
+    return data.get("fingerprint"), data.get("status")
+
+
+def get_recipes_to_lint(pr):
+    """Get the recipe files changed in a staged-recipes PR w/o the example
+    recipes. Only the lint results of these files are reported."""
+    return set(f.filename for f in pr.get_files() if f.filename not in EXCLUDED_RECIPES)
+
+
+def get_recipe_dirs_to_lint(pr):
+    """Get the recipe directories (e.g., `recipes/foo`) of a staged-recipes PR
+    that have lint results to report."""
+    recipe_dirs = set()
+    for fname in get_recipes_to_lint(pr):
+        parts = fname.split("/")
+        if len(parts) == 3 and parts[0] == "recipes" and parts[2] in RECIPE_FILENAMES:
+            recipe_dirs.add("/".join(parts[:2]))
+    return sorted(recipe_dirs)
 
 
 def _get_comment_state(comment):
@@ -50,17 +163,51 @@ def _get_comment_state(comment):
         return "good"
 
 
-def make_lint_comment(repo, pr_id, message):
-    pr = repo.get_pull(pr_id)
-    comment = None
-    for _comment in pr.get_issue_comments():
-        if (
-            "Hi! This is the friendly automated conda-forge-linting service."
-        ) in _comment.body:
-            comment = _comment
+def _without_lint_time(body):
+    """Drop the time from the marker of a lint comment so that a comment is
+    not edited only to refresh it."""
+
+    def _repl(match):
+        try:
+            data = json.loads(match.group(1))
+        except ValueError:
+            return match.group(0)
+        data.pop("time", None)
+        return "<!-- conda-forge-linter: %s -->" % json.dumps(data)
+
+    return _LINT_MARKER_RE.sub(_repl, body)
+
+
+def _is_lint_comment(body):
+    return "Hi! This is the friendly automated conda-forge-linting service." in body
+
+
+def _get_snapshot(repo, pr_id, snapshot=None):
+    """Get the snapshot of a PR, if any, which may be the PR held by the
+    run's identity map."""
+    if snapshot is None:
+        pr = RUN_IDENTITY_MAP.get_pull(repo, pr_id)
+        if isinstance(pr, PRSnapshot):
+            snapshot = pr
+    return snapshot
+
+
+def make_lint_comment(repo, pr_id, message, snapshot=None):
+    snapshot = _get_snapshot(repo, pr_id, snapshot=snapshot)
+    if snapshot is not None:
+        pr = snapshot
+        comment = snapshot.find_comment(
+            _is_lint_comment, status_context="conda-forge-linter"
+        )
+    else:
+        pr = RUN_IDENTITY_MAP.get_pull(repo, pr_id)
+        comment = None
+        for _comment in pr.get_issue_comments():
+            if _is_lint_comment(_comment.body):
+                comment = _comment
 
     if comment:
-        if comment.body != message:
+        if _without_lint_time(comment.body) != _without_lint_time(message):
             if _get_comment_state(comment.body) == _get_comment_state(message):
                 comment.edit(message)
                 msg = comment
@@ -74,9 +221,29 @@ def make_lint_comment(repo, pr_id, message):
     return msg
 
 
-def build_and_make_lint_comment(gh, repo, pr_id, lints, hints):
-    mergeable = _is_mergeable(repo, pr_id)
-    if not mergeable:
+def build_and_make_lint_comment(
+    gh,
+    repo,
+    pr_id,
+    lints,
+    hints,
+    mergeable=_CHECK_MERGEABLE,
+    snapshot=None,
+    fingerprint=None,
+    has_recipes=None,
+):
+    """Post the lint comment for a PR and return it w/ the lint status.
+
+    `mergeable` is checked w/ GitHub if not given. If it is None (unknown),
+    the lints are reported but not recorded for reuse.
+
+    `has_recipes` tells if the checkout had any recipes when only some of
+    them were linted. By default it is true if there are lint results.
+    """
+    snapshot = _get_snapshot(repo, pr_id, snapshot=snapshot)
+    if mergeable is _CHECK_MERGEABLE:
+        mergeable = _is_mergeable(repo, pr_id, snapshot=snapshot)
+    if mergeable is False:
         message = textwrap.dedent("""
             Hi! This is the friendly automated conda-forge-linting service.
 
@@ -87,17 +254,15 @@ def build_and_make_lint_comment(gh, repo, pr_id, lints, hints):
             """)  # noqa
         status = "merge_conflict"
     else:
-        fnames = set(hints.keys()) | set(lints.keys())
+        fnames = sorted(set(hints.keys()) | set(lints.keys()))
 
         if repo.name == "staged-recipes":
-            pr = repo.get_pull(pr_id)
-            recipes_to_lint = set(f.filename for f in pr.get_files())
-            recipes_to_lint = set(
-                fname
-                for fname in recipes_to_lint
-                if fname
-                not in ["recipes/example/meta.yaml", "recipes/example-v1/recipe.yaml"]
+            pr = (
+                snapshot
+                if snapshot is not None
+                else RUN_IDENTITY_MAP.get_pull(repo, pr_id)
             )
+            recipes_to_lint = get_recipes_to_lint(pr)
         else:
             recipes_to_lint = set(fnames)
 
@@ -159,7 +324,10 @@ def build_and_make_lint_comment(gh, repo, pr_id, lints, hints):
         """  # noqa: E501
         ).format("\n".join(messages))
 
-        if not fnames:
+        if has_recipes is None:
+            has_recipes = bool(fnames)
+
+        if not has_recipes:
             message = textwrap.dedent("""
                 Hi! This is the friendly automated conda-forge-linting service.
 
@@ -177,27 +345,40 @@ def build_and_make_lint_comment(gh, repo, pr_id, lints, hints):
             message = bad
             status = "bad"
 
-    msg = make_lint_comment(repo, pr_id, message)
+    if (
+        fingerprint is not None
+        and mergeable is not None
+        and status in REUSABLE_LINT_STATUSES
+    ):
+        message += "\n<!-- conda-forge-linter: %s -->\n" % json.dumps(
+            {"fingerprint": fingerprint, "status": status, "time": int(time.time())}
+        )
+
+    msg = make_lint_comment(repo, pr_id, message, snapshot=snapshot)
 
     return msg, status
 
 
-def set_pr_status(repo, sha, status, target_url=None):
+def set_pr_status(repo, sha, status, target_url=None, snapshot=None):
     if target_url is not None:
         kwargs = {"target_url": target_url}
     else:
         kwargs = {}
 
-    commit = repo.get_commit(sha)
-
-    # get the last github status by the linter, if any
-    # API emits these in reverse time order so first is latest
-    statuses = commit.get_statuses()
-    last_status = None
-    for _status in statuses:
-        if _status.context == "conda-forge-linter":
-            last_status = _status
-            break
+    if snapshot is not None and snapshot.head.sha == sha:
+        commit = snapshot
+        last_status = snapshot.get_status("conda-forge-linter")
+    else:
+        commit = RUN_IDENTITY_MAP.get_commit(repo, sha)
+
+        # get the last github status by the linter, if any
+        # API emits these in reverse time order so first is latest
+        statuses = commit.get_statuses()
+        last_status = None
+        for _status in statuses:
+            if _status.context == "conda-forge-linter":
+                last_status = _status
+                break
 
     # convert the linter status to a state
     lint_status_to_state = {"good": "success", "mixed": "success", "pending": "pending"}
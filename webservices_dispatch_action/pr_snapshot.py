@@ -0,0 +1,375 @@
+import logging
+import math
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import requests
+
+from .api_sessions import graphql, rest
+
+LOGGER = logging.getLogger(__name__)
+
+# the number of most recent comments fetched w/ the snapshot
+NUM_SNAPSHOT_COMMENTS = 100
+# the number of most recent commits whose statuses are fetched w/ the snapshot
+NUM_SNAPSHOT_COMMITS = 20
+# the pages of all comments are fetched w/ at most this many at once
+COMMENTS_PER_PAGE = 100
+MAX_CONCURRENT_PAGES = 8
+
+PR_SNAPSHOT_QUERY = """
+query(
+  $owner: String!, $name: String!, $number: Int!,
+  $numComments: Int!, $numCommits: Int!
+) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      id
+      number
+      state
+      title
+      isDraft
+      mergeable
+      author { login }
+      headRefName
+      headRefOid
+      headRepository { name owner { login } }
+      baseRefName
+      files(first: 100) {
+        pageInfo { hasNextPage endCursor }
+        nodes { path }
+      }
+      comments(last: $numComments) {
+        totalCount
+        nodes { databaseId url body }
+      }
+      commits(last: $numCommits) {
+        nodes {
+          commit {
+            oid
+            status { contexts { context state targetUrl description } }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+PR_FILES_QUERY = """
+query($owner: String!, $name: String!, $number: Int!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      files(first: 100, after: $cursor) {
+        pageInfo { hasNextPage endCursor }
+        nodes { path }
+      }
+    }
+  }
+}
+"""
+
+_MERGEABLE = {"MERGEABLE": True, "CONFLICTING": False}
+_COMMENT_URL_RE = re.compile(r"#issuecomment-(\d+)$")
+
+
+class SnapshotComment:
+    """An issue comment on a PR, read from a `PRSnapshot`."""
+
+    def __init__(self, snapshot, id, body, html_url):
+        self._snapshot = snapshot
+        self.id = id
+        self.body = body
+        self.html_url = html_url
+
+    def edit(self, body):
+        rest(
+            "PATCH",
+            "/repos/%s/issues/comments/%s" % (self._snapshot.repo_name, self.id),
+            self._snapshot._github_token,
+            json={"body": body},
+        )
+        self.body = body
+
+
+class PRSnapshot:
+    """The state of a PR needed by a dispatch, fetched w/ one GraphQL query.
+
+    The snapshot mimics the parts of `github.PullRequest.PullRequest` used
+    by this package (e.g., `head.ref`, `head.repo.owner.login`, `draft`,
+    `create_issue_comment`) so that it can be passed where a PR is expected.
+    Our own writes through the snapshot (comments, statuses, edits) are
+    recorded in it so that it stays current for the rest of the run.
+
+    Parameters
+    ----------
+    repo : github.Repository.Repository
+        The base repo of the PR.
+    data : dict
+        The `pullRequest` data from `PR_SNAPSHOT_QUERY`.
+    files : list of str
+        The paths of all files changed in the PR.
+    github_token : str
+        The GitHub access token used for writes.
+    """
+
+    def __init__(self, repo, data, files, github_token):
+        self._github_token = github_token
+        self.repo_name = repo.full_name
+        self.number = data["number"]
+        self.node_id = data["id"]
+        self.state = "open" if data["state"] == "OPEN" else "closed"
+        self.title = data["title"]
+        self.draft = data["isDraft"]
+        self.mergeable = _MERGEABLE.get(data["mergeable"])
+        self.user = SimpleNamespace(
+            login=(data["author"] or {}).get("login"),
+        )
+
+        head_repo = data["headRepository"]
+        self.head = SimpleNamespace(
+            ref=data["headRefName"],
+            sha=data["headRefOid"],
+            repo=(
+                SimpleNamespace(
+                    name=head_repo["name"],
+                    owner=SimpleNamespace(login=head_repo["owner"]["login"]),
+                )
+                if head_repo is not None
+                else None
+            ),
+        )
+        self.base = SimpleNamespace(ref=data["baseRefName"], repo=repo)
+
+        self.files = [SimpleNamespace(filename=fname) for fname in files]
+
+        self.comments = [
+            SnapshotComment(self, c["databaseId"], c["body"], c["url"])
+            for c in data["comments"]["nodes"]
+        ]
+        self.num_comments = data["comments"]["totalCount"]
+
+        # the statuses of the head commit and the target URLs of the
+        # statuses on recent commits, newest first
+        self.statuses = {}
+        self.status_target_urls = {}
+        for commit in reversed(data["commits"]["nodes"]):
+            for ctx in (commit["commit"]["status"] or {}).get("contexts", []):
+                if ctx["targetUrl"]:
+                    self.status_target_urls.setdefault(ctx["context"], []).append(
+                        ctx["targetUrl"]
+                    )
+                if commit["commit"]["oid"] == self.head.sha:
+                    self.statuses[ctx["context"]] = SimpleNamespace(
+                        context=ctx["context"],
+                        state=ctx["state"].lower(),
+                        target_url=ctx["targetUrl"],
+                        description=ctx["description"],
+                    )
+
+    def get_files(self):
+        return self.files
+
+    def _get_comment_from_status(self, status_context, predicate):
+        # the target URL of our last status points at the comment we made
+        # for it, e.g., https://github.com/o/r/pull/1#issuecomment-123
+        urls = self.status_target_urls.get(status_context, [])
+        if not urls:
+            return None
+        match = _COMMENT_URL_RE.search(urls[0])
+        if match is None:
+            return None
+
+        try:
+            data = rest(
+                "GET",
+                "/repos/%s/issues/comments/%s" % (self.repo_name, match.group(1)),
+                self._github_token,
+            )
+        except requests.HTTPError as e:
+            LOGGER.info("the comment at %s is gone: %r", urls[0], e)
+            return None
+
+        if not data["issue_url"].endswith("/issues/%s" % self.number) or not predicate(
+            data["body"]
+        ):
+            LOGGER.info("the comment at %s is stale", urls[0])
+            return None
+        return SnapshotComment(self, data["id"], data["body"], data["html_url"])
+
+    def find_comment(self, predicate, status_context=None):
+        """Find the latest issue comment whose body matches `predicate`.
+
+        Only the most recent comments are in the snapshot. If none of them
+        match, the comment that the last status w/ `status_context` points to
+        is fetched directly. All comments are fetched (w/ the pages in
+        parallel) only if there is no such status or it is stale.
+        """
+        for comment in reversed(self.comments):
+            if predicate(comment.body):
+                return comment
+
+        if self.num_comments <= len(self.comments):
+            return None
+
+        if status_context is not None:
+            comment = self._get_comment_from_status(status_context, predicate)
+            if comment is not None:
+                # older than the rest, but keep it for later lookups
+                self.comments.insert(0, comment)
+                return comment
+
+        LOGGER.info(
+            "scanning all %d comments on %s#%s",
+            self.num_comments,
+            self.repo_name,
+            self.number,
+        )
+        self.comments = [
+            SnapshotComment(self, c["id"], c["body"], c["html_url"])
+            for c in self._get_all_comments()
+        ]
+        self.num_comments = len(self.comments)
+        for comment in reversed(self.comments):
+            if predicate(comment.body):
+                return comment
+        return None
+
+    def _get_all_comments(self):
+        path = "/repos/%s/issues/%s/comments" % (self.repo_name, self.number)
+        num_pages = max(math.ceil(self.num_comments / COMMENTS_PER_PAGE), 1)
+        with ThreadPoolExecutor(
+            max_workers=min(num_pages, MAX_CONCURRENT_PAGES)
+        ) as executor:
+            pages = executor.map(
+                lambda page: rest(
+                    "GET",
+                    "%s?per_page=%d&page=%d" % (path, COMMENTS_PER_PAGE, page),
+                    self._github_token,
+                ),
+                range(1, num_pages + 1),
+            )
+            return [c for page in pages for c in page]
+
+    def create_issue_comment(self, body):
+        data = rest(
+            "POST",
+            "/repos/%s/issues/%s/comments" % (self.repo_name, self.number),
+            self._github_token,
+            json={"body": body},
+        )
+        comment = SnapshotComment(self, data["id"], data["body"], data["html_url"])
+        self.comments.append(comment)
+        self.num_comments += 1
+        return comment
+
+    def edit(self, **kwargs):
+        rest(
+            "PATCH",
+            "/repos/%s/pulls/%s" % (self.repo_name, self.number),
+            self._github_token,
+            json=kwargs,
+        )
+        if "title" in kwargs:
+            self.title = kwargs["title"]
+        if "state" in kwargs:
+            self.state = kwargs["state"]
+
+    def record_push(self, sha):
+        """Record that we pushed `sha` to the head branch."""
+        self.head.sha = sha
+        self.statuses = {}
+        self.mergeable = None
+
+    def get_status(self, context):
+        """Get the latest status w/ `context` on the head commit, if any."""
+        return self.statuses.get(context)
+
+    def create_status(self, state, description=None, context=None, target_url=None):
+        data = {"state": state, "context": context}
+        if description is not None:
+            data["description"] = description
+        if target_url is not None:
+            data["target_url"] = target_url
+        rest(
+            "POST",
+            "/repos/%s/statuses/%s" % (self.repo_name, self.head.sha),
+            self._github_token,
+            json=data,
+        )
+        self.statuses[context] = SimpleNamespace(
+            context=context,
+            state=state,
+            target_url=target_url,
+            description=description,
+        )
+        if target_url is not None:
+            self.status_target_urls.setdefault(context, []).insert(0, target_url)
+
+
+def fetch_pr_snapshot(repo, pr_num, github_token):
+    """Fetch a `PRSnapshot` of a PR.
+
+    Parameters
+    ----------
+    repo : github.Repository.Repository
+        The base repo of the PR.
+    pr_num : int
+        The PR number.
+    github_token : str
+        The GitHub access token.
+
+    Returns
+    -------
+    snapshot : PRSnapshot
+        The snapshot of the PR.
+    """
+    t0 = time.perf_counter()
+    owner, name = repo.full_name.split("/")
+    variables = {"owner": owner, "name": name, "number": pr_num}
+
+    data = graphql(
+        PR_SNAPSHOT_QUERY,
+        github_token,
+        variables={
+            **variables,
+            "numComments": NUM_SNAPSHOT_COMMENTS,
+            "numCommits": NUM_SNAPSHOT_COMMITS,
+        },
+    )
+    if data.get("errors") or not data.get("data"):
+        raise RuntimeError(
+            "Could not fetch PR %s#%s: %s"
+            % (repo.full_name, pr_num, data.get("errors", data))
+        )
+    pr_data = data["data"]["repository"]["pullRequest"]
+
+    num_queries = 1
+    files = [node["path"] for node in pr_data["files"]["nodes"]]
+    page_info = pr_data["files"]["pageInfo"]
+    while page_info["hasNextPage"]:
+        data = graphql(
+            PR_FILES_QUERY,
+            github_token,
+            variables={**variables, "cursor": page_info["endCursor"]},
+        )
+        if data.get("errors") or not data.get("data"):
+            raise RuntimeError(
+                "Could not fetch the files of PR %s#%s: %s"
+                % (repo.full_name, pr_num, data.get("errors", data))
+            )
+        _files = data["data"]["repository"]["pullRequest"]["files"]
+        files.extend(node["path"] for node in _files["nodes"])
+        page_info = _files["pageInfo"]
+        num_queries += 1
+
+    LOGGER.info(
+        "fetched snapshot of %s#%s w/ %d queries in %0.2f seconds",
+        repo.full_name,
+        pr_num,
+        num_queries,
+        time.perf_counter() - t0,
+    )
+    return PRSnapshot(repo, pr_data, files, github_token)
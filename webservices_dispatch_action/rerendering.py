@@ -6,10 +6,26 @@ import yaml
 from conda_forge_feedstock_ops.container_utils import ContainerRuntimeError
 from conda_forge_feedstock_ops.rerender import rerender as cf_feedstock_ops_rerender
 
+from .docker_utils import ContainerSessionError, should_use_container
+from .git_utils import ensure_history
+
 LOGGER = logging.getLogger(__name__)
 
 
-def rerender(git_repo, can_change_workflows):
+def _rerender_feedstock(feedstock_dir, session=None):
+    if session is None:
+        return cf_feedstock_ops_rerender(
+            feedstock_dir,
+            timeout=None,
+            use_container=should_use_container(),
+        )
+    return session.run_op(
+        "rerender",
+        {"feedstock_dir": session.container_path(feedstock_dir), "timeout": None},
+    )
+
+
+def rerender(git_repo, can_change_workflows, session=None):
     LOGGER.info("rerendering")
 
     info_message = None
@@ -19,12 +35,8 @@ def rerender(git_repo, can_change_workflows):
     curr_head = git_repo.active_branch.commit
 
     try:
-        msg = cf_feedstock_ops_rerender(
-            git_repo.working_dir,
-            timeout=None,
-            use_container=True,
-        )
-    except ContainerRuntimeError as e:
+        msg = _rerender_feedstock(git_repo.working_dir, session=session)
+    except (ContainerRuntimeError, ContainerSessionError) as e:
         LOGGER.error(f"Rerendering failed: {e}")
         ret = 1
     else:
@@ -45,6 +57,9 @@ def rerender(git_repo, can_change_workflows):
         changed, rerender_error = False, False
     else:
         if not can_change_workflows:
+            # shallow clones may not have the parent commit yet
+            ensure_history(git_repo, "HEAD~1")
+
             # warn the user if the workflows changed but we can't push them
             out = subprocess.run(
                 ["git", "diff", "--name-only", "HEAD~1", "HEAD"],
@@ -0,0 +1,127 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+LOGGER = logging.getLogger(__name__)
+
+
+class StageGraph:
+    """Run the stages of a dispatch concurrently in dependency order.
+
+    Each stage is a function that is called with the results of its
+    dependencies as positional arguments, in the order the dependencies are
+    listed. Independent stages run at the same time in a thread pool. If any
+    stage raises, no new stages are started and the exception is re-raised
+    from `run` w/o waiting for the stages still running.
+
+    Example
+    -------
+    >>> graph = StageGraph()
+    >>> graph.add("clone", clone)
+    >>> graph.add("pull", pull)
+    >>> graph.add("lint", lambda git_repo, _: lint(git_repo), deps=["clone", "pull"])
+    >>> results = graph.run()
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._stages = {}
+        self._futures = {}
+        self.timings = {}
+        self.failed_stage = None
+
+    def add(self, name, func, deps=()):
+        if name in self._stages:
+            raise ValueError("Stage %s was added twice!" % name)
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError("Stage %s depends on unknown stage %s!" % (name, dep))
+        self._stages[name] = (func, tuple(deps))
+
+    def _run_stage(self, name, t_start, args):
+        t0 = time.perf_counter()
+        try:
+            return self._stages[name][0](*args)
+        finally:
+            t1 = time.perf_counter()
+            self.timings[name] = (t0 - t_start, t1 - t_start)
+
+    def run(self):
+        """Run all stages, returning a dict of their results by name."""
+        results = {}
+        pending = dict(self._stages)
+        running = {}
+        t_start = time.perf_counter()
+        self._futures = {}
+        self.timings = {}
+        self.failed_stage = None
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.max_workers or max(len(self._stages), 1)
+        )
+        try:
+            while pending or running:
+                for name, (_, deps) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        fut = executor.submit(
+                            self._run_stage,
+                            name,
+                            t_start,
+                            [results[dep] for dep in deps],
+                        )
+                        running[fut] = name
+                        self._futures[name] = fut
+                        del pending[name]
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name = running.pop(fut)
+                    exc = fut.exception()
+                    if exc is not None:
+                        self.failed_stage = name
+                        LOGGER.error("stage %s failed: %s", name, repr(exc))
+                        raise exc
+                    results[name] = fut.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.log_timings()
+
+        return results
+
+    def wait_for(self, *names):
+        """Wait for stages that were started to finish, ignoring any errors.
+
+        W/o names, all started stages are waited for. This is useful after a
+        failure to make sure a stage w/ side effects (e.g., one using a
+        temporary directory) is not still running.
+        """
+        if not names:
+            names = tuple(self._futures)
+        futs = [self._futures[name] for name in names if name in self._futures]
+        wait(futs)
+
+    def critical_path(self):
+        """Get the chain of finished stages that determined the total run time."""
+        if not self.timings:
+            return []
+
+        name = max(self.timings, key=lambda n: self.timings[n][1])
+        path = [name]
+        while True:
+            deps = [dep for dep in self._stages[name][1] if dep in self.timings]
+            if not deps:
+                break
+            name = max(deps, key=lambda n: self.timings[n][1])
+            path.append(name)
+        return path[::-1]
+
+    def log_timings(self):
+        for name, (t0, t1) in sorted(self.timings.items(), key=lambda x: x[1]):
+            LOGGER.info("stage %s: started at %0.2f s, took %0.2f s", name, t0, t1 - t0)
+        path = self.critical_path()
+        if path:
+            LOGGER.info(
+                "critical path: %s (%0.2f s)",
+                " -> ".join(path),
+                self.timings[path[-1]][1],
+            )
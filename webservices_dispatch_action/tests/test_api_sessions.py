@@ -0,0 +1,220 @@
+import time
+
+import pytest
+
+from webservices_dispatch_action import api_sessions, global_sensitive_env
+
+
+class FakeGithub:
+    num_created = 0
+    reset_time = None
+
+    def __init__(self, token, **kwargs):
+        FakeGithub.num_created += 1
+        if token == "bad":
+            raise RuntimeError("bad credentials")
+        self.rate_limiting_resettime = FakeGithub.reset_time
+
+
+@pytest.fixture
+def tokens(monkeypatch):
+    info = dict(global_sensitive_env.classified_info)
+    FakeGithub.num_created = 0
+    FakeGithub.reset_time = time.time() + 3600
+    monkeypatch.setattr(api_sessions, "Github", FakeGithub)
+    api_sessions.clear_actor_token_cache()
+
+    def _set(rerendering_token):
+        global_sensitive_env.classified_info.update(
+            {
+                "INPUT_GITHUB_TOKEN": "default",
+                "INPUT_RERENDERING_GITHUB_TOKEN": rerendering_token,
+            }
+        )
+
+    yield _set
+
+    global_sensitive_env.classified_info.clear()
+    global_sensitive_env.classified_info.update(info)
+    api_sessions.clear_actor_token_cache()
+
+
+def test_get_actor_token_cached(tokens):
+    tokens("rerender")
+    for _ in range(3):
+        assert api_sessions.get_actor_token() == ("x-access-token", "rerender", True)
+    assert FakeGithub.num_created == 1
+    assert api_sessions.get_actor_token_cache_stats() == {"hits": 2, "misses": 1}
+
+    # a new token is validated again
+    tokens("other")
+    assert api_sessions.get_actor_token() == ("x-access-token", "other", True)
+    assert FakeGithub.num_created == 2
+
+
+def test_get_actor_token_refreshes_before_expiry(tokens):
+    FakeGithub.reset_time = time.time() + api_sessions.TOKEN_REFRESH_MARGIN / 2
+    tokens("rerender")
+    for _ in range(2):
+        assert api_sessions.get_actor_token()[2]
+    assert FakeGithub.num_created == 2
+    assert api_sessions.get_actor_token_cache_stats() == {"hits": 0, "misses": 2}
+
+
+def test_get_actor_token_fallback(tokens):
+    tokens("bad")
+    for _ in range(2):
+        assert api_sessions.get_actor_token() == ("x-access-token", "default", False)
+    assert FakeGithub.num_created == 1
+
+    tokens(None)
+    assert api_sessions.get_actor_token() == ("x-access-token", "default", False)
+    assert FakeGithub.num_created == 1
+
+
+def test_pooled_transport_is_shared():
+    adapter = api_sessions.get_http_adapter()
+    sess = api_sessions.get_http_session()
+    assert sess.get_adapter("https://api.github.com") is adapter
+
+    cnx = api_sessions.PooledHTTPSConnectionClass("api.github.com", timeout=15)
+    assert cnx.session is sess
+    cnx.close()
+    assert api_sessions.get_http_session() is sess
+
+    token_sess, gh = api_sessions.create_api_sessions("blah")
+    assert token_sess is not sess
+    assert token_sess.get_adapter("https://api.github.com") is adapter
+    assert api_sessions.create_api_sessions("blah")[1] is gh
+    assert api_sessions.create_api_sessions("other")[1] is not gh
+
+
+def test_pooled_transport_is_installed_explicitly():
+    from github.Requester import HTTPSRequestsConnectionClass, Requester
+
+    # importing the module does not change other PyGithub clients
+    assert Requester._Requester__httpsConnectionClass is HTTPSRequestsConnectionClass
+    try:
+        api_sessions.install_pooled_transport()
+        assert (
+            Requester._Requester__httpsConnectionClass
+            is api_sessions.PooledHTTPSConnectionClass
+        )
+    finally:
+        Requester.resetConnectionClasses()
+
+
+def test_graphql(monkeypatch):
+    calls = []
+
+    class FakeResponse:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"data": {"viewer": {"login": "blah"}}}
+
+    def _post(url, **kwargs):
+        calls.append((url, kwargs))
+        return FakeResponse()
+
+    monkeypatch.setattr(api_sessions.get_http_session(), "post", _post)
+    data = api_sessions.graphql("query { viewer { login } }", "tok", variables={})
+    assert data["data"]["viewer"]["login"] == "blah"
+    assert calls[0][0] == api_sessions.GRAPHQL_URL
+    assert calls[0][1]["headers"] == {"Authorization": "bearer tok"}
+    assert calls[0][1]["json"]["variables"] == {}
+
+
+class FakeRequest:
+    method = "GET"
+    url = "https://api.github.com/blah"
+    headers = {"Authorization": "token a"}
+
+
+class FakeRateLimitResponse:
+    def __init__(self, status_code, headers, text=""):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(api_sessions.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_governor_paces_before_reset(sleeps):
+    gov = api_sessions.RateLimitGovernor(pace_below=10)
+    reset = time.time() + 100
+    resp = FakeRateLimitResponse(
+        200, {"X-RateLimit-Remaining": "500", "X-RateLimit-Reset": str(reset)}
+    )
+    assert gov.check(FakeRequest(), resp, 0) is None
+    gov.wait(FakeRequest())
+    assert sleeps == []
+
+    # pauses are capped instead of spreading 4 requests over 100 seconds
+    resp.headers["X-RateLimit-Remaining"] = "4"
+    gov.check(FakeRequest(), resp, 0)
+    gov.wait(FakeRequest())
+    assert sleeps == [api_sessions.RATE_LIMIT_MAX_PACE_DELAY]
+    assert gov.num_throttled == 1
+
+    # once the limit is used up, requests wait for the reset
+    resp.headers["X-RateLimit-Remaining"] = "0"
+    gov.check(FakeRequest(), resp, 0)
+    gov.wait(FakeRequest())
+    assert len(sleeps) == 2 and 95 < sleeps[1] <= 101
+
+
+def test_governor_tracks_resources_separately(sleeps):
+    gov = api_sessions.RateLimitGovernor()
+    resp = FakeRateLimitResponse(
+        200,
+        {
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": str(time.time() + 100),
+            "X-RateLimit-Resource": "graphql",
+        },
+    )
+    graphql_request = FakeRequest()
+    graphql_request.url = "https://api.github.com/graphql"
+    gov.check(graphql_request, resp, 0)
+
+    gov.wait(FakeRequest())
+    assert sleeps == []
+    gov.wait(graphql_request)
+    assert len(sleeps) == 1
+
+
+@pytest.mark.parametrize(
+    "status_code,headers,text,min_delay,max_delay",
+    [
+        (403, {"Retry-After": "7"}, "", 7, 7),
+        (429, {}, "", 30, 60),
+        (403, {}, "You have exceeded a secondary rate limit.", 30, 60),
+        (403, {"X-RateLimit-Remaining": "0"}, "", 20, 22),
+    ],
+)
+def test_governor_backs_off(status_code, headers, text, min_delay, max_delay):
+    gov = api_sessions.RateLimitGovernor()
+    if "X-RateLimit-Remaining" in headers:
+        headers["X-RateLimit-Reset"] = str(time.time() + 20)
+    delay = gov.check(
+        FakeRequest(), FakeRateLimitResponse(status_code, headers, text), 0
+    )
+    assert min_delay <= delay <= max_delay
+
+
+def test_governor_gives_up():
+    gov = api_sessions.RateLimitGovernor(max_wait=10, max_retries=2)
+    assert gov.check(FakeRequest(), FakeRateLimitResponse(403, {}, "denied"), 0) is None
+    resp = FakeRateLimitResponse(403, {"Retry-After": "5"})
+    assert gov.check(FakeRequest(), resp, 2) is None
+    assert (
+        gov.check(FakeRequest(), FakeRateLimitResponse(403, {"Retry-After": "60"}), 0)
+        is None
+    )
@@ -0,0 +1,101 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+IMAGE = os.environ.get(
+    "CF_WEBSERVICES_TEST_IMAGE", "condaforge/webservices-dispatch-action:dev"
+)
+
+
+def _have_image():
+    if shutil.which("docker") is None:
+        return False
+    return (
+        subprocess.run(
+            ["docker", "image", "inspect", IMAGE], capture_output=True
+        ).returncode
+        == 0
+    )
+
+
+pytestmark = pytest.mark.skipif(
+    not _have_image(), reason=f"docker image {IMAGE} is not available"
+)
+
+
+def test_container_entrypoint_sources_saved_env():
+    # the conda shell function is only defined if the env is activated
+    out = subprocess.run(
+        [
+            "docker",
+            "run",
+            "--rm",
+            IMAGE,
+            "bash",
+            "-c",
+            'test -f "$CF_FEEDSTOCK_OPS_ENV_FILE" && echo $CONDA_PREFIX && '
+            "echo $PATH && (type -t conda || true)",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    prefix, path, *conda_type = out.stdout.splitlines()
+    assert prefix.endswith("/envs/cf-feedstock-ops")
+    assert path.split(":")[0] == prefix + "/bin"
+    assert conda_type != ["function"]
+
+
+def test_container_tools_resolve():
+    out = subprocess.run(
+        [
+            "docker",
+            "run",
+            "--rm",
+            IMAGE,
+            "bash",
+            "-c",
+            "echo $CONDA_PREFIX && command -v python git conda-smithy && "
+            "python -c 'import conda_smithy, conda_forge_feedstock_ops, "
+            "webservices_dispatch_action'",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    lines = out.stdout.splitlines()
+    prefix = lines[0]
+    assert prefix.endswith("/envs/cf-feedstock-ops")
+    for line in lines[1:]:
+        assert line.startswith(prefix + "/bin/")
+
+
+def test_container_keeps_runtime_env():
+    out = subprocess.run(
+        [
+            "docker",
+            "run",
+            "--rm",
+            "-e",
+            "HOME=/tmp",
+            "-e",
+            "PATH=/opt/extra/bin:/usr/bin:/bin",
+            "-e",
+            "CF_WEBSERVICES_TEST_VAR=blah",
+            IMAGE,
+            "bash",
+            "-c",
+            "echo $HOME && echo $PATH && echo $CF_WEBSERVICES_TEST_VAR",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    home, path, var = out.stdout.splitlines()
+    assert home == "/tmp"
+    assert var == "blah"
+    path = path.split(":")
+    assert path[0].endswith("/envs/cf-feedstock-ops/bin")
+    assert path[-3:] == ["/opt/extra/bin", "/usr/bin", "/bin"]
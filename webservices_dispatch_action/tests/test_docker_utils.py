@@ -0,0 +1,233 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from webservices_dispatch_action import docker_utils, global_sensitive_env
+
+
+class FakeDocker:
+    def __init__(self, local_digest, remote_digest, pull_returncode=0):
+        self.local_digest = local_digest
+        self.remote_digest = remote_digest
+        self.pull_returncode = pull_returncode
+        self.calls = []
+
+    def run(self, cmd, **kwargs):
+        self.calls.append(cmd[1])
+        if cmd[1] == "image":
+            if self.local_digest is None:
+                return subprocess.CompletedProcess(cmd, 1, stdout="", stderr="")
+            return subprocess.CompletedProcess(
+                cmd, 0, stdout=json.dumps([f"blah/img@{self.local_digest}"])
+            )
+        elif cmd[1] == "buildx":
+            return subprocess.CompletedProcess(
+                cmd, 0, stdout=json.dumps({"digest": self.remote_digest})
+            )
+        elif cmd[1] == "pull":
+            self.local_digest = self.remote_digest
+            return subprocess.CompletedProcess(cmd, self.pull_returncode)
+        raise AssertionError(cmd)
+
+
+@pytest.fixture
+def pull_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("CF_WEBSERVICES_DOCKER_PULL_CACHE_DIR", str(tmp_path))
+    monkeypatch.delenv("CF_WEBSERVICES_DOCKER_PULL_TTL", raising=False)
+    return tmp_path
+
+
+def test_pull_image_skips_matching_digest(pull_cache, monkeypatch):
+    docker = FakeDocker("sha256:a", "sha256:a")
+    monkeypatch.setattr(docker_utils.subprocess, "run", docker.run)
+    assert not docker_utils.pull_image("blah/img:prod")
+    assert "pull" not in docker.calls
+
+
+@pytest.mark.parametrize("local_digest", [None, "sha256:a"])
+def test_pull_image_pulls(pull_cache, monkeypatch, local_digest):
+    docker = FakeDocker(local_digest, "sha256:b")
+    monkeypatch.setattr(docker_utils.subprocess, "run", docker.run)
+    assert docker_utils.pull_image("blah/img:prod")
+    assert "pull" in docker.calls
+
+
+def test_pull_image_ttl(pull_cache, monkeypatch):
+    docker = FakeDocker(None, "sha256:b")
+    monkeypatch.setattr(docker_utils.subprocess, "run", docker.run)
+    monkeypatch.setenv("CF_WEBSERVICES_DOCKER_PULL_TTL", "3600")
+    assert docker_utils.pull_image("blah/img:prod")
+
+    docker.calls = []
+    assert not docker_utils.pull_image("blah/img:prod")
+    assert docker.calls == []
+
+
+def test_pull_image_raises_on_failure(pull_cache, monkeypatch):
+    docker = FakeDocker(None, "sha256:b", pull_returncode=1)
+    monkeypatch.setattr(docker_utils.subprocess, "run", docker.run)
+    with pytest.raises(RuntimeError, match="docker pull"):
+        docker_utils.pull_image("blah/img:prod")
+
+
+def test_container_session(tmp_path, monkeypatch):
+    workspace = tmp_path / "workspace"
+    feedstock = workspace / "feedstock"
+    (feedstock / ".git" / "hooks").mkdir(parents=True)
+    (feedstock / ".git" / "config").write_text("[core]\n")
+    (feedstock / "recipe").mkdir()
+    (feedstock / "recipe" / "meta.yaml").write_text("old")
+    (feedstock / "README.md").write_text("blah")
+
+    cmds = []
+    sessions = []
+
+    def _run(cmd, **kwargs):
+        cmds.append(cmd)
+        if cmd[:2] == ["docker", "run"]:
+            return subprocess.CompletedProcess(cmd, 0, stdout="abc123\n")
+        elif cmd[:2] == ["docker", "exec"]:
+            kwargs = json.loads(kwargs["input"])
+            staged = os.path.join(sessions[0].staging_dir, "feedstock")
+            # the container never sees the git dir of the workspace
+            assert not os.path.exists(os.path.join(staged, ".git"))
+            if cmd[-1] == "bad":
+                return subprocess.CompletedProcess(
+                    cmd, 0, stdout=json.dumps({"error": "ValueError()"}), stderr=""
+                )
+            if cmd[-1] == "old":
+                return subprocess.CompletedProcess(
+                    cmd, 0, stdout=json.dumps({"error": "KeyError('old')"}), stderr=""
+                )
+            if cmd[-1] == "plant":
+                os.makedirs(os.path.join(staged, ".git", "hooks"))
+                with open(os.path.join(staged, ".git", "hooks", "pre-commit"), "w"):
+                    pass
+                with open(os.path.join(staged, "recipe", "meta.yaml"), "w") as fp:
+                    fp.write("new")
+                os.remove(os.path.join(staged, "README.md"))
+                os.symlink("../.git/config", os.path.join(staged, "recipe", "cfg"))
+                os.symlink("/etc/passwd", os.path.join(staged, "recipe", "pw"))
+                os.symlink("meta.yaml", os.path.join(staged, "recipe", "link.yaml"))
+            return subprocess.CompletedProcess(
+                cmd, 0, stdout=json.dumps({"data": kwargs}), stderr="blah"
+            )
+        return subprocess.CompletedProcess(cmd, 0)
+
+    monkeypatch.setattr(docker_utils.subprocess, "run", _run)
+
+    with docker_utils.ContainerSession("blah/img:prod", str(workspace)) as session:
+        sessions.append(session)
+        pth = session.container_path(str(feedstock))
+        assert pth == "/cf_feedstock_ops_dir/feedstock"
+        with pytest.raises(ValueError):
+            session.container_path("/some/other/path")
+
+        # nothing is started until the first op
+        assert cmds == []
+        assert session.run_op("good", {"feedstock_dir": pth}) == {"feedstock_dir": pth}
+        assert session.run_op("good", {"a": 1}) == {"a": 1}
+        with pytest.raises(docker_utils.ContainerSessionError):
+            session.run_op("bad", {})
+        with pytest.raises(docker_utils.UnknownContainerOpError):
+            session.run_op("old", {})
+
+        session.run_op("plant", {})
+        staging_dir = session.staging_dir
+
+    # the changes come back w/o anything that could reach the git dir
+    assert (feedstock / "recipe" / "meta.yaml").read_text() == "new"
+    assert not (feedstock / "README.md").exists()
+    assert os.readlink(feedstock / "recipe" / "link.yaml") == "meta.yaml"
+    assert not os.path.lexists(feedstock / "recipe" / "cfg")
+    assert not os.path.lexists(feedstock / "recipe" / "pw")
+    assert os.listdir(feedstock / ".git" / "hooks") == []
+    assert (feedstock / ".git" / "config").read_text() == "[core]\n"
+
+    run_cmd = cmds[0]
+    assert run_cmd[:2] == ["docker", "run"]
+    assert f"type=bind,source={staging_dir},destination=/cf_feedstock_ops_dir" in (
+        run_cmd
+    )
+    assert not any("GIT_CONFIG" in arg for arg in run_cmd)
+    assert [cmd[1] for cmd in cmds].count("run") == 1
+    assert [cmd[1] for cmd in cmds].count("exec") == 5
+    assert [cmd[1] for cmd in cmds].count("pause") == 10
+    assert cmds[-1][:3] == ["docker", "rm", "--force"]
+    assert session.container_id is None
+    assert not os.path.exists(staging_dir)
+
+
+def test_sync_tree(tmp_path):
+    src = tmp_path / "src"
+    (src / "a" / ".git").mkdir(parents=True)
+    (src / "a" / ".git" / "HEAD").write_text("blah")
+    (src / "a" / "run.sh").write_text("#!/bin/bash")
+    (src / "a" / "run.sh").chmod(0o700)
+    (src / "b.txt").write_text("b")
+
+    dst = tmp_path / "dst"
+    (dst / ".git").mkdir(parents=True)
+    (dst / "c.txt").write_text("c")
+    docker_utils.sync_tree(str(src), str(dst))
+
+    assert sorted(os.listdir(dst)) == [".git", "a", "b.txt"]
+    assert os.listdir(dst / "a") == ["run.sh"]
+    assert (dst / "a" / "run.sh").stat().st_mode & 0o777 == 0o755
+    assert (dst / "b.txt").stat().st_mode & 0o777 == 0o644
+
+    docker_utils.sync_tree(str(src), str(dst), shared=True)
+    assert (dst / "a" / "run.sh").stat().st_mode & 0o777 == 0o777
+    assert (dst / "b.txt").stat().st_mode & 0o777 == 0o666
+
+
+def test_subprocess_session_scrubs_env(tmp_path, monkeypatch):
+    monkeypatch.setitem(
+        global_sensitive_env.classified_info, "INPUT_GITHUB_TOKEN", "secret"
+    )
+    monkeypatch.setenv("SSH_AUTH_SOCK", "/tmp/ssh-agent.sock")
+    (tmp_path / "feedstock" / ".git").mkdir(parents=True)
+
+    with docker_utils.SubprocessSession(str(tmp_path)) as session:
+        staging_dir = session.staging_dir
+        assert session.container_path(str(tmp_path / "feedstock")) == os.path.join(
+            staging_dir, "feedstock"
+        )
+        session.sync_to_container()
+        # the token is revealed in this process, e.g. by another thread
+        with global_sensitive_env.sensitive_env():
+            out = session.exec(
+                [
+                    sys.executable,
+                    "-c",
+                    "import json, os; "
+                    "print(json.dumps([os.getcwd(), dict(os.environ)]))",
+                ]
+            )
+
+    cwd, env = json.loads(out.stdout)
+    assert cwd == staging_dir
+    assert "INPUT_GITHUB_TOKEN" not in env
+    assert "SSH_AUTH_SOCK" not in env
+    assert env["CF_FEEDSTOCK_OPS_IN_CONTAINER"] == "true"
+    assert not os.path.exists(staging_dir)
+
+
+@pytest.mark.parametrize(
+    "env,in_container",
+    [
+        ({}, False),
+        ({"CF_WEBSERVICES_IN_CONTAINER": "true"}, True),
+        ({"CF_FEEDSTOCK_OPS_IN_CONTAINER": "true"}, True),
+    ],
+)
+def test_running_in_container(monkeypatch, env, in_container):
+    monkeypatch.delenv("CF_WEBSERVICES_IN_CONTAINER", raising=False)
+    monkeypatch.delenv("CF_FEEDSTOCK_OPS_IN_CONTAINER", raising=False)
+    for k, v in env.items():
+        monkeypatch.setenv(k, v)
+    assert docker_utils.running_in_container() is in_container
+    assert docker_utils.should_use_container() is not in_container
@@ -35,3 +35,31 @@ def test_double_sensitive_env(env_setup):
     s.reveal_env_vars()
     assert os.environ["pwd"] == "hello"
     assert os.environ["GH_TOKEN"] == "hi"
+
+
+def test_load_secrets_file(env_setup, tmp_path):
+    pth = tmp_path / "secrets"
+    pth.write_text("INPUT_GITHUB_TOKEN=hi\nINPUT_RERENDERING_GITHUB_TOKEN=\nHOME=no\n")
+    s = SensitiveEnv()
+
+    s.load_secrets_file(str(pth))
+    assert not pth.exists()
+    assert s.classified_info == {"INPUT_GITHUB_TOKEN": "hi"}
+    assert "INPUT_GITHUB_TOKEN" not in os.environ
+
+    with s.sensitive_env():
+        assert os.environ["INPUT_GITHUB_TOKEN"] == "hi"
+    assert "INPUT_GITHUB_TOKEN" not in os.environ
+
+
+def test_scrubbed_env(env_setup, monkeypatch):
+    monkeypatch.setenv("SSH_AUTH_SOCK", "/tmp/agent.sock")
+    os.environ["GH_TOKEN"] = "hi"
+    s = SensitiveEnv()
+    s.hide_env_vars()
+
+    with s.sensitive_env():
+        env = s.scrubbed_env()
+    assert "GH_TOKEN" not in env
+    assert "SSH_AUTH_SOCK" not in env
+    assert env["PATH"] == os.environ["PATH"]
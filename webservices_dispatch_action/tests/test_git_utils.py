@@ -0,0 +1,257 @@
+import fcntl
+import os
+import subprocess
+
+import git
+import pytest
+
+from webservices_dispatch_action import git_utils
+from webservices_dispatch_action.git_utils import (
+    MirrorCache,
+    check_mergeable,
+    clone_feedstock,
+    copy_recipes_subset,
+    disable_sparse_checkout,
+    ensure_history,
+    get_clone_options,
+    get_clone_strategy,
+    get_recipe_trees,
+    get_sparse_excluded_dirs,
+    is_shallow,
+    is_sparse,
+)
+
+
+def _git(*args, cwd):
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@test.test", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+@pytest.fixture
+def upstream_repo(tmp_path):
+    src = tmp_path / "upstream"
+    src.mkdir()
+    _git("init", "-b", "main", cwd=src)
+    _git("config", "uploadpack.allowFilter", "true", cwd=src)
+    _git("config", "uploadpack.allowAnySHA1InWant", "true", cwd=src)
+    os.makedirs(src / "recipe")
+    os.makedirs(src / "vendored")
+    with open(src / "vendored" / "big.bin", "w") as fp:
+        fp.write("0" * 1000)
+    with open(src / "conda-forge.yml", "w") as fp:
+        fp.write("{}\n")
+    for i in range(5):
+        with open(src / "recipe" / "meta.yaml", "w") as fp:
+            fp.write(f"version: {i}\n")
+        _git("add", ".", cwd=src)
+        _git("commit", "-m", f"commit {i}", cwd=src)
+    _git("tag", "v1", cwd=src)
+    return "file://" + str(src)
+
+
+@pytest.fixture
+def mirror_cache(upstream_repo, tmp_path, monkeypatch):
+    # every repo in the cache points at the upstream repo
+    cache = MirrorCache(
+        str(tmp_path / "cache"), max_size=1024**3, url_template=upstream_repo
+    )
+    monkeypatch.setattr(git_utils, "get_mirror_cache", lambda: cache)
+    yield cache
+    cache.release()
+
+
+def test_get_clone_options():
+    assert get_clone_options("full") == {}
+    assert get_clone_options("blobless") == {
+        "filter": "blob:none",
+        "single_branch": True,
+        "no_tags": True,
+    }
+    assert get_clone_options("shallow", depth=3)["depth"] == 3
+
+    with pytest.raises(ValueError):
+        get_clone_options("blah")
+
+
+def test_get_clone_strategy(monkeypatch):
+    monkeypatch.setenv("CF_WEBSERVICES_CLONE_STRATEGY", "Full")
+    assert get_clone_strategy() == "full"
+
+    monkeypatch.setenv("CF_WEBSERVICES_CLONE_STRATEGY", "blah")
+    with pytest.raises(ValueError):
+        get_clone_strategy()
+
+
+@pytest.mark.parametrize("strategy", ["full", "blobless", "shallow"])
+def test_clone_feedstock(upstream_repo, tmp_path, strategy):
+    git_repo = clone_feedstock(
+        upstream_repo, str(tmp_path / "clone"), "main", strategy=strategy, depth=1
+    )
+    with open(os.path.join(git_repo.working_dir, "recipe", "meta.yaml")) as fp:
+        assert fp.read() == "version: 4\n"
+    assert is_shallow(git_repo) == (strategy == "shallow")
+    assert bool(git_repo.tags) == (strategy == "full")
+
+
+def test_ensure_history_deepens(upstream_repo, tmp_path):
+    git_repo = clone_feedstock(
+        upstream_repo, str(tmp_path / "clone"), "main", strategy="shallow", depth=1
+    )
+    assert ensure_history(git_repo, "HEAD~3")
+    _git("checkout", "HEAD~3", "--", "recipe/meta.yaml", cwd=git_repo.working_dir)
+    with open(os.path.join(git_repo.working_dir, "recipe", "meta.yaml")) as fp:
+        assert fp.read() == "version: 1\n"
+
+    assert not ensure_history(git_repo, "HEAD~10")
+
+
+def test_clone_feedstock_mirror_cache(upstream_repo, tmp_path, monkeypatch):
+    # a fork of the upstream repo w/ a new commit on a PR branch
+    repos = tmp_path / "repos"
+    upstream = repos / "conda-forge" / "blah-feedstock"
+    fork = repos / "regro" / "blah-feedstock"
+    os.makedirs(repos / "conda-forge")
+    os.makedirs(repos / "regro")
+    _git("clone", "--bare", upstream_repo, str(upstream), cwd=tmp_path)
+    _git("clone", upstream_repo, str(fork), cwd=tmp_path)
+    _git("checkout", "-b", "pr", cwd=fork)
+    with open(fork / "recipe" / "meta.yaml", "w") as fp:
+        fp.write("version: pr\n")
+    _git("commit", "-am", "pr", cwd=fork)
+
+    cache = MirrorCache(
+        str(tmp_path / "cache"),
+        max_size=1024**3,
+        url_template="file://" + str(repos) + "/{repo}",
+    )
+    monkeypatch.setattr(git_utils, "get_mirror_cache", lambda: cache)
+
+    git_repo = clone_feedstock(
+        "file://" + str(fork),
+        str(tmp_path / "clone"),
+        "pr",
+        reference_repo="conda-forge/blah-feedstock",
+        fork_repos=["regro/blah-feedstock"],
+    )
+    with open(os.path.join(git_repo.git_dir, "objects", "info", "alternates")) as fp:
+        alternates = fp.read().splitlines()
+    assert alternates == [
+        os.path.join(cache._mirror_path("conda-forge/blah-feedstock"), "objects")
+    ]
+    with open(os.path.join(git_repo.working_dir, "recipe", "meta.yaml")) as fp:
+        assert fp.read() == "version: pr\n"
+
+    # there is one mirror w/ the fork branches in it
+    mirrors = os.listdir(os.path.join(cache.root, "mirrors"))
+    assert [m for m in mirrors if m.endswith(".git")] == [
+        "conda-forge__blah-feedstock.git"
+    ]
+    mirror = cache._mirror_path("conda-forge/blah-feedstock")
+    fork_ref = "refs/forks/regro/blah-feedstock/heads/pr"
+    _git("rev-parse", "--verify", fork_ref, cwd=mirror)
+
+    # fetching upstream again does not prune the fork branches
+    cache.update("conda-forge/blah-feedstock")
+    _git("rev-parse", "--verify", fork_ref, cwd=mirror)
+    cache.release()
+
+
+def test_mirror_cache_evict(upstream_repo, tmp_path):
+    cache = MirrorCache(str(tmp_path / "cache"), max_size=0, url_template=upstream_repo)
+    old = cache.update("a/old")
+    new = cache.update("a/new")
+    os.utime(old + ".used", (0, 0))
+
+    # mirrors in use are never evicted
+    other = MirrorCache(cache.root, max_size=0, url_template=upstream_repo)
+    other.acquire("a/old")
+    cache.evict()
+    assert os.path.exists(old)
+    assert not os.path.exists(new)
+
+    other.release()
+    cache.evict()
+    assert not os.path.exists(old)
+
+    # the lock files are still usable
+    fd = os.open(old + ".lock", os.O_RDWR)
+    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    os.close(fd)
+
+
+def test_clone_feedstock_sparse(upstream_repo, tmp_path):
+    git_repo = clone_feedstock(
+        upstream_repo,
+        str(tmp_path / "clone"),
+        "main",
+        sparse_paths=["recipe", "recipes"],
+    )
+    assert is_sparse(git_repo)
+    assert get_sparse_excluded_dirs(git_repo) == ["vendored"]
+    assert os.path.exists(os.path.join(git_repo.working_dir, "conda-forge.yml"))
+    assert os.path.exists(os.path.join(git_repo.working_dir, "recipe", "meta.yaml"))
+    assert not os.path.exists(os.path.join(git_repo.working_dir, "vendored"))
+
+    disable_sparse_checkout(git_repo)
+    assert not is_sparse(git_repo)
+    assert get_sparse_excluded_dirs(git_repo) == []
+    assert os.path.exists(os.path.join(git_repo.working_dir, "vendored", "big.bin"))
+
+
+@pytest.mark.parametrize("conflict", [False, True])
+def test_check_mergeable(upstream_repo, tmp_path, monkeypatch, conflict):
+    monkeypatch.setattr(git_utils, "MERGE_BASE_DEEPEN", 2)
+    src = upstream_repo[len("file://") :]
+
+    # the PR branch and the base branch both move on after the branch point
+    _git("checkout", "-b", "pr", cwd=src)
+    for i in range(4):
+        with open(os.path.join(src, "recipe", "meta.yaml"), "w") as fp:
+            fp.write(f"version: pr{i}\n")
+        _git("commit", "-am", f"pr {i}", cwd=src)
+    _git("checkout", "main", cwd=src)
+    fname = "meta.yaml" if conflict else "build.sh"
+    for i in range(4):
+        with open(os.path.join(src, "recipe", fname), "w") as fp:
+            fp.write(f"version: main{i}\n")
+        _git("add", ".", cwd=src)
+        _git("commit", "-m", f"main {i}", cwd=src)
+
+    git_repo = clone_feedstock(
+        upstream_repo, str(tmp_path / "feedstock"), "pr", strategy="shallow"
+    )
+    assert check_mergeable(git_repo, upstream_repo, "main") is not conflict
+    assert is_shallow(git_repo)
+
+
+def test_check_mergeable_cannot_fetch(upstream_repo, tmp_path):
+    git_repo = clone_feedstock(upstream_repo, str(tmp_path / "feedstock"), "main")
+    assert check_mergeable(git_repo, upstream_repo, "does-not-exist") is None
+
+
+def test_get_recipe_trees_and_copy_subset(tmp_path):
+    src = tmp_path / "staged-recipes"
+    for recipe in ["foo", "bar"]:
+        os.makedirs(src / "recipes" / recipe)
+        with open(src / "recipes" / recipe / "meta.yaml", "w") as fp:
+            fp.write(f"package: {{name: {recipe}}}\n")
+    with open(src / "conda-forge.yml", "w") as fp:
+        fp.write("{}\n")
+    _git("init", "-b", "main", cwd=src)
+    _git("add", ".", cwd=src)
+    _git("commit", "-m", "init", cwd=src)
+
+    git_repo = git.Repo(src)
+    trees = get_recipe_trees(git_repo)
+    assert sorted(trees) == ["recipes/bar", "recipes/foo"]
+    assert trees["recipes/foo"] != trees["recipes/bar"]
+    assert get_recipe_trees(git_repo, recipes_path="recipe") == {}
+
+    dest = copy_recipes_subset(git_repo, ["recipes/foo"], str(tmp_path / "subset"))
+    assert sorted(os.listdir(dest)) == ["conda-forge.yml", "recipes"]
+    assert os.listdir(os.path.join(dest, "recipes")) == ["foo"]
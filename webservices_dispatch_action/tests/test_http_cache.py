@@ -0,0 +1,115 @@
+import http.server
+import threading
+
+import pytest
+import requests
+
+from webservices_dispatch_action import global_sensitive_env
+from webservices_dispatch_action.api_sessions import (
+    _PooledHTTPAdapter,
+    get_credential_identity,
+)
+from webservices_dispatch_action.http_cache import HTTPCache
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    num_full = 0
+
+    def do_GET(self):
+        etag = '"%s"' % self.path
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("X-RateLimit-Remaining", "99")
+            self.end_headers()
+            return
+
+        _Handler.num_full += 1
+        body = ("body of %s" % self.path).encode("utf-8") * 100
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("X-RateLimit-Remaining", "100")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.num_full = 0
+    srv = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d" % srv.server_address[1]
+    srv.shutdown()
+    srv.server_close()
+
+
+def _session(cache):
+    sess = requests.Session()
+    sess.mount("http://", _PooledHTTPAdapter(cache=cache))
+    return sess
+
+
+def test_http_cache_revalidates(server, tmp_path):
+    cache = HTTPCache(str(tmp_path), max_size=10**6)
+    sess = _session(cache)
+
+    first = sess.get(server + "/a", headers={"Authorization": "token a"})
+    second = sess.get(server + "/a", headers={"Authorization": "token a"})
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert second.headers["X-RateLimit-Remaining"] == "99"
+    assert getattr(second, "from_cache", False)
+    assert _Handler.num_full == 1
+
+    # other credentials never see the cached response
+    sess.get(server + "/a", headers={"Authorization": "token b"})
+    assert _Handler.num_full == 2
+
+    # the cache is shared between processes through the disk
+    other = _session(HTTPCache(str(tmp_path), max_size=10**6))
+    assert other.get(server + "/a", headers={"Authorization": "token a"}).ok
+    assert _Handler.num_full == 2
+
+    assert cache.stats["hits"] == 1
+    assert cache.stats["misses"] == 2
+
+
+def test_http_cache_shared_across_tokens_of_actor(server, tmp_path, monkeypatch):
+    info = global_sensitive_env.classified_info
+    monkeypatch.setitem(info, "INPUT_GITHUB_TOKEN", "run-1")
+    sess = _session(
+        HTTPCache(str(tmp_path), max_size=10**6, identify=get_credential_identity)
+    )
+    first = sess.get(server + "/a", headers={"Authorization": "token run-1"})
+    assert _Handler.num_full == 1
+
+    # the next run gets a new token for the same bot
+    monkeypatch.setitem(info, "INPUT_GITHUB_TOKEN", "run-2")
+    cache = HTTPCache(str(tmp_path), max_size=10**6, identify=get_credential_identity)
+    second = _session(cache).get(
+        server + "/a", headers={"Authorization": "token run-2"}
+    )
+    assert getattr(second, "from_cache", False)
+    assert second.content == first.content
+    assert _Handler.num_full == 1
+    assert cache.stats["hits"] == 1
+
+    # unknown tokens are still kept apart
+    sess.get(server + "/a", headers={"Authorization": "token other"})
+    assert _Handler.num_full == 2
+
+
+def test_http_cache_evicts(server, tmp_path):
+    cache = HTTPCache(str(tmp_path), max_size=3000)
+    sess = _session(cache)
+    for path in ["/a", "/b", "/c"]:
+        sess.get(server + path)
+
+    assert cache.stats["evictions"] > 0
+    assert cache._size <= cache.max_size
+    assert len(list(tmp_path.glob("*.json"))) < 3
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+from webservices_dispatch_action.identity_map import IdentityMap
+
+
+class FakeRepo:
+    full_name = "conda-forge/Blah-feedstock"
+
+    def __init__(self):
+        self.calls = []
+
+    def get_pull(self, number):
+        self.calls.append(("pull", number))
+        return SimpleNamespace(number=number)
+
+    def get_commit(self, sha):
+        self.calls.append(("commit", sha))
+        return SimpleNamespace(sha=sha)
+
+
+class FakeGithub:
+    def __init__(self):
+        self.repo = FakeRepo()
+        self.calls = 0
+
+    def get_repo(self, name):
+        self.calls += 1
+        return self.repo
+
+
+def test_identity_map():
+    gh = FakeGithub()
+    objs = IdentityMap()
+
+    repo = objs.get_repo(gh, "conda-forge/blah-feedstock")
+    assert objs.get_repo(gh, "conda-forge/Blah-feedstock") is repo
+    assert gh.calls == 1
+
+    pr = objs.get_pull(repo, 5)
+    assert objs.get_pull(repo, "5") is pr
+    commit = objs.get_commit(repo, "abc")
+    assert objs.get_commit(repo, "abc") is commit
+    assert objs.get_commit(repo, "def") is not commit
+    assert repo.calls == [("pull", 5), ("commit", "abc"), ("commit", "def")]
+    assert objs.saved_calls == 3
+
+    objs.invalidate("pull", "conda-forge/blah-feedstock", 5)
+    assert objs.get_pull(repo, 5) is not pr
+    assert repo.calls[-1] == ("pull", 5)
+
+
+def test_identity_map_custom_fetch():
+    objs = IdentityMap()
+    repo = FakeRepo()
+    snapshot = SimpleNamespace(number=5)
+    assert objs.get_pull(repo, 5, fetch=lambda: snapshot) is snapshot
+    assert objs.get_pull(repo, 5) is snapshot
+    assert repo.calls == []
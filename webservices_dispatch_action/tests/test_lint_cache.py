@@ -0,0 +1,42 @@
+import os
+import time
+
+from webservices_dispatch_action.lint_cache import LintCache, get_lint_cache
+
+
+def test_lint_cache(tmp_path):
+    cache = LintCache(str(tmp_path), "conda-smithy 3.44.0", max_age=3600)
+    assert cache.get("recipes/foo", "abc") is None
+
+    lints = {"recipes/foo/meta.yaml": ["bad"]}
+    hints = {"recipes/foo/meta.yaml": []}
+    cache.put("recipes/foo", "abc", lints, hints)
+    assert cache.get("recipes/foo", "abc") == (lints, hints)
+    assert cache.get("recipes/foo", "def") is None
+    assert cache.get("recipes/bar", "abc") is None
+    assert cache.stats == {"hits": 1, "misses": 3}
+
+    # a new linter version does not see the old results
+    new_cache = LintCache(str(tmp_path), "conda-smithy 3.45.0", max_age=3600)
+    assert new_cache.get("recipes/foo", "abc") is None
+
+
+def test_lint_cache_expires(tmp_path):
+    cache = LintCache(str(tmp_path), "conda-smithy 3.44.0", max_age=3600)
+    cache.put("recipes/foo", "abc", {}, {})
+    (pth,) = os.listdir(tmp_path)
+    old = time.time() - 7200
+    os.utime(tmp_path / pth, (old, old))
+    assert cache.get("recipes/foo", "abc") is None
+
+    LintCache(str(tmp_path), "conda-smithy 3.44.0", max_age=3600)
+    assert os.listdir(tmp_path) == []
+
+
+def test_get_lint_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv("CF_WEBSERVICES_LINT_CACHE_DIR", raising=False)
+    assert get_lint_cache("conda-smithy 3.44.0") is None
+
+    monkeypatch.setenv("CF_WEBSERVICES_LINT_CACHE_DIR", str(tmp_path))
+    assert get_lint_cache(None) is None
+    assert get_lint_cache("conda-smithy 3.44.0").max_age == 24 * 3600
@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+
+import webservices_dispatch_action
+from webservices_dispatch_action.env_management import SensitiveEnv
+from webservices_dispatch_action.lint_worker import WarmWorkerPool, get_lint_jobs
+
+
+def test_warm_worker_pool_forks_fresh_children():
+    with WarmWorkerPool(preload_modules=["json", "not_a_module_blah"]) as pool:
+        pool.warm_up()
+        pids = [pool.run(os.getpid) for _ in range(3)]
+
+    assert os.getpid() not in pids
+    assert len(set(pids)) == 3
+
+
+def test_get_lint_jobs(monkeypatch):
+    monkeypatch.delenv("CF_WEBSERVICES_LINT_JOBS", raising=False)
+    assert get_lint_jobs() == (os.cpu_count() or 1)
+    monkeypatch.setenv("CF_WEBSERVICES_LINT_JOBS", "3")
+    assert get_lint_jobs() == 3
+    monkeypatch.setenv("CF_WEBSERVICES_LINT_JOBS", "0")
+    assert get_lint_jobs() == 1
+
+
+_ENVIRON_SCRIPT = """\
+import json
+import os
+import sys
+
+from webservices_dispatch_action import global_sensitive_env
+from webservices_dispatch_action.env_management import make_process_undumpable
+from webservices_dispatch_action.lint_worker import WarmWorkerPool
+
+
+def _read_environs(pid):
+    environs = {"os": "\\n".join("%s=%s" % kv for kv in os.environ.items())}
+    for name in ["self", str(pid), "1"]:
+        try:
+            with open("/proc/%s/environ" % name, "rb") as fp:
+                environs[name] = fp.read().decode("utf-8", errors="replace")
+        except OSError as e:
+            environs[name] = repr(e)
+    return environs
+
+
+if __name__ == "__main__":
+    global_sensitive_env.load_secrets_file(sys.argv[1])
+    make_process_undumpable()
+    with global_sensitive_env.sensitive_env(), WarmWorkerPool() as pool:
+        # the tokens are revealed while the fork server starts
+        environs = pool.run(_read_environs, os.getpid())
+    print(json.dumps(environs))
+"""
+
+
+def test_warm_worker_pool_children_never_see_the_tokens(tmp_path):
+    secrets_file = tmp_path / "secrets"
+    secrets_file.write_text("INPUT_GITHUB_TOKEN=sekrit-token\n")
+    script = tmp_path / "read_environs.py"
+    script.write_text(_ENVIRON_SCRIPT)
+    env = {k: v for k, v in os.environ.items() if k not in SensitiveEnv.SENSITIVE_KEYS}
+    env["SSH_AUTH_SOCK"] = "/tmp/ssh-agent.sock"
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(webservices_dispatch_action.__file__))]
+        + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else [])
+    )
+
+    ret = subprocess.run(
+        [sys.executable, str(script), str(secrets_file)],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    environs = json.loads(ret.stdout)
+    for name, environ in environs.items():
+        assert "sekrit-token" not in environ, name
+    assert "SSH_AUTH_SOCK" not in environs["os"]
+    assert not secrets_file.exists()
@@ -0,0 +1,196 @@
+import json
+import subprocess
+import time
+from types import SimpleNamespace
+
+import git
+import pytest
+
+from webservices_dispatch_action.linter import (
+    build_and_make_lint_comment,
+    get_lint_fingerprint,
+    get_previous_lint,
+    get_recipe_dirs_to_lint,
+)
+
+
+def _git(*args, cwd):
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@test.test", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+    )
+
+
+def _commit(src, fname, content):
+    pth = src / fname
+    pth.parent.mkdir(parents=True, exist_ok=True)
+    pth.write_text(content)
+    _git("add", fname, cwd=src)
+    _git("commit", "-m", "update " + fname, cwd=src)
+    return get_lint_fingerprint(git.Repo(src), "conda-smithy 3.44.0")
+
+
+def test_lint_fingerprint(tmp_path):
+    _git("init", "-b", "main", cwd=tmp_path)
+    fp = _commit(tmp_path, "recipe/meta.yaml", "package: {name: foo}\n")
+
+    assert _commit(tmp_path, "README.md", "foo\n") == fp
+    assert get_lint_fingerprint(git.Repo(tmp_path), "conda-smithy 3.45.0") != fp
+
+    new_fp = _commit(tmp_path, "recipe/meta.yaml", "package: {name: bar}\n")
+    assert new_fp != fp
+    newer_fp = _commit(tmp_path, "conda-forge.yml", "{}\n")
+    assert newer_fp != new_fp
+    assert _commit(tmp_path, ".ci_support/linux_64_.yaml", "{}\n") != newer_fp
+
+
+def test_get_previous_lint():
+    assert get_previous_lint(None) == (None, None)
+    assert get_previous_lint(SimpleNamespace(body="Hi! all good")) == (None, None)
+
+    def _body(**data):
+        return "Hi!\n<!-- conda-forge-linter: %s -->\n" % json.dumps(data)
+
+    body = _body(fingerprint="abc", status="good", time=time.time() - 60)
+    assert get_previous_lint(SimpleNamespace(body=body)) == ("abc", "good")
+    assert get_previous_lint(SimpleNamespace(body=body), max_age=30) == (None, None)
+
+    # old results and markers w/o a time are not reused
+    body = _body(fingerprint="abc", status="good", time=time.time() - 25 * 3600)
+    assert get_previous_lint(SimpleNamespace(body=body)) == (None, None)
+    body = _body(fingerprint="abc", status="good")
+    assert get_previous_lint(SimpleNamespace(body=body)) == (None, None)
+
+
+class _FakePR:
+    def find_comment(self, predicate, status_context=None):
+        return None
+
+    def create_issue_comment(self, body):
+        return SimpleNamespace(body=body)
+
+
+def test_build_and_make_lint_comment_is_deterministic():
+    repo = SimpleNamespace(name="foo-feedstock")
+    fnames = [f"recipes/r{i}/meta.yaml" for i in range(20)]
+    bodies = set()
+    for order in [fnames, fnames[::-1]]:
+        lints = {fname: [f"lint for {fname}"] for fname in order}
+        hints = {fname: [] for fname in order}
+        msg, status = build_and_make_lint_comment(
+            None, repo, 1, lints, hints, mergeable=True, snapshot=_FakePR()
+        )
+        assert status == "bad"
+        bodies.add(msg.body)
+
+    (body,) = bodies
+    assert body.index("recipes/r0/") < body.index("recipes/r1/")
+
+
+def test_lint_comment_records_fingerprint():
+    repo = SimpleNamespace(name="foo-feedstock")
+    msg, status = build_and_make_lint_comment(
+        None, repo, 1, {}, {}, mergeable=True, snapshot=_FakePR(), fingerprint="abc"
+    )
+    assert get_previous_lint(msg) == ("abc", status)
+
+
+def test_lint_comment_w_unknown_mergeable_is_not_reused():
+    repo = SimpleNamespace(name="foo-feedstock")
+    msg, status = build_and_make_lint_comment(
+        None,
+        repo,
+        1,
+        {"recipe/meta.yaml": ["blah"]},
+        {},
+        mergeable=None,
+        snapshot=_FakePR(),
+        fingerprint="abc",
+    )
+    assert status == "bad"
+    assert "blah" in msg.body
+    assert "merge conflict" not in msg.body
+    assert get_previous_lint(msg) == (None, None)
+
+
+def test_lint_comment_is_not_edited_only_for_the_time(monkeypatch):
+    edits = []
+
+    class _Comment:
+        body = "and found it was in an excellent condition."
+
+        def edit(self, body):
+            edits.append(body)
+            self.body = body
+
+    class _PR(_FakePR):
+        def find_comment(self, predicate, status_context=None):
+            return comment
+
+    comment = _Comment()
+    repo = SimpleNamespace(name="foo-feedstock")
+    # a good lint, like the old comment, so the comment is edited in place
+    for t in [1000, 2000]:
+        monkeypatch.setattr(time, "time", lambda: t)
+        build_and_make_lint_comment(
+            None,
+            repo,
+            1,
+            {},
+            {},
+            mergeable=True,
+            snapshot=_PR(),
+            fingerprint="abc",
+            has_recipes=True,
+        )
+    assert len(edits) == 1
+    assert '"time": 1000' in comment.body
+
+    build_and_make_lint_comment(
+        None,
+        repo,
+        1,
+        {},
+        {},
+        mergeable=True,
+        snapshot=_PR(),
+        fingerprint="def",
+        has_recipes=True,
+    )
+    assert len(edits) == 2
+
+
+def test_get_recipe_dirs_to_lint():
+    pr = SimpleNamespace(
+        get_files=lambda: [
+            SimpleNamespace(filename=fname)
+            for fname in [
+                "recipes/foo/meta.yaml",
+                "recipes/foo/build.sh",
+                "recipes/bar/recipe.yaml",
+                "recipes/baz/build.sh",
+                "recipes/example/meta.yaml",
+                "recipes/example-v1/recipe.yaml",
+                "README.md",
+            ]
+        ]
+    )
+    assert get_recipe_dirs_to_lint(pr) == ["recipes/bar", "recipes/foo"]
+
+
+@pytest.mark.parametrize("has_recipes,status", [(True, "good"), (None, "no recipes")])
+def test_build_and_make_lint_comment_has_recipes(has_recipes, status):
+    repo = SimpleNamespace(name="foo-feedstock")
+    _, _status = build_and_make_lint_comment(
+        None,
+        repo,
+        1,
+        {},
+        {},
+        mergeable=True,
+        snapshot=_FakePR(),
+        has_recipes=has_recipes,
+    )
+    assert _status == status
@@ -0,0 +1,271 @@
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from webservices_dispatch_action import linter, pr_snapshot
+from webservices_dispatch_action.identity_map import IdentityMap
+
+GREETING = "Hi! This is the friendly automated conda-forge-linting service."
+
+
+def _pr_data(comments, num_comments=None, has_next_page=False):
+    return {
+        "id": "PR_abc",
+        "number": 5,
+        "state": "OPEN",
+        "title": "blah",
+        "isDraft": True,
+        "mergeable": "UNKNOWN",
+        "author": {"login": "me"},
+        "headRefName": "my-branch",
+        "headRefOid": "sha1",
+        "headRepository": {"name": "blah-feedstock", "owner": {"login": "me"}},
+        "baseRefName": "main",
+        "files": {
+            "pageInfo": {"hasNextPage": has_next_page, "endCursor": "c1"},
+            "nodes": [{"path": "recipe/meta.yaml"}],
+        },
+        "comments": {
+            "totalCount": len(comments) if num_comments is None else num_comments,
+            "nodes": [
+                {"databaseId": i, "url": f"https://blah/{i}", "body": body}
+                for i, body in comments
+            ],
+        },
+        "commits": {
+            "nodes": [
+                {
+                    "commit": {
+                        "oid": "sha1",
+                        "status": {
+                            "contexts": [
+                                {
+                                    "context": "conda-forge-linter",
+                                    "state": "SUCCESS",
+                                    "targetUrl": "https://blah/1",
+                                    "description": "All recipes are excellent.",
+                                }
+                            ]
+                        },
+                    }
+                }
+            ]
+        },
+    }
+
+
+class FakeGitHub:
+    def __init__(self, pr_data, rest_comments=()):
+        self.pr_data = pr_data
+        self.rest_comments = list(rest_comments)
+        self.queries = []
+        self.writes = []
+        self.pages = []
+
+    def graphql(self, query, github_token, variables=None):
+        self.queries.append(variables)
+        if "cursor" in variables:
+            return {
+                "data": {
+                    "repository": {
+                        "pullRequest": {
+                            "files": {
+                                "pageInfo": {"hasNextPage": False, "endCursor": None},
+                                "nodes": [{"path": "README.md"}],
+                            }
+                        }
+                    }
+                }
+            }
+        return {"data": {"repository": {"pullRequest": self.pr_data}}}
+
+    def rest(self, method, path, github_token, json=None):
+        if method == "GET" and "/issues/comments/" in path:
+            self.pages.append(path)
+            comment_id = int(path.rsplit("/", 1)[1])
+            for c in self.rest_comments:
+                if c["id"] == comment_id:
+                    return {**c, "issue_url": c.get("issue_url", ".../issues/5")}
+            raise requests.HTTPError("404")
+        if method == "GET":
+            self.pages.append(path)
+            page = int(path.rsplit("=", 1)[1])
+            return self.rest_comments[(page - 1) * 100 : page * 100]
+        self.writes.append((method, path, json))
+        if path.endswith("/comments"):
+            return {"id": 99, "body": json["body"], "html_url": "https://blah/99"}
+
+
+@pytest.fixture
+def fake_github(monkeypatch):
+    def _make(*args, **kwargs):
+        fake = FakeGitHub(*args, **kwargs)
+        monkeypatch.setattr(pr_snapshot, "graphql", fake.graphql)
+        monkeypatch.setattr(pr_snapshot, "rest", fake.rest)
+        return fake
+
+    return _make
+
+
+REPO = SimpleNamespace(full_name="conda-forge/blah-feedstock", name="blah-feedstock")
+
+
+def test_fetch_pr_snapshot(fake_github):
+    fake = fake_github(_pr_data([(1, GREETING)], has_next_page=True))
+    pr = pr_snapshot.fetch_pr_snapshot(REPO, 5, "tok")
+
+    assert len(fake.queries) == 2
+    assert pr.state == "open"
+    assert pr.draft
+    assert pr.node_id == "PR_abc"
+    assert pr.mergeable is None
+    assert pr.head.ref == "my-branch"
+    assert pr.head.repo.owner.login == "me"
+    assert pr.base.repo is REPO
+    assert [f.filename for f in pr.get_files()] == ["recipe/meta.yaml", "README.md"]
+    assert pr.get_status("conda-forge-linter").state == "success"
+    assert not linter._is_mergeable(REPO, 5, snapshot=SimpleNamespace(state="closed"))
+
+
+def test_find_comment_falls_back_to_scan(fake_github):
+    rest_comments = [
+        {"id": i, "body": "not it", "html_url": f"https://blah/{i}"} for i in range(250)
+    ]
+    rest_comments[10]["body"] = GREETING + " old"
+    rest_comments[120]["body"] = GREETING + " new"
+    fake = fake_github(
+        _pr_data([(3, "not it")], num_comments=250), rest_comments=rest_comments
+    )
+    pr = pr_snapshot.fetch_pr_snapshot(REPO, 5, "tok")
+    comment = pr.find_comment(linter._is_lint_comment)
+    assert comment.id == 120
+    assert len(fake.pages) == 3
+
+    # the full list is kept for later lookups
+    assert pr.find_comment(linter._is_lint_comment) is comment
+    assert len(fake.pages) == 3
+
+
+def test_lint_comment_and_status_use_snapshot(fake_github):
+    fake = fake_github(_pr_data([(1, GREETING + "\nbad"), (2, "thanks!")]))
+    pr = pr_snapshot.fetch_pr_snapshot(REPO, 5, "tok")
+
+    # same state so the comment is edited in place
+    msg = linter.make_lint_comment(REPO, 5, GREETING + "\nworse", snapshot=pr)
+    assert msg.id == 1
+    assert fake.writes[-1][0] == "PATCH"
+    assert msg.body == GREETING + "\nworse"
+
+    # unchanged status is not written again
+    linter.set_pr_status(REPO, "sha1", "good", target_url="https://blah/1", snapshot=pr)
+    assert len(fake.writes) == 1
+
+    linter.set_pr_status(REPO, "sha1", "pending", snapshot=pr)
+    linter.set_pr_status(REPO, "sha1", "good", target_url="https://blah/1", snapshot=pr)
+    assert [w[2]["state"] for w in fake.writes[1:]] == ["pending", "success"]
+    assert pr.get_status("conda-forge-linter").state == "success"
+
+
+def test_lint_comment_w_snapshot_in_identity_map(fake_github, monkeypatch):
+    fake = fake_github(_pr_data([(1, GREETING + "\nbad"), (2, "thanks!")]))
+    pr = pr_snapshot.fetch_pr_snapshot(REPO, 5, "tok")
+    identity_map = IdentityMap()
+    identity_map.get_pull(REPO, 5, fetch=lambda: pr)
+    monkeypatch.setattr(linter, "RUN_IDENTITY_MAP", identity_map)
+
+    msg = linter.make_lint_comment(REPO, 5, GREETING + "\nworse")
+    assert msg.id == 1
+    assert fake.writes[-1][0] == "PATCH"
+
+    pr.mergeable = True
+    msg, status = linter.build_and_make_lint_comment(None, REPO, 5, {}, {})
+    assert status == "no recipes"
+    assert fake.writes[-1][0] == "POST"
+    assert pr.comments[-1] is msg
+
+
+def _with_status_pointer(data, comment_id):
+    data["commits"]["nodes"].insert(
+        0,
+        {
+            "commit": {
+                "oid": "sha0",
+                "status": {
+                    "contexts": [
+                        {
+                            "context": "conda-forge-linter",
+                            "state": "FAILURE",
+                            "targetUrl": "https://github.com/o/r/pull/5"
+                            f"#issuecomment-{comment_id}",
+                            "description": "Some recipes need some changes.",
+                        }
+                    ]
+                },
+            }
+        },
+    )
+    # no status on the head commit yet
+    data["commits"]["nodes"][1]["commit"]["status"] = None
+    return data
+
+
+@pytest.mark.parametrize(
+    "comment_id,issue_url,num_gets",
+    [
+        # the pointer is used directly
+        (120, ".../issues/5", 1),
+        # stale pointers fall back to the scan
+        (121, ".../issues/5", 4),
+        (120, ".../issues/6", 4),
+        (999, ".../issues/5", 4),
+    ],
+)
+def test_find_comment_from_status(fake_github, comment_id, issue_url, num_gets):
+    rest_comments = [
+        {"id": i, "body": "not it", "html_url": f"https://blah/{i}"} for i in range(250)
+    ]
+    rest_comments[120]["body"] = GREETING + " new"
+    rest_comments[120]["issue_url"] = issue_url
+    fake = fake_github(
+        _with_status_pointer(_pr_data([(3, "not it")], num_comments=250), comment_id),
+        rest_comments=rest_comments,
+    )
+    pr = pr_snapshot.fetch_pr_snapshot(REPO, 5, "tok")
+    assert pr.get_status("conda-forge-linter") is None
+
+    comment = pr.find_comment(
+        linter._is_lint_comment, status_context="conda-forge-linter"
+    )
+    assert comment.id == 120
+    assert len(fake.pages) == num_gets
+    pr.find_comment(linter._is_lint_comment, status_context="conda-forge-linter")
+    assert len(fake.pages) == num_gets
+
+
+def test_is_mergeable_bounded_poll(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(linter.time, "sleep", sleeps.append)
+    monkeypatch.setattr(linter, "check_mergeable", lambda *args: None)
+
+    class Repo:
+        full_name = REPO.full_name
+
+        def get_pull(self, pr_id):
+            return SimpleNamespace(state="open", mergeable=None)
+
+    snapshot = SimpleNamespace(
+        state="open",
+        mergeable=None,
+        repo_name=REPO.full_name,
+        base=SimpleNamespace(ref="main"),
+    )
+    assert linter._is_mergeable(Repo(), 5, snapshot=snapshot, git_repo=object()) is None
+    assert len(sleeps) == linter.MERGEABLE_POLL_ATTEMPTS
+    assert max(sleeps) == linter.MERGEABLE_POLL_MAX_DELAY
+
+    # the local check wins over polling
+    sleeps.clear()
+    monkeypatch.setattr(linter, "check_mergeable", lambda *args: False)
+    assert not linter._is_mergeable(Repo(), 5, snapshot=snapshot, git_repo=object())
+    assert sleeps == []
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from webservices_dispatch_action.stages import StageGraph
+
+
+def test_stage_graph_deps_and_concurrency():
+    started = threading.Barrier(2, timeout=5)
+
+    def _parallel(val):
+        # both stages have to be running at once to get past the barrier
+        started.wait()
+        return val
+
+    graph = StageGraph()
+    graph.add("a", lambda: _parallel(1))
+    graph.add("b", lambda: _parallel(2))
+    graph.add("c", lambda a, b: a + b, deps=["a", "b"])
+    results = graph.run()
+
+    assert results == {"a": 1, "b": 2, "c": 3}
+    assert graph.timings["c"][0] >= max(graph.timings["a"][1], graph.timings["b"][1])
+    assert graph.critical_path()[-1] == "c"
+
+
+def test_stage_graph_fails_fast():
+    release = threading.Event()
+    ran = []
+
+    def _slow():
+        release.wait(5)
+
+    graph = StageGraph()
+    graph.add("slow", _slow)
+    graph.add("bad", lambda: 1 / 0)
+    graph.add("after", lambda _: ran.append("after"), deps=["bad"])
+
+    t0 = time.perf_counter()
+    with pytest.raises(ZeroDivisionError):
+        graph.run()
+    assert time.perf_counter() - t0 < 4
+    assert graph.failed_stage == "bad"
+    assert ran == []
+
+    release.set()
+    graph.wait_for("slow")
+
+
+def test_stage_graph_waits_for_all_started_stages():
+    release = threading.Event()
+    done = []
+
+    def _slow():
+        release.wait(5)
+        done.append("slow")
+
+    graph = StageGraph()
+    graph.add("slow", _slow)
+    graph.add("bad", lambda: 1 / 0)
+    graph.add("after", lambda _: done.append("after"), deps=["bad"])
+    with pytest.raises(ZeroDivisionError):
+        graph.run()
+
+    threading.Timer(0.1, release.set).start()
+    graph.wait_for()
+    assert done == ["slow"]
+
+
+def test_stage_graph_bad_deps():
+    graph = StageGraph()
+    graph.add("a", lambda: None)
+    with pytest.raises(ValueError):
+        graph.add("a", lambda: None)
+    with pytest.raises(ValueError):
+        graph.add("b", lambda _: None, deps=["c"])
@@ -0,0 +1,104 @@
+import pytest
+
+from webservices_dispatch_action import write_buffer as wb
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    def _graphql(query, github_token, variables=None):
+        calls.append(("graphql", github_token, query, variables))
+        errors = [
+            {"message": "nope", "path": ["w%d" % i]}
+            for i, inputs in enumerate(variables.values())
+            if inputs.get("body") == "fail" or inputs.get("pullRequestId") == "BAD"
+        ]
+        if errors:
+            return {"data": {}, "errors": errors}
+        return {"data": {}}
+
+    monkeypatch.setattr(wb, "graphql", _graphql)
+    return calls
+
+
+def test_write_buffer_batches_mutations(calls):
+    with wb.GitHubWriteBuffer("tok") as buffer:
+        buffer.add_comment("PR_1", "hi")
+        buffer.update_pull_request("PR_1", title="blah")
+        buffer.mark_ready_for_review("PR_1", github_token="actor")
+        buffer.mark_ready_for_review("PR_2")
+        assert len(buffer) == 4
+        assert calls == []
+
+    assert [c[:2] for c in calls] == [
+        ("graphql", "tok"),
+        ("graphql", "actor"),
+    ]
+    query, variables = calls[0][2:]
+    assert query.index("w0: addComment") < query.index("w1: updatePullRequest")
+    assert "w2: markPullRequestReadyForReview" in query
+    assert variables == {
+        "w0": {"subjectId": "PR_1", "body": "hi"},
+        "w1": {"pullRequestId": "PR_1", "title": "blah"},
+        "w2": {"pullRequestId": "PR_2"},
+    }
+    assert len(buffer) == 0
+
+
+def test_write_buffer_flushes_on_error(calls):
+    with pytest.raises(ValueError):
+        with wb.GitHubWriteBuffer("tok") as buffer:
+            buffer.add_comment("PR_1", "error!")
+            raise ValueError("blah")
+    assert len(calls) == 1
+
+
+def test_write_buffer_keeps_error_if_flush_fails(calls):
+    with pytest.raises(ValueError):
+        with wb.GitHubWriteBuffer("tok") as buffer:
+            buffer.close_pull_request("BAD")
+            raise ValueError("blah")
+    assert len(calls) == 1
+
+
+def test_write_buffer_reports_failures(calls):
+    buffer = wb.GitHubWriteBuffer("tok")
+    buffer.close_pull_request("BAD")
+    buffer.add_comment("PR_1", "fail")
+    with pytest.raises(RuntimeError, match="2 GitHub writes failed"):
+        buffer.flush()
+
+
+def test_write_buffer_best_effort_failures_are_logged(calls, caplog):
+    with wb.GitHubWriteBuffer("tok") as buffer:
+        buffer.add_comment("PR_1", "hi")
+        buffer.update_pull_request("BAD", best_effort=True, title="blah")
+        buffer.mark_ready_for_review("BAD")
+
+    assert len(calls) == 1
+    assert "updatePullRequest for BAD failed (best effort)" in caplog.text
+    assert "markPullRequestReadyForReview for BAD failed (best effort)" in caplog.text
+
+
+def test_write_buffer_closes_after_the_comment(calls):
+    with wb.GitHubWriteBuffer("tok") as buffer:
+        buffer.add_comment("PR_1", "closing!")
+        buffer.close_pull_request("PR_1")
+
+    assert len(calls) == 2
+    assert "closePullRequest" not in calls[0][2]
+    assert "addComment" not in calls[1][2]
+    assert calls[1][3] == {"w0": {"pullRequestId": "PR_1"}}
+
+
+def test_write_buffer_does_not_close_if_the_comment_failed(calls):
+    with pytest.raises(RuntimeError, match="2 GitHub writes failed"):
+        with wb.GitHubWriteBuffer("tok") as buffer:
+            buffer.add_comment("PR_1", "fail")
+            buffer.close_pull_request("PR_1")
+            buffer.add_comment("PR_2", "closing!")
+            buffer.close_pull_request("PR_2")
+
+    assert len(calls) == 2
+    assert calls[1][3] == {"w0": {"pullRequestId": "PR_2"}}
@@ -2,10 +2,11 @@ import logging
 import os
 import sys
 
-import requests
 from git import GitCommandError
 
-from .api_sessions import get_actor_token
+from .api_sessions import get_actor_token, graphql
+from .identity_map import RUN_IDENTITY_MAP
+from .pr_snapshot import PRSnapshot
 
 LOGGER = logging.getLogger(__name__)
 
@@ -30,6 +31,7 @@ def comment_and_push_if_changed(
     close_pr_if_no_changes_or_errors,
     help_message,
     info_message,
+    write_buffer=None,
 ):
     actor, token, can_change_workflows = get_actor_token()
     LOGGER.info(
@@ -73,6 +75,12 @@ def comment_and_push_if_changed(
                     push=True,
                 )
             git_repo.remotes.origin.push()
+
+            # the push moved the head of the PR
+            if isinstance(pull, PRSnapshot):
+                pull.record_push(git_repo.head.commit.hexsha)
+            else:
+                RUN_IDENTITY_MAP.invalidate("pull", repo_name, pull.number)
         except GitCommandError as e:
             push_error = True
             LOGGER.critical(repr(e))
@@ -133,19 +141,31 @@ Hi! This is the friendly automated conda-forge-webservice.
                 f"GitHub actions workflow run [{run_link}]({run_link}).</sub>\n"
             )
 
-        pull.create_issue_comment(message)
+        if write_buffer is not None:
+            write_buffer.add_comment(pull.node_id, message)
+        else:
+            pull.create_issue_comment(message)
 
     if close_pr_if_no_changes_or_errors and not changed and not error:
-        pull.edit(state="closed")
+        if write_buffer is not None:
+            write_buffer.close_pull_request(pull.node_id)
+        else:
+            pull.edit(state="closed")
 
     return push_error
 
 
-def mark_pr_as_ready_for_review(pr):
+def mark_pr_as_ready_for_review(pr, write_buffer=None):
     # based on this post: https://github.com/orgs/community/discussions/70061
     if not pr.draft:
         return True
 
+    if write_buffer is not None:
+        write_buffer.mark_ready_for_review(
+            pr.node_id, github_token=get_actor_token()[1]
+        )
+        return True
+
     mutation = (
         """
         mutation {
@@ -157,14 +177,9 @@ def mark_pr_as_ready_for_review(pr):
         % pr.node_id
     )
 
-    headers = {"Authorization": f"bearer {get_actor_token()[1]}"}
-    req = requests.post(
-        "https://api.github.com/graphql",
-        json={"query": mutation},
-        headers=headers,
-    )
-    if "errors" in req.json():
-        LOGGER.error(req.json()["errors"])
+    data = graphql(mutation, get_actor_token()[1])
+    if "errors" in data:
+        LOGGER.error(data["errors"])
         return False
     else:
         return True
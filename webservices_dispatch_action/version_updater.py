@@ -2,10 +2,12 @@ import logging
 import os
 import pprint
 import subprocess
+import time
 
 import conda_forge_tick.update_recipe
 from conda.models.version import VersionOrder
 from conda_forge_tick.feedstock_parser import load_feedstock
+from conda_forge_tick.lazy_json_backends import dumps, loads
 from conda_forge_tick.update_recipe.version import update_version_feedstock_dir
 from conda_forge_tick.update_upstream_versions import (
     all_version_sources,
@@ -14,25 +16,92 @@ from conda_forge_tick.update_upstream_versions import (
 from conda_forge_tick.utils import setup_logging
 
 from . import sensitive_env
-from .api_sessions import create_api_sessions
+from .api_sessions import get_github_client
+from .docker_utils import UnknownContainerOpError, should_use_container
+from .identity_map import RUN_IDENTITY_MAP
 
 setup_logging()
 
 LOGGER = logging.getLogger(__name__)
 
 
-def update_version(
-    git_repo, repo_name, input_version=None
+def _run_op(session, op, kwargs, fallback):
+    try:
+        return session.run_op(op, kwargs, json_dumps=dumps, json_loads=loads)
+    except UnknownContainerOpError:
+        LOGGER.warning(
+            "container op %s is not in the image, running it w/o the session", op
+        )
+        return fallback()
+
+
+def _load_feedstock(name, session=None, use_container=True):
+    def _load():
+        return load_feedstock(name, {}, use_container=use_container)
+
+    if session is None:
+        return _load()
+    return _run_op(session, "load_feedstock", {"name": name}, _load)
+
+
+def _get_latest_version(name, attrs, session=None, use_container=True):
+    def _get():
+        return get_latest_version(
+            name,
+            attrs,
+            all_version_sources(),
+            use_container=use_container,
+        )
+
+    if session is None:
+        return _get()
+    return _run_op(session, "get_latest_version", {"name": name, "attrs": attrs}, _get)
+
+
+def _update_version_feedstock_dir(
+    feedstock_dir, version, session=None, use_container=True
+):
+    def _update():
+        updated, errors = update_version_feedstock_dir(
+            feedstock_dir,
+            version,
+            use_container=use_container,
+        )
+        return {"updated": updated, "errors": errors}
+
+    if session is None:
+        ret = _update()
+    else:
+        ret = _run_op(
+            session,
+            "update_version_feedstock_dir",
+            {
+                "feedstock_dir": session.container_path(feedstock_dir),
+                "version": version,
+            },
+            _update,
+        )
+    return ret["updated"], ret["errors"]
+
+
+def update_version_recipe(
+    feedstock_dir, name, input_version=None, session=None, use_container=True
 ) -> tuple[bool, bool, str | None]:
-    """
+    """Update the recipe in a feedstock to a new version w/o committing it.
+
+    This function runs on the host, where each step runs in a container (or in
+    `session` if given), or in the container as a single job via the
+    `update_version` container op.
+
     Returns [whether version changed, errors occurred, new version found]
     """
-    name = os.path.basename(repo_name).rsplit("-", 1)[0]
-    LOGGER.info("using feedstock name %s for repo %s", name, repo_name)
+    timings = {}
 
     try:
         LOGGER.info("computing feedstock attributes")
-        attrs = load_feedstock(name, {}, use_container=True)
+        t0 = time.perf_counter()
+        attrs = _load_feedstock(name, session=session, use_container=use_container)
+        timings["load_feedstock"] = time.perf_counter() - t0
         LOGGER.info("feedstock attrs:\n%s\n", pprint.pformat(attrs))
     except Exception:
         LOGGER.exception("error while computing feedstock attributes!")
@@ -41,12 +110,11 @@ def update_version(
     if input_version is None or input_version == "null":
         try:
             LOGGER.info("getting latest version")
-            new_version = get_latest_version(
-                name,
-                attrs,
-                all_version_sources(),
-                use_container=True,
+            t0 = time.perf_counter()
+            new_version = _get_latest_version(
+                name, attrs, session=session, use_container=use_container
             )
+            timings["get_latest_version"] = time.perf_counter() - t0
             new_version = new_version["new_version"]
             if new_version:
                 LOGGER.info(
@@ -79,33 +147,106 @@ def update_version(
         return False, False, new_version
 
     try:
-        updated, errors = update_version_feedstock_dir(
-            git_repo.working_dir,
+        t0 = time.perf_counter()
+        updated, errors = _update_version_feedstock_dir(
+            feedstock_dir,
             str(new_version),
-            use_container=True,
+            session=session,
+            use_container=use_container,
         )
+        timings["update_version_feedstock_dir"] = time.perf_counter() - t0
         if errors or (not updated):
             LOGGER.critical("errors when updating the recipe: %r", errors)
             raise RuntimeError("Error updating the recipe!")
 
         # no container used here since this is a pure text-based operation
         # with a regex
-        with open(os.path.join(git_repo.working_dir, "recipe", "meta.yaml")) as fp:
+        with open(os.path.join(feedstock_dir, "recipe", "meta.yaml")) as fp:
             new_meta_yaml = fp.read()
         new_meta_yaml = conda_forge_tick.update_recipe.update_build_number(
             new_meta_yaml,
             0,
         )
-        with open(os.path.join(git_repo.working_dir, "recipe", "meta.yaml"), "w") as fp:
+        with open(os.path.join(feedstock_dir, "recipe", "meta.yaml"), "w") as fp:
             fp.write(new_meta_yaml)
     except Exception:
         LOGGER.exception("error while updating the recipe!")
         return False, True, new_version
+    finally:
+        LOGGER.info(
+            "version update step timings: %s",
+            ", ".join(f"{k}={v:0.2f}s" for k, v in timings.items()),
+        )
 
-    try:
-        with open(os.path.join(git_repo.working_dir, "recipe", "meta.yaml"), "w") as fp:
-            fp.write(new_meta_yaml)
+    return True, False, new_version
+
+
+def use_single_version_update_job():
+    return os.environ.get("CF_WEBSERVICES_VERSION_UPDATE_SINGLE_JOB", "true") == "true"
+
+
+def update_version(
+    git_repo, repo_name, input_version=None, session=None, single_job=None
+) -> tuple[bool, bool, str | None]:
+    """
+    Returns [whether version changed, errors occurred, new version found]
+
+    If `session` is a `ContainerSession`, the containerized operations run in
+    it instead of in a new container each. If `single_job` is also true (the
+    default is set by `CF_WEBSERVICES_VERSION_UPDATE_SINGLE_JOB`), the whole
+    recipe update runs as one operation in the container. Either way, the
+    operations only change the session's copy of the feedstock w/o `.git`
+    and the new recipe is committed here.
+    """
+    name = os.path.basename(repo_name).rsplit("-", 1)[0]
+    LOGGER.info("using feedstock name %s for repo %s", name, repo_name)
+
+    if single_job is None:
+        single_job = use_single_version_update_job()
 
+    t0 = time.perf_counter()
+    if session is not None and single_job:
+        LOGGER.info("updating the version w/ a single container job")
+        try:
+            changed, errored, new_version = session.run_op(
+                "update_version",
+                {
+                    "feedstock_dir": session.container_path(git_repo.working_dir),
+                    "name": name,
+                    "input_version": input_version,
+                },
+                json_dumps=dumps,
+                json_loads=loads,
+            )
+        except UnknownContainerOpError:
+            LOGGER.warning(
+                "the container image cannot run the version update as one job, "
+                "running each step in the container instead"
+            )
+            single_job = False
+        except Exception:
+            LOGGER.exception("error while running the version update job!")
+            return False, True, None
+
+    if session is None or not single_job:
+        changed, errored, new_version = update_version_recipe(
+            git_repo.working_dir,
+            name,
+            input_version=input_version,
+            session=session,
+            use_container=should_use_container(),
+        )
+    LOGGER.info(
+        "version update for %s took %0.2f seconds (single job: %s)",
+        repo_name,
+        time.perf_counter() - t0,
+        session is not None and single_job,
+    )
+
+    if not changed:
+        return changed, errored, new_version
+
+    try:
         subprocess.run(
             ["git", "add", "recipe/meta.yaml"],
             cwd=git_repo.working_dir,
@@ -127,16 +268,20 @@ def update_version(
 
 
 def update_pr_title(
-    repo_name: str, pr_number: int, found_version: str
+    repo_name: str, pr_number: int, found_version: str, write_buffer=None
 ) -> tuple[bool, bool]:
     """
     Returns [whether title changed, errored]
+
+    If `write_buffer` is given, the edit is buffered in it as a best-effort
+    write instead and the title is reported as changed once it is queued. A
+    failed edit is logged when the buffer is flushed.
     """
     try:
         with sensitive_env():
-            _, gh = create_api_sessions(os.environ["INPUT_GITHUB_TOKEN"])
-        repo = gh.get_repo(repo_name)
-        pr = repo.get_pull(pr_number)
+            gh = get_github_client(os.environ["INPUT_GITHUB_TOKEN"])
+        repo = RUN_IDENTITY_MAP.get_repo(gh, repo_name)
+        pr = RUN_IDENTITY_MAP.get_pull(repo, pr_number)
     except Exception:
         LOGGER.exception(
             "error while trying to get PR title for %s#%s",
@@ -146,7 +291,14 @@ def update_pr_title(
         return False, True
     if pr.title == "ENH: update package version":  # user didn't change the default
         try:
-            pr.edit(title=f"{pr.title} to {found_version}")
+            if write_buffer is not None:
+                write_buffer.update_pull_request(
+                    pr.node_id,
+                    best_effort=True,
+                    title=f"{pr.title} to {found_version}",
+                )
+            else:
+                pr.edit(title=f"{pr.title} to {found_version}")
             return True, False
         except Exception:
             LOGGER.exception(
@@ -0,0 +1,176 @@
+import logging
+import time
+
+from .api_sessions import graphql
+
+LOGGER = logging.getLogger(__name__)
+
+# the GraphQL mutations we batch as (input type, result selection)
+_MUTATIONS = {
+    "addComment": ("AddCommentInput", "commentEdge { node { url } }"),
+    "updatePullRequest": ("UpdatePullRequestInput", "pullRequest { id }"),
+    "markPullRequestReadyForReview": (
+        "MarkPullRequestReadyForReviewInput",
+        "pullRequest { id isDraft }",
+    ),
+    "closePullRequest": ("ClosePullRequestInput", "pullRequest { id }"),
+}
+
+
+class GitHubWriteBuffer:
+    """Collects GitHub writes during a run and sends them together.
+
+    The GraphQL writes are sent as one mutation w/ one aliased field per
+    write. GitHub runs the fields of a mutation in order, so the writes land
+    in the order they were made. Closing a PR is sent afterwards in a
+    separate mutation and only if all comments on that PR were posted, so a
+    PR is never closed w/o the comment explaining why.
+
+    The buffer is flushed when the context exits, even on errors, so that
+    e.g. an error comment is still posted. Failed best-effort writes (e.g.,
+    marking a PR as ready for review) are only logged. Other failed writes
+    raise an error, unless an error is already propagating.
+
+    Writes that must be made w/ a different token (e.g., the actor token)
+    are sent as a separate mutation for that token.
+
+    Parameters
+    ----------
+    github_token : str
+        The default GitHub access token.
+    """
+
+    def __init__(self, github_token):
+        self._github_token = github_token
+        self._mutations = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.flush()
+        except Exception:
+            # the failed writes were logged by flush, so do not hide an
+            # error that is already propagating
+            if exc_type is None:
+                raise
+
+    def __len__(self):
+        return sum(len(m) for m in self._mutations.values())
+
+    def _add(self, mutation, github_token=None, best_effort=False, **inputs):
+        self._mutations.setdefault(github_token or self._github_token, []).append(
+            (mutation, inputs, best_effort)
+        )
+
+    def add_comment(self, subject_id, body):
+        self._add("addComment", subjectId=subject_id, body=body)
+
+    def update_pull_request(self, pr_id, best_effort=False, **fields):
+        self._add(
+            "updatePullRequest", best_effort=best_effort, pullRequestId=pr_id, **fields
+        )
+
+    def mark_ready_for_review(self, pr_id, github_token=None):
+        self._add(
+            "markPullRequestReadyForReview",
+            github_token=github_token,
+            best_effort=True,
+            pullRequestId=pr_id,
+        )
+
+    def close_pull_request(self, pr_id):
+        self._add("closePullRequest", pullRequestId=pr_id)
+
+    @staticmethod
+    def build_mutation(mutations):
+        """Build an aliased mutation and its variables from a list of
+        (mutation, inputs)."""
+        params = []
+        fields = []
+        variables = {}
+        for i, (mutation, inputs) in enumerate(mutations):
+            input_type, selection = _MUTATIONS[mutation]
+            params.append("$w%d: %s!" % (i, input_type))
+            fields.append("  w%d: %s(input: $w%d) { %s }" % (i, mutation, i, selection))
+            variables["w%d" % i] = inputs
+        query = "mutation(%s) {\n%s\n}" % (", ".join(params), "\n".join(fields))
+        return query, variables
+
+    def _send(self, github_token, writes):
+        """Send writes as one mutation, returning the errors of each write."""
+        errors = [[] for _ in writes]
+        if not writes:
+            return errors
+
+        query, variables = self.build_mutation([w[:2] for w in writes])
+        try:
+            data = graphql(query, github_token, variables=variables)
+        except Exception as e:
+            return [[repr(e)] for _ in writes]
+
+        aliases = {"w%d" % i: i for i in range(len(writes))}
+        for error in data.get("errors", []):
+            path = error.get("path") or [None]
+            if path[0] in aliases:
+                errors[aliases[path[0]]].append(error)
+            else:
+                # the whole mutation failed
+                for _errors in errors:
+                    _errors.append(error)
+        return errors
+
+    def flush(self):
+        """Send all buffered writes.
+
+        All writes are attempted, except closing a PR whose comment failed.
+        Failed writes are logged and a RuntimeError is raised afterwards if
+        any of them were not best-effort writes.
+        """
+        if not len(self):
+            return
+
+        t0 = time.perf_counter()
+        num_writes = len(self)
+        failed = []
+
+        all_mutations, self._mutations = self._mutations, {}
+        for github_token, mutations in all_mutations.items():
+            writes = [w for w in mutations if w[0] != "closePullRequest"]
+            closes = [w for w in mutations if w[0] == "closePullRequest"]
+
+            failed_comments = set()
+            for write, errors in zip(writes, self._send(github_token, writes)):
+                if errors:
+                    failed.append((write, errors))
+                    if write[0] == "addComment":
+                        failed_comments.add(write[1]["subjectId"])
+
+            to_close = []
+            for write in closes:
+                if write[1]["pullRequestId"] in failed_comments:
+                    failed.append((write, ["not closed since the comment failed"]))
+                else:
+                    to_close.append(write)
+            for write, errors in zip(to_close, self._send(github_token, to_close)):
+                if errors:
+                    failed.append((write, errors))
+
+        LOGGER.info(
+            "flushed %d GitHub writes in %0.2f seconds",
+            num_writes,
+            time.perf_counter() - t0,
+        )
+        num_required = 0
+        for (mutation, inputs, best_effort), errors in failed:
+            LOGGER.error(
+                "GitHub write %s for %s failed%s: %s",
+                mutation,
+                inputs.get("pullRequestId", inputs.get("subjectId")),
+                " (best effort)" if best_effort else "",
+                errors,
+            )
+            num_required += not best_effort
+        if num_required:
+            raise RuntimeError("%d GitHub writes failed!" % num_required)